@@ -0,0 +1,283 @@
+'''
+Daily limit and fee analytics
+Loads request and completion events of a day range from the local event index (see
+bridge_index.py) into NumPy arrays and computes, per chain and day, spent and executed
+volume, fee revenue and headroom against the current limits, plus the distribution of
+transfer sizes. Totals are cross-checked with totalSpentPerDay / totalExecutedPerDay
+of the bridges, where they are kept.
+    spent: UserRequestForSignature on home, token Transfer to the bridge on foreign
+    executed: AffirmationCompleted on home, RelayedMessage on foreign
+Fees use the current fee percent, past changes of it are not known to the index.
+'''
+
+import argparse
+import json
+import logging
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from example.python.contracts import Bridge, Multicall, W3Helper
+from example.python.utils.bridge import SECONDS_PER_DAY, add_config_args, config_from_args
+from example.python.utils.index import DB_PATH, EventIndex
+
+LOG = logging.getLogger(__name__)
+
+CHAINS = ('home', 'foreign')
+# (event name, whether only events with the bridge as recipient count) per chain
+SPENT_EVENTS = {'home': ('UserRequestForSignature', False), 'foreign': ('Transfer', True)}
+EXECUTED_EVENTS = {'home': ('AffirmationCompleted', False), 'foreign': ('RelayedMessage', False)}
+# Daily totals kept by the bridges, foreign ErcToErc bridges never set totalSpentPerDay
+CHECKED_TOTALS = {'home': ('spent', 'executed'), 'foreign': ('executed',)}
+FULL_PERCENT = 10000
+PERCENTILES = (50, 90, 99, 100)
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("numpy is required by bridge_analytics: pip3 install numpy")
+
+
+def _event_filter(chain, name, first_day, last_day, recipient=None):
+    sql = ' FROM events WHERE chain = ? AND name = ? AND day BETWEEN ? AND ?'
+    params = [chain, name, first_day, last_day]
+    if recipient:
+        sql += ' AND recipient = ?'
+        params.append(recipient.lower())
+    return sql, params
+
+
+class EventArrays:
+    '''Day numbers (int64) and values in token units (float64) of one event stream'''
+    __slots__ = ('days', 'values')
+
+    def __init__(self, days, values):
+        self.days = days
+        self.values = values
+
+    def __len__(self):
+        return len(self.days)
+
+    # pylint: disable=too-many-arguments
+    @classmethod
+    def load(cls, index, chain, name, first_day, last_day, decimals, recipient=None):
+        '''Events named name of chain in [first_day, last_day] from EventIndex index'''
+        _require_numpy()
+        sql, params = _event_filter(chain, name, first_day, last_day, recipient)
+        rows = index.conn.execute('SELECT day, value' + sql, params).fetchall()
+        scale = 10 ** decimals
+        days = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        values = np.fromiter((int(row[1]) / scale for row in rows), dtype=np.float64,
+                             count=len(rows))
+        return cls(days, values)
+
+
+def exact_daily_totals(index, chain, name, first_day, last_day, recipient=None):
+    '''{day: exact total in token base units} of events named name'''
+    sql, params = _event_filter(chain, name, first_day, last_day, recipient)
+    rows = index.conn.execute('SELECT day, bigsum(value)' + sql + ' GROUP BY day', params)
+    return {day: int(total) for day, total in rows}
+
+
+class ChainAnalytics:
+    '''
+    Per day vectors of one chain over days (first_day + arange), volumes in token units.
+    limits: daily_limit, exec_daily_limit, min_per_tx, max_per_tx in token units and
+    fee_percent (of FULL_PERCENT), as returned by limits_of().
+    '''
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, chain, first_day, last_day, spent, executed, limits):
+        _require_numpy()
+        self.chain = chain
+        self.first_day = first_day
+        self.days = np.arange(first_day, last_day + 1, dtype=np.int64)
+        self.spent = spent
+        self.executed = executed
+        self.limits = limits
+        size = len(self.days)
+        self.spent_volume = np.bincount(spent.days - first_day, weights=spent.values,
+                                        minlength=size)
+        self.spent_count = np.bincount(spent.days - first_day, minlength=size)
+        self.executed_volume = np.bincount(executed.days - first_day, weights=executed.values,
+                                           minlength=size)
+        self.executed_count = np.bincount(executed.days - first_day, minlength=size)
+        self.fees = self.executed_volume * (limits['fee_percent'] or 0) / FULL_PERCENT
+        self.spent_headroom = limits['daily_limit'] - self.spent_volume
+        self.executed_headroom = limits['exec_daily_limit'] - self.executed_volume
+
+    def days_over(self, limits, executed=False):
+        '''Number of days whose volume exceeds each of candidate limits'''
+        volume = self.executed_volume if executed else self.spent_volume
+        limits = np.asarray(limits, dtype=np.float64)
+        return (volume[np.newaxis, :] > limits[:, np.newaxis]).sum(axis=1)
+
+    def size_distribution(self, percentiles=PERCENTILES):
+        '''Percentiles of request sizes, and shares of requests at the per tx limits'''
+        values = self.spent.values
+        if not len(values):
+            return {'count': 0}
+        ret = {'count': int(len(values))}
+        for pct, value in zip(percentiles, np.percentile(values, percentiles)):
+            ret['p%s' % pct] = float(value)
+        if self.limits['max_per_tx']:
+            ret['at_max_per_tx'] = float(np.mean(values >= self.limits['max_per_tx'] * 0.99))
+        if self.limits['min_per_tx']:
+            ret['at_min_per_tx'] = float(np.mean(values <= self.limits['min_per_tx'] * 1.01))
+        return ret
+
+    def summary(self):
+        '''Totals and peaks over the range'''
+        daily_limit = self.limits['daily_limit']
+        return {
+            'days': int(len(self.days)),
+            'requests': int(self.spent_count.sum()),
+            'spent': float(self.spent_volume.sum()),
+            'executed': float(self.executed_volume.sum()),
+            'fees': float(self.fees.sum()),
+            'spent_peak': float(self.spent_volume.max()) if len(self.days) else 0,
+            'spent_p95': float(np.percentile(self.spent_volume, 95)) if len(self.days) else 0,
+            'executed_peak': (float(self.executed_volume.max()) if len(self.days) else 0),
+            'min_spent_headroom': (float(self.spent_headroom.min()) if len(self.days) else 0),
+            'min_executed_headroom': (float(self.executed_headroom.min())
+                                      if len(self.days) else 0),
+            'days_over_90pct_limit': int(self.days_over([daily_limit * 0.9])[0]),
+            'sizes': self.size_distribution(),
+        }
+
+    def daily(self):
+        '''Per day rows'''
+        return [{
+            'day': time.strftime('%Y-%m-%d', time.gmtime(int(day) * SECONDS_PER_DAY)),
+            'requests': int(requests),
+            'spent': float(spent),
+            'executed': float(executed),
+            'fees': float(fees),
+            'spent_headroom': float(headroom),
+        } for day, requests, spent, executed, fees, headroom in zip(
+            self.days, self.spent_count, self.spent_volume, self.executed_volume, self.fees,
+            self.spent_headroom)]
+
+
+def limits_of(bridge, decimals):
+    '''Current limits of bridge in token units, and fee percent'''
+    snapshot = bridge.snapshot()
+    scale = 10 ** decimals
+    limits = {name: (snapshot[name] or 0) / scale
+              for name in ('daily_limit', 'exec_daily_limit', 'min_per_tx', 'max_per_tx')}
+    limits['fee_percent'] = snapshot['fee_percent'] or 0
+    return limits
+
+
+def analyze(index, chain, bridge, first_day, last_day, decimals):
+    '''ChainAnalytics of bridge on chain from events in index'''
+    recipient = bridge.contract_addr
+    name, to_bridge = SPENT_EVENTS[chain]
+    spent = EventArrays.load(index, chain, name, first_day, last_day, decimals,
+                             recipient if to_bridge else None)
+    name, to_bridge = EXECUTED_EVENTS[chain]
+    executed = EventArrays.load(index, chain, name, first_day, last_day, decimals,
+                                recipient if to_bridge else None)
+    return ChainAnalytics(chain, first_day, last_day, spent, executed,
+                          limits_of(bridge, decimals))
+
+
+def cross_check(index, chain, bridge, first_day, last_day):
+    '''
+    Compare exact indexed totals with totalSpentPerDay / totalExecutedPerDay of bridge,
+    with one batch of calls for all days. Only totals the bridge keeps are compared (see
+    CHECKED_TOTALS), and a total which is 0 on every day while events were indexed is
+    taken as not kept by this bridge version and skipped.
+    :returns: [(day, 'spent' or 'executed', indexed total, contract total), ...] mismatches
+    '''
+    days = range(first_day, last_day + 1)
+    mismatches = []
+    for kind in CHECKED_TOTALS[chain]:
+        name, to_bridge = (SPENT_EVENTS if kind == 'spent' else EXECUTED_EVENTS)[chain]
+        getter = bridge.total_spent_per_day if kind == 'spent' else bridge.total_exec_per_day
+        multicall = Multicall(bridge.w3h)
+        for day in days:
+            multicall.add(getter, day)
+        contract_totals = multicall.execute()
+        indexed_totals = exact_daily_totals(index, chain, name, first_day, last_day,
+                                            bridge.contract_addr if to_bridge else None)
+        if any(indexed_totals.values()) and not any(contract_totals):
+            LOG.info("%s bridge does not keep %s totals per day, not checked", chain, kind)
+            continue
+        for day, contract_total in zip(days, contract_totals):
+            indexed = indexed_totals.get(day, 0)
+            if contract_total is not None and contract_total != indexed:
+                mismatches.append((day, kind, indexed, contract_total))
+    return mismatches
+
+
+def setup_parser():
+    '''CLI parameters'''
+    parser = argparse.ArgumentParser(description='Daily limit and fee analytics')
+    parser.add_argument('--db', default=DB_PATH, help='SQLite file of bridge_index.py')
+    parser.add_argument('--sync', action='store_true', help='Index new events first')
+    add_config_args(parser)
+    parser.add_argument('--days', type=int, default=365, help='Days up to today')
+    parser.add_argument('--limits', help='Candidate daily limits, comma separated token units')
+    parser.add_argument('--no-check', action='store_true',
+                        help='Skip cross-check with totals of the contracts')
+    parser.add_argument('--json', help='Save report with daily rows as JSON in this file')
+    parser.add_argument('-d', default='INFO', help='Log level: INFO, DEBUG')
+    return parser
+
+
+def main(argv=None):
+    '''Entry, exits with 1 if indexed totals differ from the contracts'''
+    args = setup_parser().parse_args(argv)
+    logging.basicConfig(level=args.d, format='%(asctime)s %(levelname)-6s %(message)s')
+    _require_numpy()
+
+    config = config_from_args(args)
+    bridges = {
+        'home': Bridge(W3Helper(config['h_rpc']), config['h_bridge']),
+        'foreign': Bridge(W3Helper(config['f_rpc']), config['f_bridge']),
+    }
+    last_day = int(time.time()) // SECONDS_PER_DAY
+    first_day = last_day - args.days + 1
+    candidates = [float(limit) for limit in args.limits.split(',')] if args.limits else []
+
+    report = {}
+    mismatches = []
+    with EventIndex(args.db) as index:
+        if args.sync:
+            for chain in CHAINS:
+                index.sync_bridge(chain, bridges[chain])
+        for chain in CHAINS:
+            bridge = bridges[chain]
+            decimals = bridge.contracts()[1].decimals()
+            started = time.time()
+            analytics = analyze(index, chain, bridge, first_day, last_day, decimals)
+            summary = analytics.summary()
+            LOG.info("%s: %s requests in %s days, analyzed in %.2fs", chain,
+                     summary['requests'], summary['days'], time.time() - started)
+            for key, value in sorted(summary.items()):
+                LOG.info("%s %s = %s", chain, key, value)
+            if candidates:
+                for limit, days in zip(candidates, analytics.days_over(candidates)):
+                    LOG.info("%s daily limit %s would be exceeded on %s days", chain, limit,
+                             days)
+            report[chain] = {'limits': analytics.limits, 'summary': summary,
+                             'daily': analytics.daily()}
+            if not args.no_check:
+                for day, kind, indexed, contract in cross_check(index, chain, bridge,
+                                                                first_day, last_day):
+                    LOG.warning("%s day %s %s: indexed %s, contract %s",
+                                chain, day, kind, indexed, contract)
+                    mismatches.append((chain, day, kind, indexed, contract))
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=2)
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
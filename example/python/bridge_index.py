@@ -0,0 +1,85 @@
+'''
+Local SQLite index of bridge events
+sync scans the events of both bridges, and token Transfers from / to the bridges, into
+a SQLite database; each chunk of logs is inserted with the scan checkpoint in one
+transaction, so an interrupted sync resumes where it stopped. Investigations then query
+the database instead of scanning the chain again:
+    $ python3 bridge_index.py sync --token usdt --h-from 1000000 --f-from 9000000
+    $ python3 bridge_index.py transfers 0xabc...
+    $ python3 bridge_index.py daily --name AffirmationCompleted
+'''
+
+import argparse
+import json
+import logging
+import sys
+
+from example.python.contracts import Bridge, W3Helper
+from example.python.utils.bridge import add_config_args, config_from_args
+from example.python.utils.index import DB_PATH, EventIndex
+
+LOG = logging.getLogger(__name__)
+
+
+def _print_rows(rows):
+    for row in rows:
+        print(json.dumps(dict(row)))
+
+
+def setup_parser():
+    '''CLI parameters'''
+    parser = argparse.ArgumentParser(description='Local SQLite index of bridge events')
+    parser.add_argument('--db', default=DB_PATH, help='SQLite file')
+    parser.add_argument('-d', default='INFO', help='Log level: INFO, DEBUG')
+    commands = parser.add_subparsers(dest='command')
+
+    sync = commands.add_parser('sync', help='Index new events of both bridges')
+    add_config_args(sync)
+    sync.add_argument('--h-from', type=int, default=0, help='First home block of a new index')
+    sync.add_argument('--f-from', type=int, default=0,
+                      help='First foreign block of a new index')
+
+    transfers = commands.add_parser('transfers', help='Events sent or received by address')
+    transfers.add_argument('address')
+    transfers.add_argument('--chain', choices=('home', 'foreign'))
+    transfers.add_argument('--limit', type=int)
+
+    tx_hash = commands.add_parser('tx', help='Events of a tx and events referring to it')
+    tx_hash.add_argument('tx_hash')
+
+    daily = commands.add_parser('daily', help='Per day count and total value')
+    daily.add_argument('--name', default='Transfer', help='Event name')
+    daily.add_argument('--chain', choices=('home', 'foreign'))
+    daily.add_argument('--address', help='Only events sent or received by address')
+    return parser
+
+
+def main(argv=None):
+    '''Entry'''
+    parser = setup_parser()
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.d, format='%(asctime)s %(levelname)-6s %(message)s')
+    if not args.command:
+        parser.print_help()
+        return 1
+
+    with EventIndex(args.db) as index:
+        if args.command == 'sync':
+            config = config_from_args(args)
+            count = index.sync_bridge('home', Bridge(W3Helper(config['h_rpc']),
+                                                     config['h_bridge']), args.h_from)
+            count += index.sync_bridge('foreign', Bridge(W3Helper(config['f_rpc']),
+                                                         config['f_bridge']), args.f_from)
+            LOG.info("Indexed %s events in %s", count, args.db)
+        elif args.command == 'transfers':
+            _print_rows(index.transfers(args.address, args.chain, args.limit))
+        elif args.command == 'tx':
+            _print_rows(index.by_tx(args.tx_hash))
+        elif args.command == 'daily':
+            for day, count, total in index.daily_totals(args.name, args.chain, args.address):
+                print('%s %8s %s' % (W3Helper.convert_unix_timestamp(day)[:10], count, total))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,243 @@
+'''
+Bridge load generator
+Sends token transfers over the bridge from many wallets, at a target rate or with a
+fixed number of transfers in flight, and reports throughput and end-to-end latency
+(source transaction sent -> tokens received on the other side) per direction.
+
+Each wallet has at most one transfer in flight, which is complete once the destination
+bridge emits its event (see TransferTracker).
+'''
+
+import argparse
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+import time
+from concurrent import futures
+from hexbytes import HexBytes
+
+from example.python.contracts import Bridge, TransferTracker, W3Helper
+from example.python.utils.bridge import (DIRECTIONS, F2H, H2F, add_config_args,
+                                         config_from_args, percentile)
+
+LOG = logging.getLogger(__name__)
+
+class Wallet:
+    '''Private key and address, used on both chains'''
+    __slots__ = ('key', 'address')
+
+    def __init__(self, key, address):
+        self.key = key
+        self.address = address
+
+
+class TransferResult:
+    '''Outcome of one transfer, latency in seconds from sending to the destination event'''
+    __slots__ = ('direction', 'wallet', 'tx_hash', 'sent_at', 'latency', 'error')
+
+    def __init__(self, direction, wallet, sent_at):
+        self.direction = direction
+        self.wallet = wallet
+        self.tx_hash = None
+        self.sent_at = sent_at
+        self.latency = None
+        self.error = None
+
+
+class LoadReport:
+    '''Throughput and latency percentiles per direction'''
+
+    def __init__(self, results, elapsed):
+        self.results = results
+        self.elapsed = elapsed
+
+    def stats(self, direction):
+        '''Stats of one direction as dict'''
+        results = [res for res in self.results if res.direction == direction]
+        latencies = sorted(res.latency for res in results if res.latency is not None)
+        return {
+            'sent': len(results),
+            'completed': len(latencies),
+            'failed': len([res for res in results if res.error is not None]),
+            'throughput': len(latencies) / self.elapsed if self.elapsed else 0,
+            'latency_p50': percentile(latencies, 50),
+            'latency_p95': percentile(latencies, 95),
+            'latency_p99': percentile(latencies, 99),
+            'latency_max': latencies[-1] if latencies else None,
+        }
+
+    def as_dict(self):
+        '''Stats of all directions'''
+        ret = {direction: self.stats(direction) for direction in DIRECTIONS}
+        ret['elapsed'] = self.elapsed
+        return ret
+
+    def lines(self):
+        '''Human readable report'''
+        def _sec(value):
+            return '-' if value is None else '%.1fs' % value
+        lines = ['Elapsed %.1fs' % self.elapsed]
+        for direction in DIRECTIONS:
+            stats = self.stats(direction)
+            if not stats['sent']:
+                continue
+            lines.append('%s sent=%s completed=%s failed=%s throughput=%.3f/s '
+                         'p50=%s p95=%s p99=%s max=%s'
+                         % (direction, stats['sent'], stats['completed'], stats['failed'],
+                            stats['throughput'], _sec(stats['latency_p50']),
+                            _sec(stats['latency_p95']), _sec(stats['latency_p99']),
+                            _sec(stats['latency_max'])))
+        return lines
+
+
+class LoadGenerator:
+    '''
+    Drive transfers between the home bridge (ERC677 token) and the foreign bridge (ERC20).
+    rate: transfers started per second (open loop), bounded by free wallets.
+    concurrency: transfers in flight (closed loop), defaults to the number of wallets.
+    h2f_ratio: share of H->F transfers, the rest is F->H.
+    '''
+    # pylint: disable=too-many-arguments
+    def __init__(self, bridge_h, bridge_f, wallets, amount, h2f_ratio=0.5, rate=None,
+                 concurrency=None, timeout=300, seed=None):
+        self.bridge_h = bridge_h
+        self.bridge_f = bridge_f
+        self.token_h = bridge_h.erc677()
+        self.token_f = bridge_f.erc20()
+        # A fixed amount sent to the bridge costs the same gas for every wallet
+        self.token_h.w3h.gas_estimates.cache_method(self.token_h.transfer_call.signature)
+        self.token_f.w3h.gas_estimates.cache_method(self.token_f.transfer.signature)
+        self.wallets = wallets
+        self.amount = amount
+        self.h2f_ratio = h2f_ratio
+        self.rate = rate
+        self.concurrency = min(concurrency or len(wallets), len(wallets))
+        self.timeout = timeout
+        self.random = random.Random(seed)
+        self.trackers = {
+            H2F: TransferTracker.home_to_foreign(bridge_f),
+            F2H: TransferTracker.foreign_to_home(bridge_h),
+        }
+        self._lock = threading.Lock()
+        self.results = []
+
+    def _send(self, direction, wallet):
+        if direction == H2F:
+            extra_data = HexBytes.fromhex('000000000000000000000000%s' % wallet.address[2:])
+            return self.token_h.transfer_call(wallet.key, self.bridge_h.contract_addr,
+                                              self.amount, bytes(extra_data))
+        extra_data = '0x000000000000000000000000%s' % wallet.address[2:]
+        return self.token_f.transfer(wallet.key, self.bridge_f.contract_addr,
+                                     self.amount, extra_data)
+
+    def transfer(self, direction, wallet):
+        '''Run one transfer, returns TransferResult'''
+        tracker = self.trackers[direction]
+        result = TransferResult(direction, wallet, time.time())
+        try:
+            from_block = tracker.head()
+            result.sent_at = time.time()
+            receipt = self._send(direction, wallet)
+            result.tx_hash = receipt['transactionHash']
+            if not receipt['status']:
+                raise RuntimeError("Transfer %s reverted" % result.tx_hash.hex())
+            remaining = max(0, result.sent_at + self.timeout - time.time())
+            completion = tracker.wait(result.tx_hash, remaining, result.sent_at, from_block)
+            result.latency = completion.latency
+        except Exception as err: # pylint: disable=broad-except
+            LOG.warning("%s transfer of %s failed: %s", direction, wallet.address, err)
+            result.error = err
+        return result
+
+    def _run_one(self, direction, wallet, free_wallets):
+        try:
+            result = self.transfer(direction, wallet)
+            with self._lock:
+                self.results.append(result)
+        finally:
+            free_wallets.put(wallet)
+
+    def run(self, duration):
+        '''Start transfers for duration seconds, wait for them and return LoadReport'''
+        free_wallets = queue.Queue()
+        for wallet in self.wallets[:self.concurrency]:
+            free_wallets.put(wallet)
+        start = time.time()
+        deadline = start + duration
+        started = 0
+        with futures.ThreadPoolExecutor(self.concurrency) as pool:
+            while True:
+                if self.rate:
+                    time.sleep(max(0, start + started / self.rate - time.time()))
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    wallet = free_wallets.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                direction = H2F if self.random.random() < self.h2f_ratio else F2H
+                pool.submit(self._run_one, direction, wallet, free_wallets)
+                started += 1
+        LOG.info("Started %s transfers in %.1fs", started, duration)
+        return LoadReport(self.results, time.time() - start)
+
+
+def setup_parser():
+    '''CLI parameters'''
+    parser = argparse.ArgumentParser(description='Bridge load generator')
+    add_config_args(parser)
+    parser.add_argument('--keys', help='File of wallet private keys, one per line')
+    parser.add_argument('--wallets', type=int, help='Number of wallets to use')
+    parser.add_argument('--rate', type=float, help='Transfers started per second')
+    parser.add_argument('--concurrency', type=int, help='Transfers in flight')
+    parser.add_argument('--duration', type=float, default=60, help='Seconds to start transfers')
+    parser.add_argument('--h2f', type=float, default=0.5, help='Share of H->F transfers, 0 ~ 1')
+    parser.add_argument('--amount', type=float, default=1, help='Tokens per transfer')
+    parser.add_argument('--timeout', type=float, default=300, help='Seconds per transfer')
+    parser.add_argument('--seed', type=int, help='Seed of the direction mix')
+    parser.add_argument('--json', help='Save report as JSON in this file')
+    parser.add_argument('-d', default='INFO', help='Log level: INFO, DEBUG')
+    return parser
+
+
+def main(argv=None):
+    '''Entry'''
+    args = setup_parser().parse_args(argv)
+    logging.basicConfig(level=args.d, format='%(asctime)s %(levelname)-6s %(message)s')
+
+    config = config_from_args(args)
+    keys = config.get('keys', [])
+    if args.keys:
+        with open(args.keys) as file:
+            keys = [line.strip() for line in file if line.strip()]
+    keys = keys[:args.wallets] if args.wallets else keys
+    if not keys:
+        LOG.error("No wallet, use --keys")
+        return 1
+
+    bridge_h = Bridge(W3Helper(config['h_rpc']), config['h_bridge'])
+    bridge_f = Bridge(W3Helper(config['f_rpc']), config['f_bridge'])
+    account = bridge_f.w3h.web3.eth.account
+    wallets = [Wallet(key, account.privateKeyToAccount(key).address) for key in keys]
+    amount = int(args.amount * 10 ** bridge_f.erc20().decimals())
+
+    generator = LoadGenerator(bridge_h, bridge_f, wallets, amount, args.h2f, args.rate,
+                              args.concurrency, args.timeout, args.seed)
+    with bridge_h.w3h.block_recorder() as blocks_h, bridge_f.w3h.block_recorder() as blocks_f:
+        report = generator.run(args.duration)
+    for line in report.lines():
+        LOG.info(line)
+    LOG.info("Home %s", blocks_h.summary())
+    LOG.info("Foreign %s", blocks_f.summary())
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(report.as_dict(), file, indent=2)
+    return 0 if all(res.error is None for res in report.results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,329 @@
+'''
+Bridge reconciliation
+Scans a block range on both chains and joins user requests with their completions on
+the other side by source tx hash, to report stuck and slow transfers:
+    H->F: UserRequestForSignature of the home bridge -> RelayedMessage of the foreign bridge
+    F->H: token Transfer to the foreign bridge -> AffirmationCompleted of the home bridge
+Completions are scanned up to the head, so requests at the end of the range can still be
+matched. Each event stream is split in segments scanned in parallel, each with its own
+adaptive chunk size (see EventScanner), and block timestamps are fetched with batches.
+'''
+
+import argparse
+import json
+import logging
+import sys
+import time
+from concurrent import futures
+
+from example.python.contracts import Bridge, W3Helper
+from example.python.utils.bridge import (DIRECTIONS, F2H, H2F, add_config_args, address_topic,
+                                         block_at, config_from_args, percentile)
+
+LOG = logging.getLogger(__name__)
+
+
+class Transfer:
+    '''User request and, once matched, its completion; timestamps are block timestamps'''
+    __slots__ = ('direction', 'tx_hash', 'account', 'value', 'block', 'timestamp',
+                 'dst_tx_hash', 'dst_block', 'dst_timestamp')
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, direction, tx_hash, account, value, block):
+        self.direction = direction
+        self.tx_hash = tx_hash
+        self.account = account
+        self.value = value
+        self.block = block
+        self.timestamp = None
+        self.dst_tx_hash = None
+        self.dst_block = None
+        self.dst_timestamp = None
+
+    @property
+    def completed(self):
+        '''Whether the completion event was found'''
+        return self.dst_tx_hash is not None
+
+    @property
+    def latency(self):
+        '''Seconds between request and completion blocks, None if not completed'''
+        if self.dst_timestamp is None or self.timestamp is None:
+            return None
+        return self.dst_timestamp - self.timestamp
+
+    def age(self, now):
+        '''Seconds since the request block'''
+        return now - self.timestamp
+
+    def as_dict(self, now):
+        '''JSON friendly dict'''
+        return {
+            'direction': self.direction,
+            'tx_hash': '0x' + self.tx_hash.hex(),
+            'account': self.account,
+            'value': self.value,
+            'block': self.block,
+            'age': self.age(now),
+            'dst_tx_hash': '0x' + self.dst_tx_hash.hex() if self.dst_tx_hash else None,
+            'dst_block': self.dst_block,
+            'latency': self.latency,
+        }
+
+
+class ReconcileReport:
+    '''Transfers of both directions, classified against the slow threshold'''
+
+    def __init__(self, transfers, orphans, slow, now=None):
+        self.transfers = transfers
+        # Completions whose request is not in the scanned range, per direction
+        self.orphans = orphans
+        self.slow = slow
+        self.now = time.time() if now is None else now
+
+    def stuck(self, direction=None):
+        '''Not completed and older than slow, oldest first'''
+        return sorted((tr for tr in self.transfers
+                       if not tr.completed and tr.age(self.now) >= self.slow
+                       and direction in (None, tr.direction)),
+                      key=lambda tr: tr.timestamp)
+
+    def pending(self, direction=None):
+        '''Not completed, younger than slow'''
+        return [tr for tr in self.transfers
+                if not tr.completed and tr.age(self.now) < self.slow
+                and direction in (None, tr.direction)]
+
+    def slow_transfers(self, direction=None):
+        '''Completed in slow seconds or more, slowest first'''
+        return sorted((tr for tr in self.transfers
+                       if tr.completed and tr.latency is not None and tr.latency >= self.slow
+                       and direction in (None, tr.direction)),
+                      key=lambda tr: -tr.latency)
+
+    def stats(self, direction):
+        '''Counters and latency percentiles of one direction'''
+        transfers = [tr for tr in self.transfers if tr.direction == direction]
+        latencies = sorted(tr.latency for tr in transfers if tr.latency is not None)
+        return {
+            'requests': len(transfers),
+            'completed': len([tr for tr in transfers if tr.completed]),
+            'pending': len(self.pending(direction)),
+            'stuck': len(self.stuck(direction)),
+            'slow': len(self.slow_transfers(direction)),
+            'orphan_completions': self.orphans.get(direction, 0),
+            'latency_p50': percentile(latencies, 50),
+            'latency_p95': percentile(latencies, 95),
+            'latency_max': latencies[-1] if latencies else None,
+        }
+
+    def as_dict(self):
+        '''Stats, stuck and slow transfers'''
+        return {
+            'stats': {direction: self.stats(direction) for direction in DIRECTIONS},
+            'stuck': [tr.as_dict(self.now) for tr in self.stuck()],
+            'slow': [tr.as_dict(self.now) for tr in self.slow_transfers()],
+        }
+
+    def lines(self, limit=20):
+        '''Human readable report, at most limit stuck and slow transfers'''
+        def _sec(value):
+            return '-' if value is None else '%.0fs' % value
+        lines = []
+        for direction in DIRECTIONS:
+            stats = self.stats(direction)
+            lines.append('%s requests=%s completed=%s pending=%s stuck=%s slow=%s orphans=%s '
+                         'p50=%s p95=%s max=%s'
+                         % (direction, stats['requests'], stats['completed'], stats['pending'],
+                            stats['stuck'], stats['slow'], stats['orphan_completions'],
+                            _sec(stats['latency_p50']), _sec(stats['latency_p95']),
+                            _sec(stats['latency_max'])))
+        for transfer in self.stuck()[:limit]:
+            lines.append('STUCK %s 0x%s block=%s age=%s account=%s value=%s'
+                         % (transfer.direction, transfer.tx_hash.hex(), transfer.block,
+                            _sec(transfer.age(self.now)), transfer.account, transfer.value))
+        for transfer in self.slow_transfers()[:limit]:
+            lines.append('SLOW %s 0x%s block=%s latency=%s'
+                         % (transfer.direction, transfer.tx_hash.hex(), transfer.block,
+                            _sec(transfer.latency)))
+        return lines
+
+
+class Reconciler:
+    '''
+    Join requests and completions of home bridge bridge_h and foreign bridge bridge_f.
+    Each of the 4 event streams is split in segments block ranges scanned in parallel.
+    '''
+    SEGMENTS = 4
+    SLOW = 600
+    TIMESTAMP_BATCH = 100
+
+    def __init__(self, bridge_h, bridge_f, segments=SEGMENTS, slow=SLOW):
+        self.bridge_h = bridge_h
+        self.bridge_f = bridge_f
+        self.segments = segments
+        self.slow = slow
+        self.pool = futures.ThreadPoolExecutor(segments * 4)
+
+    def close(self):
+        '''Stop scanning threads'''
+        self.pool.shutdown()
+
+    def _segments(self, from_block, to_block):
+        size = max(1, (to_block - from_block + 1 + self.segments - 1) // self.segments)
+        return [(start, min(to_block, start + size - 1))
+                for start in range(from_block, to_block + 1, size)]
+
+    def _scan(self, make_scanner, from_block, to_block):
+        '''Futures of DecodedEvent lists, one per segment'''
+        return [self.pool.submit(lambda start, end: list(make_scanner().scan(start, end)),
+                                 start, end)
+                for start, end in self._segments(from_block, to_block)]
+
+    def _streams(self, h_range, f_range):
+        bridge_h, bridge_f = self.bridge_h, self.bridge_f
+        token_f = bridge_f.erc20()
+        transfer = token_f.descriptors()['transfer_event']
+        h_head = bridge_h.w3h.eth.blockNumber
+        f_head = bridge_f.w3h.eth.blockNumber
+        return {
+            (H2F, 'request'): self._scan(
+                lambda: bridge_h.scanner([bridge_h.descriptors()['user_request']]), *h_range),
+            (H2F, 'completion'): self._scan(
+                lambda: bridge_f.scanner([bridge_f.descriptors()['relayed_msg']]),
+                f_range[0], f_head),
+            (F2H, 'request'): self._scan(
+                lambda: token_f.scanner([transfer], extra_topics=[
+                    None, address_topic(bridge_f.contract_addr)]), *f_range),
+            (F2H, 'completion'): self._scan(
+                lambda: bridge_h.scanner([bridge_h.descriptors()['affirm_completed']]),
+                h_range[0], h_head),
+        }
+
+    @staticmethod
+    def _events(segment_futures):
+        for future in segment_futures:
+            for event in future.result():
+                yield event
+
+    def _timestamps(self, w3h, numbers):
+        '''{block number: timestamp}, fetched with parallel batches'''
+        numbers = sorted(set(numbers))
+
+        def _fetch(chunk):
+            batch = w3h.batch(self.TIMESTAMP_BATCH)
+            for number in chunk:
+                batch.get_block(number)
+            return [block['timestamp'] for block in batch.execute()]
+
+        chunks = [numbers[start:start + self.TIMESTAMP_BATCH]
+                  for start in range(0, len(numbers), self.TIMESTAMP_BATCH)]
+        timestamps = {}
+        for chunk, values in zip(chunks, self.pool.map(_fetch, chunks)):
+            timestamps.update(zip(chunk, values))
+        return timestamps
+
+    def reconcile(self, h_range, f_range):
+        '''
+        Scan requests in h_range / f_range ((from_block, to_block) of home / foreign) and
+        completions from the start of the other range to the head.
+        :returns: ReconcileReport
+        '''
+        started = time.time()
+        streams = self._streams(h_range, f_range)
+        transfers = {}
+        for event in self._events(streams[(H2F, 'request')]):
+            recipient, value = event.values
+            key = bytes(event.transaction_hash)
+            transfers[key] = Transfer(H2F, key, recipient, value, event.block_number)
+        for event in self._events(streams[(F2H, 'request')]):
+            sender, _, value = event.values
+            key = bytes(event.transaction_hash)
+            transfers[key] = Transfer(F2H, key, sender, value, event.block_number)
+
+        orphans = {}
+        for direction in DIRECTIONS:
+            for event in self._events(streams[(direction, 'completion')]):
+                _, _, tx_hash = event.values
+                transfer = transfers.get(bytes(tx_hash))
+                if transfer is None or transfer.direction != direction:
+                    orphans[direction] = orphans.get(direction, 0) + 1
+                    continue
+                transfer.dst_tx_hash = bytes(event.transaction_hash)
+                transfer.dst_block = event.block_number
+        LOG.info("Scanned %s requests in %.1fs", len(transfers), time.time() - started)
+
+        h_blocks = [tr.block for tr in transfers.values() if tr.direction == H2F]
+        h_blocks += [tr.dst_block for tr in transfers.values()
+                     if tr.direction == F2H and tr.completed]
+        f_blocks = [tr.block for tr in transfers.values() if tr.direction == F2H]
+        f_blocks += [tr.dst_block for tr in transfers.values()
+                     if tr.direction == H2F and tr.completed]
+        h_timestamps = self._timestamps(self.bridge_h.w3h, h_blocks)
+        f_timestamps = self._timestamps(self.bridge_f.w3h, f_blocks)
+        for transfer in transfers.values():
+            src, dst = ((h_timestamps, f_timestamps) if transfer.direction == H2F
+                        else (f_timestamps, h_timestamps))
+            transfer.timestamp = src[transfer.block]
+            if transfer.completed:
+                transfer.dst_timestamp = dst[transfer.dst_block]
+        LOG.info("Reconciled in %.1fs", time.time() - started)
+        return ReconcileReport(list(transfers.values()), orphans, self.slow)
+
+
+def setup_parser():
+    '''CLI parameters'''
+    parser = argparse.ArgumentParser(description='Report stuck and slow bridge transfers')
+    add_config_args(parser)
+    parser.add_argument('--days', type=float, default=7,
+                        help='Scan requests of the last days, unless block ranges are given')
+    parser.add_argument('--h-from', type=int, help='First home block')
+    parser.add_argument('--h-to', type=int, help='Last home block of requests')
+    parser.add_argument('--f-from', type=int, help='First foreign block')
+    parser.add_argument('--f-to', type=int, help='Last foreign block of requests')
+    parser.add_argument('--slow', type=float, default=Reconciler.SLOW,
+                        help='Seconds after which a transfer is slow, or stuck if not completed')
+    parser.add_argument('--segments', type=int, default=Reconciler.SEGMENTS,
+                        help='Parallel scans per event stream')
+    parser.add_argument('--limit', type=int, default=20, help='Stuck / slow transfers to log')
+    parser.add_argument('--json', help='Save report as JSON in this file')
+    parser.add_argument('-d', default='INFO', help='Log level: INFO, DEBUG')
+    return parser
+
+
+def main(argv=None):
+    '''Entry, exits with 1 if transfers are stuck'''
+    args = setup_parser().parse_args(argv)
+    logging.basicConfig(level=args.d, format='%(asctime)s %(levelname)-6s %(message)s')
+
+    config = config_from_args(args)
+    bridge_h = Bridge(W3Helper(config['h_rpc']), config['h_bridge'])
+    bridge_f = Bridge(W3Helper(config['f_rpc']), config['f_bridge'])
+
+    since = time.time() - args.days * 24 * 60 * 60
+    ranges = []
+    for w3h, from_block, to_block in ((bridge_h.w3h, args.h_from, args.h_to),
+                                      (bridge_f.w3h, args.f_from, args.f_to)):
+        if to_block is None:
+            to_block = w3h.eth.blockNumber
+        if from_block is None:
+            from_block = block_at(w3h, since, to_block)
+        ranges.append((from_block, to_block))
+    h_range, f_range = ranges
+    LOG.info("Home blocks %s ~ %s, foreign blocks %s ~ %s", *(h_range + f_range))
+
+    reconciler = Reconciler(bridge_h, bridge_f, args.segments, args.slow)
+    try:
+        report = reconciler.reconcile(h_range, f_range)
+    finally:
+        reconciler.close()
+    for line in report.lines(args.limit):
+        LOG.info(line)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(report.as_dict(), file, indent=2)
+    return 1 if report.stuck() else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,105 +1,170 @@
 '''Cross Chain Asset related smart contracts'''
 
+import collections
+import logging
+import threading
+import time
+from binascii import hexlify, unhexlify
+from concurrent import futures
+
+from hexbytes import HexBytes
+
+from example.python.utils.jsonrpc import to_hex_data
 # pylint: disable=unused-import
+from example.python.utils.bridge import SECONDS_PER_DAY
 from example.python.utils.w3helper import SmartContract, W3Helper, Web3
+from example.python.utils.aiow3helper import AsyncSmartContract, AsyncW3Helper
+
+LOG = logging.getLogger(__name__)
 
 # pylint: disable=unsubscriptable-object
 class ERC20(SmartContract):
     '''ERC20 Token methods'''
 
-    def __init__(self, w3h, contract_addr):
-        super().__init__(w3h, contract_addr)
-        self.attrs.update({
-            'name': "name()string",
-            'symbol': "symbol()string",
-            'decimals': "decimals()uint8",
-            'total_supply': "totalSupply()uint256",
-            'balance_of': "balanceOf(address)uint256",
-            'allowance': "allowance(address,address)uint256",
-            'transfer': ("transfer(address,uint256)", True, [
-                'Transfer(i:address,i:address,uint256)']),
-            'approve': "approve(address,uint256)",
-            'transfer_from': "transferFrom(address,address,uint256)",
-        })
+    ATTRS = dict(SmartContract.ATTRS, **{
+        'name': "name()string",
+        'symbol': "symbol()string",
+        'decimals': "decimals()uint8",
+        'total_supply': "totalSupply()uint256",
+        'balance_of': "balanceOf(address)uint256",
+        'allowance': "allowance(address,address)uint256",
+        'transfer': ("transfer(address,uint256)", True, [
+            'Transfer(i:address,i:address,uint256)']),
+        'approve': "approve(address,uint256)",
+        'transfer_from': "transferFrom(address,address,uint256)",
+        'transfer_event': "event:Transfer(i:address,i:address,uint256)",
+    })
 
 class ERC677(ERC20):
     '''ECR677 Token'''
 
-    def __init__(self, w3h, contract_addr):
-        super().__init__(w3h, contract_addr)
-        self.attrs.update({
-            'transfer_call': ("transferAndCall(address,uint256,bytes)", False, [
-                'Transfer(i:address,i:address,uint256)',
-                'Burn(i:address,uint256)',
-                'UserRequestForSignature(address,uint256)',
-                'Transfer(i:address,i:address,uint256,bytes)']),
-            'get_rules': "getFundingRules()(uint256,uint256,uint256,uint256)",
-            'owner': "owner()address",
-        })
+    ATTRS = dict(ERC20.ATTRS, **{
+        'transfer_call': ("transferAndCall(address,uint256,bytes)", False, [
+            'Transfer(i:address,i:address,uint256)',
+            'Burn(i:address,uint256)',
+            'UserRequestForSignature(address,uint256)',
+            'Transfer(i:address,i:address,uint256,bytes)']),
+        'get_rules': "getFundingRules()(uint256,uint256,uint256,uint256)",
+        'owner': "owner()address",
+        'mint': "mint(address,uint256)",
+        'set_bridge_contract': "setBridgeContract(address)",
+        'transfer_ownership': "transferOwnership(address)",
+    })
 
 class Validators(SmartContract):
     '''Bridge Validators'''
 
-    def __init__(self, w3h, contract_addr):
-        super().__init__(w3h, contract_addr)
-        self.attrs.update({
-            'owner': "owner()address",
-            'required_signatures': "requiredSignatures()uint256",
-            'count': "validatorCount()uint256",
-            'list': "validatorsList()address[]",
-            'set_required_signatures': "setRequiredSignatures(uint256)",
-            'add': "addValidator(address)",
-            'remove': "removeValidator(address)"
-        })
+    ATTRS = dict(SmartContract.ATTRS, **{
+        'owner': "owner()address",
+        'required_signatures': "requiredSignatures()uint256",
+        'count': "validatorCount()uint256",
+        'list': "validatorsList()address[]",
+        'set_required_signatures': "setRequiredSignatures(uint256)",
+        'add': "addValidator(address)",
+        'remove': "removeValidator(address)"
+    })
 
 class Bridge(SmartContract):
     '''Bridge Contact'''
 
-    def __init__(self, w3h, contract_addr):
-        super().__init__(w3h, contract_addr)
-        self.attrs.update({
-            'owner': "owner()address",
-            'required_signatures': "requiredSignatures()uint256",
-            # Fee Manager
-            'fee_percent': "feePercent()uint256",
-            'fee_subtract': "subtractFee(uint256)uint256",
-            'set_fee_percent': "setFeePercent(uint256)",
-            # Basic Bridge
-            'daily_limit': "dailyLimit()uint256",
-            'set_daily_limit': "setDailyLimit(uint256)",
-            'exec_daily_limit': "executionDailyLimit()uint256",
-            'set_exec_daily_limit': "setExecutionDailyLimit(uint256)",
-            'get_current_day': "getCurrentDay()uint256",
-            'total_spent_per_day': "totalSpentPerDay(uint256)uint256",
-            'total_exec_per_day': "totalExecutedPerDay(uint256)uint256",
-            'within_limit': "withinLimit(uint256)bool",
-            'within_exec_limit': "withinExecutionLimit(uint256)bool",
-            'min_per_tx': "minPerTx()uint256",
-            'max_per_tx': "maxPerTx()uint256",
-            'set_min_per_tx': "setMinPerTx(uint256)",
-            'set_max_per_tx': "setMaxPerTx(uint256)",
-            'claim_tokens': "claimTokens(address,address)",
-            # Home bridge
-            'set_rules': "setFundingRules(uint256,uint256,uint256,uint256)",
-            # OverdrawManagerment
-            'fix_assets': ("fixAssetsAboveLimits(bytes32,bool)", False,
-                           'UserRequestForSignature(address,uint256)'),
-            # Contracts
-            'validatorContract': "validatorContract()address",
-            'erc677token': "erc677token()address",
-            'erc20token': "erc20token()address",
-            # Events
-            'signed_affirm': "event:SignedForAffirmation(i:address,bytes32)", # HOME - in
-            'affirm_completed': "event:AffirmationCompleted(address,uint256,bytes32)", # HOME -in
-            'amount_limit': "AmountLimitExceeded(address,uint256,bytes32)", # HOME - in
-            'signed_request': "event:SignedForUserRequest(i:address,bytes32)", # HOME - out
-            'relayed_msg': "event:RelayedMessage(address,uint256,bytes32)" # Foreign - in
-        })
+    ATTRS = dict(SmartContract.ATTRS, **{
+        'owner': "owner()address",
+        'required_signatures': "requiredSignatures()uint256",
+        # Fee Manager
+        'fee_percent': "feePercent()uint256",
+        'fee_subtract': "subtractFee(uint256)uint256",
+        'set_fee_percent': "setFeePercent(uint256)",
+        # Basic Bridge
+        'daily_limit': "dailyLimit()uint256",
+        'set_daily_limit': "setDailyLimit(uint256)",
+        'exec_daily_limit': "executionDailyLimit()uint256",
+        'set_exec_daily_limit': "setExecutionDailyLimit(uint256)",
+        'get_current_day': "getCurrentDay()uint256",
+        'total_spent_per_day': "totalSpentPerDay(uint256)uint256",
+        'total_exec_per_day': "totalExecutedPerDay(uint256)uint256",
+        'within_limit': "withinLimit(uint256)bool",
+        'within_exec_limit': "withinExecutionLimit(uint256)bool",
+        'min_per_tx': "minPerTx()uint256",
+        'max_per_tx': "maxPerTx()uint256",
+        'set_min_per_tx': "setMinPerTx(uint256)",
+        'set_max_per_tx': "setMaxPerTx(uint256)",
+        'claim_tokens': "claimTokens(address,address)",
+        # Home bridge
+        'set_rules': "setFundingRules(uint256,uint256,uint256,uint256)",
+        # OverdrawManagerment
+        'fix_assets': ("fixAssetsAboveLimits(bytes32,bool)", False,
+                       'UserRequestForSignature(address,uint256)'),
+        # Contracts
+        'validatorContract': "validatorContract()address",
+        'erc677token': "erc677token()address",
+        'erc20token': "erc20token()address",
+        # Events
+        'signed_affirm': "event:SignedForAffirmation(i:address,bytes32)", # HOME - in
+        'affirm_completed': "event:AffirmationCompleted(address,uint256,bytes32)", # HOME -in
+        'amount_limit': "AmountLimitExceeded(address,uint256,bytes32)", # HOME - in
+        'signed_request': "event:SignedForUserRequest(i:address,bytes32)", # HOME - out
+        'relayed_msg': "event:RelayedMessage(address,uint256,bytes32)", # Foreign - in
+        'user_request': "event:UserRequestForSignature(address,uint256)", # HOME - out
+        # Validator methods
+        'execute_affirmation': "executeAffirmation(address,uint256,bytes32)", # HOME
+        'submit_signature': "submitSignature(bytes,bytes)", # HOME
+        'execute_signatures': "executeSignatures(uint8[],bytes32[],bytes32[],bytes)", # Foreign
+    })
+
+    SNAPSHOT_ATTRS = ('required_signatures', 'fee_percent', 'daily_limit', 'exec_daily_limit',
+                      'min_per_tx', 'max_per_tx', 'get_current_day')
 
     def validators(self):
         '''call validatorContract'''
         return Validators(self.w3h, self.validatorContract())
 
+    def contracts(self, aggregator=None):
+        '''Resolve (validators, token) contracts with one request, cached'''
+        if '_contracts' not in self.__dict__:
+            multicall = Multicall(self.w3h, aggregator)
+            multicall.add(self.validatorContract)
+            multicall.add(self.erc677token)
+            multicall.add(self.erc20token)
+            validator_addr, erc677_addr, erc20_addr = multicall.execute()
+            if erc677_addr and int(erc677_addr, 16):
+                token = ERC677(self.w3h, erc677_addr)
+            else:
+                token = ERC20(self.w3h, erc20_addr)
+            self.__dict__['_contracts'] = (Validators(self.w3h, validator_addr), token)
+        return self.__dict__['_contracts']
+
+    def snapshot(self, holders=(), aggregator=None):
+        '''
+        Bridge health snapshot: limits, fee, totals of today, validators and token balances
+        of the bridge and holders. Read with one request per chain once the validator and
+        token contracts are resolved, see Multicall about aggregator.
+        '''
+        validators, token = self.contracts(aggregator)
+        day = int(time.time()) // SECONDS_PER_DAY
+        holders = [self.contract_addr] + list(holders)
+
+        multicall = Multicall(self.w3h, aggregator)
+        names = list(self.SNAPSHOT_ATTRS) + ['total_spent_per_day', 'total_exec_per_day',
+                                             'validators']
+        for name in self.SNAPSHOT_ATTRS:
+            multicall.add(getattr(self, name))
+        multicall.add(self.total_spent_per_day, day)
+        multicall.add(self.total_exec_per_day, day)
+        multicall.add(validators.list)
+        for holder in holders:
+            multicall.add(token.balance_of, holder)
+        values = multicall.execute()
+
+        snapshot = dict(zip(names, values))
+        snapshot['balances'] = dict(zip(holders, values[len(names):]))
+        if snapshot['get_current_day'] not in (None, day):
+            # Local clock is on another day than the chain
+            day = snapshot['get_current_day']
+            multicall.add(self.total_spent_per_day, day)
+            multicall.add(self.total_exec_per_day, day)
+            snapshot['total_spent_per_day'], snapshot['total_exec_per_day'] = multicall.execute()
+        return snapshot
+
     #Basic Bridge
     def erc677(self):
         '''call erc677token'''
@@ -107,4 +172,235 @@ class Bridge(SmartContract):
 
     def erc20(self):
         '''call erc20token'''
-        return ERC20(self.w3h, self.erc20token())
\ No newline at end of file
+        return ERC20(self.w3h, self.erc20token())
+
+class AsyncERC20(ERC20, AsyncSmartContract):
+    '''asyncio ERC20 Token, w3h is an AsyncW3Helper'''
+
+class AsyncERC677(ERC677, AsyncSmartContract):
+    '''asyncio ERC677 Token'''
+
+class AsyncValidators(Validators, AsyncSmartContract):
+    '''asyncio Bridge Validators'''
+
+class AsyncBridge(Bridge, AsyncSmartContract):
+    '''asyncio Bridge Contract'''
+
+    async def validators(self):
+        '''call validatorContract'''
+        return AsyncValidators(self.w3h, await self.validatorContract())
+
+    async def erc677(self):
+        '''call erc677token'''
+        return AsyncERC677(self.w3h, await self.erc677token())
+
+    async def erc20(self):
+        '''call erc20token'''
+        return AsyncERC20(self.w3h, await self.erc20token())
+
+TransferCompletion = collections.namedtuple('TransferCompletion', [
+    'tx_hash', 'recipient', 'value', 'dst_tx_hash', 'dst_block', 'latency'])
+
+class TransferTracker:
+    '''
+    Wait for bridge transfers to complete on the destination side.
+    A H->F transfer completes with RelayedMessage on the foreign bridge, a F->H one with
+    AffirmationCompleted on the home bridge; both events carry the source tx hash.
+    One background thread scans new blocks of the destination bridge for all tracked
+    transfers, futures resolve with TransferCompletion as soon as the event is seen.
+    '''
+    POLL_INTERVAL = 1
+    # (completion, time seen) of transfers not tracked yet, kept for late track() calls
+    MAX_SEEN = 10000
+
+    def __init__(self, bridge, event, poll_interval=POLL_INTERVAL):
+        self.bridge = bridge
+        self.scanner = bridge.scanner([bridge.descriptors()[event]])
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._seen = collections.OrderedDict()
+        self._thread = None
+        self._first_block = None
+        self._next_block = None
+
+    @classmethod
+    def home_to_foreign(cls, foreign_bridge, **kwargs):
+        '''Tracker of H->F transfers, on the foreign bridge'''
+        return cls(foreign_bridge, 'relayed_msg', **kwargs)
+
+    @classmethod
+    def foreign_to_home(cls, home_bridge, **kwargs):
+        '''Tracker of F->H transfers, on the home bridge'''
+        return cls(home_bridge, 'affirm_completed', **kwargs)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def head(self):
+        '''Latest destination block, pass it to track() as from_block before sending'''
+        return self.scanner.head()
+
+    def track(self, tx_hash, sent_at=None, from_block=None):
+        '''
+        Start tracking the transfer sent in source transaction tx_hash.
+        :param sent_at Time the transfer was sent, latency is measured from it (now if None)
+        :param from_block First destination block to scan (destination head if None)
+        :returns: Future of TransferCompletion
+        '''
+        key = HexBytes(tx_hash)
+        sent_at = time.time() if sent_at is None else sent_at
+        if from_block is None:
+            from_block = self.head()
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is not None:
+                return entry[0]
+            future = futures.Future()
+            seen = self._seen.pop(key, None)
+            if seen is not None:
+                completion, seen_at = seen
+                future.set_result(completion._replace(latency=max(0, seen_at - sent_at)))
+                return future
+            self._pending[key] = (future, sent_at)
+            if self._thread is None:
+                self._first_block = self._next_block = from_block
+                self._thread = threading.Thread(target=self._run, name='TransferTracker',
+                                                daemon=True)
+                self._thread.start()
+            elif from_block < self._first_block:
+                # Completions in blocks scanned since _first_block are in _seen, go back
+                # only for older blocks
+                self._first_block = self._next_block = from_block
+        return future
+
+    def untrack(self, tx_hash):
+        '''Stop tracking tx_hash, its future is cancelled'''
+        with self._lock:
+            entry = self._pending.pop(HexBytes(tx_hash), None)
+        if entry is not None:
+            entry[0].cancel()
+
+    def wait(self, tx_hash, timeout=300, sent_at=None, from_block=None):
+        '''Wait for one transfer, returns TransferCompletion or raises TimeoutError'''
+        future = self.track(tx_hash, sent_at, from_block)
+        try:
+            return future.result(timeout)
+        except futures.TimeoutError:
+            self.untrack(tx_hash)
+            raise TimeoutError("Transfer %s not completed in %ss"
+                               % (to_hex_data(HexBytes(tx_hash)), timeout))
+
+    def _complete(self, event, now):
+        recipient, value, tx_hash = event.values
+        key = bytes(tx_hash)
+        completion = TransferCompletion(key, recipient, value, event.transaction_hash,
+                                        event.block_number, None)
+        with self._lock:
+            entry = self._pending.pop(key, None)
+            if entry is None:
+                # Latency is known once tracked, from the time seen
+                self._seen[key] = (completion, now)
+                while len(self._seen) > self.MAX_SEEN:
+                    self._seen.popitem(last=False)
+                return
+        future, sent_at = entry
+        if not future.done():
+            LOG.debug("Transfer %s completed in block %s", hexlify(key), event.block_number)
+            future.set_result(completion._replace(latency=now - sent_at))
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._thread = None
+                    return
+                from_block = self._next_block
+            try:
+                head = self.scanner.head()
+                if head >= from_block:
+                    events = list(self.scanner.scan(from_block, head))
+                    now = time.time()
+                    for event in events:
+                        self._complete(event, now)
+                    with self._lock:
+                        if self._next_block == from_block:
+                            self._next_block = head + 1
+            except Exception:  # pylint: disable=broad-except
+                # Keep scanning, waiters would time out silently if this thread died
+                LOG.exception("Failed to scan %s", self.bridge.contract_addr)
+            time.sleep(self.poll_interval)
+
+
+class Multicall2(SmartContract):
+    '''MakerDAO Multicall2 aggregator'''
+
+    ATTRS = dict(SmartContract.ATTRS, **{
+        'try_aggregate': "tryAggregate(bool,(address,bytes)[])(bool,bytes)[]",
+        'block_number': "getBlockNumber()uint256",
+    })
+
+class Multicall:
+    '''
+    Aggregate readonly Funcall invocations of any contracts into one request:
+        multicall = Multicall(w3h)
+        multicall.add(bridge.daily_limit)
+        multicall.add(token.balance_of, holder)
+        daily_limit, balance = multicall.execute()
+    With the address of a deployed Multicall2 aggregator all calls are sent as one
+    tryAggregate eth_call, otherwise (or if it fails) as one JSON-RPC batch of eth_call.
+    Results of failed calls are None, like readonly Funcall.
+    '''
+
+    def __init__(self, w3h, aggregator=None):
+        self.w3h = w3h
+        self.aggregator = Multicall2(w3h, aggregator) if aggregator else None
+        self.calls = []
+
+    def __len__(self):
+        return len(self.calls)
+
+    def add(self, funcall, *args):
+        '''Add readonly method call, returns index of its result'''
+        _, data = funcall.prepare(*args)
+        self.calls.append((funcall, data))
+        return len(self.calls) - 1
+
+    @staticmethod
+    def _decode(funcall, ret_data):
+        if not ret_data:
+            return None
+        try:
+            return funcall.decode_return(ret_data)
+        except Exception:
+            return None
+
+    def _aggregate(self, calls, block_identifier):
+        results = self.aggregator.try_aggregate(
+            False, [(funcall.contract.contract_addr, unhexlify(data[2:]))
+                    for funcall, data in calls],
+            block_identifier=block_identifier)
+        if results is None:
+            return None
+        return [self._decode(funcall, ret_data) if success else None
+                for (funcall, _), (success, ret_data) in zip(calls, results)]
+
+    def _batch(self, calls, block_identifier):
+        batch = self.w3h.batch()
+        for funcall, data in calls:
+            contract_addr = funcall.contract.contract_addr
+            batch.eth_call({"to": contract_addr, "data": data, "from": contract_addr},
+                           block_identifier)
+        return [self._decode(funcall, ret_data)
+                for (funcall, _), ret_data in zip(calls, batch.execute(raise_on_error=False))]
+
+    def execute(self, block_identifier='latest'):
+        '''Send all added calls, returns their decoded results in order'''
+        calls, self.calls = self.calls, []
+        if self.aggregator is not None:
+            results = self._aggregate(calls, block_identifier)
+            if results is not None:
+                return results
+            LOG.warning("Multicall aggregator %s failed, fallback to batch eth_call",
+                        self.aggregator.contract_addr)
+        return self._batch(calls, block_identifier)
@@ -13,9 +13,10 @@ from hexbytes import HexBytes
 
 from example.python.lib.testcase import TestBase, testmain
 from example.python.lib.processpool import ProcessPool
-from example.python.contracts import Bridge, W3Helper, Web3, ERC20, ERC677
+from example.python.contracts import Bridge, W3Helper, Web3, ERC20, ERC677, TransferTracker
 
 LOG = logging.getLogger(__name__)
+TRANSFER_TIMEOUT = 600
 
 class ChainAssetTest(TestBase):
     '''Cross Chain Asset Test'''
@@ -31,9 +32,11 @@ class ChainAssetTest(TestBase):
         cls.config = cls.load_json(
             os.path.abspath(os.path.join(os.path.dirname(__file__), "env.json")))
         super().setUpClass()
+        if cls.LOCAL_CHAIN:
+            cls.config[cls.ARGS.token] = cls.LOCAL_CHAIN.bridge_config
 
-        cls.w3h_h = W3Helper(cls.config[cls.ARGS.token]['h_rpc'])
-        cls.w3h_f = W3Helper(cls.config[cls.ARGS.token]['f_rpc'])
+        cls.w3h_h = cls.w3helper(cls.config[cls.ARGS.token]['h_rpc'])
+        cls.w3h_f = cls.w3helper(cls.config[cls.ARGS.token]['f_rpc'])
         cls.bridge_h = Bridge(cls.w3h_h, cls.config[cls.ARGS.token]['h_bridge'])
         cls.bridge_f = Bridge(cls.w3h_f, cls.config[cls.ARGS.token]['f_bridge'])
         cls.token_h = cls.bridge_h.erc677()
@@ -46,6 +49,8 @@ class ChainAssetTest(TestBase):
     def test_01_parallel(self):
         # Private key list of wallets
         pkeys = ['Key A', 'Key B']
+        if self.LOCAL_CHAIN:
+            pkeys = self.LOCAL_CHAIN.user_keys[:2]
 
         def _fill_tokens():
             decimals = self.token_f.decimals()
@@ -64,22 +69,38 @@ class ChainAssetTest(TestBase):
 
         self.log.info("========= Run Parallel Tests =========")
         times = len(pkeys)
-        pool = ProcessPool(times)
-
-        for i in range(times):
-            addr = self.token_f.w3h.web3.eth.account.privateKeyToAccount(pkeys[i]).address
-            pool.add_task(_test_parallel, i, h_url, f_url, ht_addr, ft_addr, hb_addr, fb_addr,
-                          hfee_percent, ffee_percent, addr, pkeys[i])
-        results = pool.wait_completion()
-        self.log.info("Test Results:\n%s", pformat(results))
+        with ProcessPool(times, _init_worker,
+                         (h_url, f_url, ht_addr, ft_addr, hb_addr, fb_addr)) as pool:
+            for i in range(times):
+                addr = self.token_f.w3h.web3.eth.account.privateKeyToAccount(pkeys[i]).address
+                pool.add_task(_test_parallel, i, hb_addr, fb_addr,
+                              hfee_percent, ffee_percent, addr, pkeys[i])
+            results = []
+            for task in pool.as_completed():
+                if not task.ok:
+                    self.log.error("Task %s failed:\n%s", task.index, task.traceback)
+                results.append(task)
+        self.log.info("Test Results:\n%s", pformat(sorted(results, key=lambda task: task.index)))
+
+
+# Clients of a worker process, built once by _init_worker
+_WORKER = {}
+
+
+def _init_worker(h_url, f_url, ht_addr, ft_addr, hb_addr, fb_addr):
+    '''Build clients of worker process, connections are kept alive across tasks'''
+    w3h_h = W3Helper(h_url)
+    w3h_f = W3Helper(f_url)
+    _WORKER['token_h'] = ERC677(w3h_h, ht_addr)
+    _WORKER['token_f'] = ERC20(w3h_f, ft_addr)
+    _WORKER['f2h'] = TransferTracker.foreign_to_home(Bridge(w3h_h, hb_addr))
+    _WORKER['h2f'] = TransferTracker.home_to_foreign(Bridge(w3h_f, fb_addr))
 
 
-def _test_parallel(i, h_url, f_url, ht_addr, ft_addr, hb_addr, fb_addr, hfee, ffee, acc, key):
+def _test_parallel(i, hb_addr, fb_addr, hfee, ffee, acc, key):
     LOG.info("Run parallel work: %s - %s", i, acc)
-    w3h_h = W3Helper(h_url)
-    w3h_f = W3Helper(f_url)
-    token_h = ERC677(w3h_h, ht_addr)
-    token_f = ERC20(w3h_f, ft_addr)
+    token_h = _WORKER['token_h']
+    token_f = _WORKER['token_f']
     decimals = token_f.decimals()
 
     def _test_para(i, f2h, s_token, d_token, src_acc, dst_acc, src_key, amount):
@@ -94,16 +115,22 @@ def _test_parallel(i, h_url, f_url, ht_addr, ft_addr, hb_addr, fb_addr, hfee, ff
             LOG.info("Balance of source account is lower than the amount to transfer.")
             return 'Error'
 
+        tracker = _WORKER['f2h'] if f2h else _WORKER['h2f']
+        from_block = tracker.head()
+        sent_at = time.time()
         if f2h:
             extra_data = '0x000000000000000000000000%s' % dst_acc[2:]
-            LOG.info("%s", token_f.transfer(src_key, fb_addr, amount, extra_data))
+            receipt = token_f.transfer(src_key, fb_addr, amount, extra_data)
         else:
             if amount < 1 * 10 ** decimals:
                 LOG.info("Amount to transfer is lower than 1 unit.")
                 return 'Error'
             extra_data = HexBytes.fromhex('000000000000000000000000%s' % dst_acc[2:])
-            LOG.info("%s", token_h.transfer_call(src_key, hb_addr, amount, bytes(extra_data)))
-        time.sleep(30)
+            receipt = token_h.transfer_call(src_key, hb_addr, amount, bytes(extra_data))
+        LOG.info("%s", receipt)
+        completion = tracker.wait(receipt['transactionHash'], TRANSFER_TIMEOUT, sent_at, from_block)
+        LOG.info("Transfer %s completed in %.1fs, destination tx %s", i, completion.latency,
+                 completion.dst_tx_hash.hex())
 
         s_src_a = s_token.balance_of(src_acc)
         d_dst_a = d_token.balance_of(dst_acc)
@@ -115,7 +142,8 @@ def _test_parallel(i, h_url, f_url, ht_addr, ft_addr, hb_addr, fb_addr, hfee, ff
             fee = hfee * amount / 10000
         else:
             fee = ffee * amount / 10000
-        return s_src_b - s_src_a == amount and d_dst_a - d_dst_b == amount - fee
+        return (s_src_b - s_src_a == amount and d_dst_a - d_dst_b == amount - fee,
+                completion.latency)
 
     amount_to_transfer = int(1 * 10 ** decimals)
 
@@ -0,0 +1,357 @@
+'''
+Local chain fixture
+Starts ganache-cli (from contracts/node_modules, no docker) or attaches to a dev node
+at LOCAL_CHAIN_URL (ganache, anvil or hardhat: anything with evm_snapshot / evm_revert),
+deploys an erc20-to-erc20 bridge from the truffle build of contracts/ with home and
+foreign sides on the same chain, and relays transfers as the only validator.
+Tests snapshot the chain before each method and revert after it.
+
+contracts/ must be compiled first: cd contracts && npm install && npm run compile
+'''
+
+import json
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import threading
+import time
+
+import eth_abi
+import eth_utils
+from eth_account import Account
+from eth_account.messages import defunct_hash_message
+
+from example.python.contracts import Bridge, ERC20, ERC677, SmartContract, W3Helper
+
+LOG = logging.getLogger(__name__)
+
+PROJECT_ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+ARTIFACTS_DIR = os.path.join(PROJECT_ROOT_DIR, 'contracts', 'build', 'contracts')
+GANACHE_BIN = os.path.join(PROJECT_ROOT_DIR, 'contracts', 'node_modules', '.bin', 'ganache-cli')
+
+ACCOUNT_BALANCE = 10 ** 24
+
+
+def _account_key(idx):
+    '''Deterministic private key of local account idx, for stable runs'''
+    return eth_utils.to_hex(eth_utils.keccak(text='thunder-localchain-%s' % idx))
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def load_artifact(name):
+    '''Truffle build artifact of contract name'''
+    path = os.path.join(ARTIFACTS_DIR, '%s.json' % name)
+    if not os.path.exists(path):
+        raise FileNotFoundError("%s not found, compile contracts: cd contracts && npm install "
+                                "&& npm run compile" % path)
+    with open(path) as file:
+        return json.load(file)
+
+
+class EternalStorageProxy(SmartContract):
+    '''Upgradeable proxy of bridge and validators contracts'''
+
+    ATTRS = dict(SmartContract.ATTRS, **{
+        'upgrade_to': "upgradeTo(uint256,address)",
+        'implementation': "implementation()address",
+    })
+
+
+class BridgeSetup(SmartContract):
+    '''initialize() of bridge contracts behind EternalStorageProxy'''
+
+    ATTRS = dict(SmartContract.ATTRS, **{
+        'init_validators': "initialize(uint256,address[],address)",
+        'init_home': "initialize(address,uint256,uint256,uint256,uint256,uint256,address,"
+                     "uint256,uint256,address,uint256)",
+        'init_foreign': "initialize(address,address,uint256,uint256,uint256,uint256,uint256,"
+                        "address,uint256)",
+    })
+
+
+class LocalValidator:
+    '''
+    Single validator relaying transfers between the bridges of a LocalChain:
+    tokens sent to the foreign bridge are affirmed on the home bridge, and
+    UserRequestForSignature on the home bridge is signed and executed on the foreign one.
+    '''
+    POLL_INTERVAL = 0.2
+
+    def __init__(self, w3h, key, home_bridge, foreign_bridge, foreign_token,
+                 poll_interval=POLL_INTERVAL):
+        self.w3h = w3h
+        self.key = key
+        self.home_bridge = home_bridge
+        self.foreign_bridge = foreign_bridge
+        self.poll_interval = poll_interval
+        self.deposits = foreign_token.scanner([foreign_token.descriptors()['transfer_event']])
+        self.requests = home_bridge.scanner([home_bridge.descriptors()['user_request']])
+        self._next_block = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def reset(self):
+        '''Relay from the current head, e.g. after the chain is reverted'''
+        self._next_block = self.w3h.eth.blockNumber + 1
+
+    def _recipient(self, event):
+        # Recipient is appended to transfer() call data, default to the sender
+        transaction = self.w3h.get_transaction(event.transaction_hash)
+        data = bytes(transaction['input'])
+        if len(data) >= 4 + 32 * 3:
+            return eth_utils.to_checksum_address(data[-20:])
+        return event.values[0]
+
+    def relay_deposit(self, event):
+        '''Affirm tokens sent to the foreign bridge on the home bridge'''
+        _, _to, value = event.values
+        if _to.lower() != self.foreign_bridge.contract_addr.lower():
+            return
+        self.home_bridge.execute_affirmation(self.key, self._recipient(event), value,
+                                             bytes(event.transaction_hash))
+
+    def relay_request(self, event):
+        '''Sign a home user request and execute it on the foreign bridge'''
+        recipient, value = event.values
+        message = (eth_utils.to_bytes(hexstr=recipient) + value.to_bytes(32, 'big')
+                   + bytes(event.transaction_hash)
+                   + eth_utils.to_bytes(hexstr=self.foreign_bridge.contract_addr))
+        signed = Account.signHash(defunct_hash_message(primitive=message), self.key)
+        self.home_bridge.submit_signature(self.key, bytes(signed.signature), message)
+        self.foreign_bridge.execute_signatures(self.key, [signed.v],
+                                               [signed.r.to_bytes(32, 'big')],
+                                               [signed.s.to_bytes(32, 'big')], message)
+
+    def poll(self):
+        '''Relay transfers in blocks since the last poll'''
+        head = self.w3h.eth.blockNumber
+        if self._next_block is None:
+            self._next_block = head + 1
+        if head < self._next_block:
+            return
+        deposits = list(self.deposits.scan(self._next_block, head))
+        requests = list(self.requests.scan(self._next_block, head))
+        self._next_block = head + 1
+        for event in deposits:
+            self.relay_deposit(event)
+        for event in requests:
+            self.relay_request(event)
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.poll()
+            except Exception: # pylint: disable=broad-except
+                LOG.exception("Local validator failed to relay")
+
+    def start(self):
+        '''Relay in a background thread'''
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='LocalValidator', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        '''Stop background thread'''
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+
+class LocalChain:
+    '''
+    Dev chain with a deployed bridge, see module docstring.
+    Accounts: keys[0] deploys and owns contracts, keys[1] is the validator, the other
+    keys (user_keys) hold tokens on both sides.
+    '''
+    ACCOUNTS = 10
+    STARTUP_TIMEOUT = 60
+
+    def __init__(self, url=None, accounts=ACCOUNTS):
+        self.url = url or os.environ.get('LOCAL_CHAIN_URL')
+        self.keys = [_account_key(idx) for idx in range(accounts)]
+        self.process = None
+        self.w3h = None
+        self.validator = None
+        self.bridge_config = None
+        self._helpers = []
+
+    @property
+    def owner_key(self):
+        '''Key of contracts deployer and owner'''
+        return self.keys[0]
+
+    @property
+    def validator_key(self):
+        '''Key of the only bridge validator'''
+        return self.keys[1]
+
+    @property
+    def user_keys(self):
+        '''Keys of users holding tokens'''
+        return self.keys[2:]
+
+    def address(self, key):
+        '''Address of private key'''
+        return Account.privateKeyToAccount(key).address
+
+    def start(self):
+        '''Start ganache-cli unless attached to a running node'''
+        if self.url is None:
+            ganache = GANACHE_BIN if os.path.exists(GANACHE_BIN) else shutil.which('ganache-cli')
+            if ganache is None:
+                raise FileNotFoundError("ganache-cli not found, run npm install in contracts/ "
+                                        "or set LOCAL_CHAIN_URL")
+            port = _free_port()
+            cmd = [ganache, '--port', str(port), '--gasLimit', '10000000',
+                   '--noVMErrorsOnRPCResponse']
+            cmd.extend('--account=%s,%s' % (key, ACCOUNT_BALANCE) for key in self.keys)
+            self.process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL,
+                                            stderr=subprocess.DEVNULL)
+            self.url = 'http://127.0.0.1:%s' % port
+        self.w3h = self.w3helper()
+        deadline = time.time() + self.STARTUP_TIMEOUT
+        while True:
+            try:
+                self.w3h.eth.blockNumber
+                break
+            except Exception: # pylint: disable=broad-except
+                if time.time() > deadline:
+                    self.stop()
+                    raise TimeoutError("Local chain %s not ready in %ss"
+                                       % (self.url, self.STARTUP_TIMEOUT))
+                time.sleep(0.2)
+        if self.process is None:
+            self._fund_accounts()
+        LOG.info("Local chain at %s", self.url)
+        return self
+
+    def _fund_accounts(self):
+        # Accounts of an external dev node are funded by its first unlocked account
+        funder = self.w3h.call_api('eth_accounts')[0]
+        for key in self.keys:
+            address = self.address(key)
+            if self.w3h.get_balance(address) < ACCOUNT_BALANCE // 2:
+                tx_hash = self.w3h.call_api('eth_sendTransaction', {
+                    'from': funder, 'to': address, 'value': hex(ACCOUNT_BALANCE)})
+                self.w3h.wait_receipt_for_transaction(tx_hash)
+
+    def stop(self):
+        '''Stop validator and ganache-cli'''
+        if self.validator is not None:
+            self.validator.stop()
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+
+    def w3helper(self):
+        '''W3Helper of the local chain, its local state is reset on revert()'''
+        w3h = W3Helper(self.url, confirmations=0)
+        self._helpers.append(w3h)
+        return w3h
+
+    def deploy(self, name, ctor_types=(), args=()):
+        '''Deploy contract name of the truffle build, returns its address'''
+        artifact = load_artifact(name)
+        data = artifact['bytecode']
+        if ctor_types:
+            data += eth_abi.encode_abi(list(ctor_types), list(args)).hex()
+        addr = self.address(self.owner_key)
+        tx = {
+            "value": 0,
+            "data": data,
+            "from": addr,
+            "gasPrice": self.w3h.gas_price(),
+        }
+        tx["gas"] = self.w3h.estimate_gas(tx)
+        tx["nonce"] = self.w3h.allocate_nonce(addr)
+        receipt = self.w3h.execute_and_wait_for_transaction(self.owner_key, tx)
+        LOG.debug("Deployed %s at %s", name, receipt['contractAddress'])
+        return receipt['contractAddress']
+
+    def _deploy_proxied(self, name):
+        proxy = EternalStorageProxy(self.w3h, self.deploy('EternalStorageProxy'))
+        proxy.upgrade_to(self.owner_key, 1, self.deploy(name))
+        return BridgeSetup(self.w3h, proxy.contract_addr)
+
+    # pylint: disable=too-many-locals
+    def deploy_bridge(self, decimals=18, fee_percent=0, user_balance=1000):
+        '''
+        Deploy validators, home bridge with ERC677BridgeToken and foreign bridge with
+        an ERC677BridgeToken as its ERC20, give user_balance tokens to each user on both
+        sides and start the validator.
+        :returns: config in the format of env.json entries
+        '''
+        owner = self.address(self.owner_key)
+        unit = 10 ** decimals
+        validators = self._deploy_proxied('BridgeValidators')
+        validators.init_validators(self.owner_key, 1, [self.address(self.validator_key)], owner)
+
+        home_token = ERC677(self.w3h, self.deploy('ERC677BridgeToken',
+                                                  ('string', 'string', 'uint8'),
+                                                  ('Home Token', 'HT', decimals)))
+        foreign_token = ERC677(self.w3h, self.deploy('ERC677BridgeToken',
+                                                     ('string', 'string', 'uint8'),
+                                                     ('Foreign Token', 'FT', decimals)))
+        home = self._deploy_proxied('HomeBridgeErcToErc')
+        home.init_home(self.owner_key, validators.contract_addr, 10 ** 6 * unit, 10 ** 5 * unit,
+                       unit, 1, 1, home_token.contract_addr, 10 ** 6 * unit, 10 ** 5 * unit,
+                       owner, fee_percent)
+        foreign = self._deploy_proxied('ForeignBridgeErcToErc')
+        foreign.init_foreign(self.owner_key, validators.contract_addr,
+                             foreign_token.contract_addr, 1, 1, 10 ** 5 * unit, 10 ** 6 * unit,
+                             10 ** 5 * unit, owner, fee_percent)
+
+        for key in self.user_keys:
+            home_token.mint(self.owner_key, self.address(key), user_balance * unit)
+            foreign_token.mint(self.owner_key, self.address(key), user_balance * unit)
+        foreign_token.mint(self.owner_key, foreign.contract_addr, 10 ** 6 * unit)
+        home_token.set_bridge_contract(self.owner_key, home.contract_addr)
+        home_token.transfer_ownership(self.owner_key, home.contract_addr)
+
+        w3h = self.w3helper()
+        self.validator = LocalValidator(w3h, self.validator_key,
+                                        Bridge(w3h, home.contract_addr),
+                                        Bridge(w3h, foreign.contract_addr),
+                                        ERC20(w3h, foreign_token.contract_addr))
+        self.validator.start()
+        self.bridge_config = {
+            'h_rpc': self.url,
+            'h_bridge': home.contract_addr,
+            'f_rpc': self.url,
+            'f_bridge': foreign.contract_addr,
+        }
+        return self.bridge_config
+
+    def snapshot(self):
+        '''Take snapshot, returns its id for revert()'''
+        return self.w3h.call_api('evm_snapshot')
+
+    def revert(self, snapshot_id):
+        '''Revert to snapshot, local state of helpers and validator is reset'''
+        self.w3h.call_api('evm_revert', snapshot_id)
+        for w3h in self._helpers:
+            w3h.reset_state()
+        if self.validator is not None:
+            self.validator.reset()
+
+
+_LOCAL_CHAIN = {}
+
+
+def get_local_chain():
+    '''LocalChain of the process with a deployed bridge, started on first use'''
+    if 'chain' not in _LOCAL_CHAIN:
+        chain = LocalChain().start()
+        chain.deploy_bridge()
+        _LOCAL_CHAIN['chain'] = chain
+    return _LOCAL_CHAIN['chain']
@@ -1,35 +1,262 @@
 '''Process Pool'''
 
+import collections
+import functools
 import multiprocessing
+import pickle
+import queue
+import threading
+import time
+import traceback
+
+
+def _run_task(func, args, kwargs):
+    '''Run func in worker, exceptions are returned with their traceback'''
+    started = time.time()
+    try:
+        return True, func(*args, **kwargs), None, started, time.time()
+    except Exception as err: # pylint: disable=broad-except
+        trace = traceback.format_exc()
+        try:
+            pickle.dumps(err)
+        except Exception: # pylint: disable=broad-except
+            err = RuntimeError(repr(err))
+        return False, err, trace, started, time.time()
+
+
+class TaskResult:
+    '''Outcome of one task, times are time.time() of the parent and worker'''
+    __slots__ = ('index', 'value', 'error', 'traceback', 'submitted', 'started', 'finished',
+                 'deadline')
+
+    def __init__(self, index, submitted, deadline=None):
+        self.index = index
+        self.value = None
+        self.error = None
+        self.traceback = None
+        self.submitted = submitted
+        self.started = None
+        self.finished = None
+        self.deadline = deadline
+
+    def __repr__(self):
+        if self.error is not None:
+            return 'TaskResult(%s, error=%r)' % (self.index, self.error)
+        return 'TaskResult(%s, %r, %.3fs)' % (self.index, self.value, self.duration or 0)
+
+    @property
+    def ok(self):
+        '''Whether the task returned'''
+        return self.error is None
+
+    @property
+    def duration(self):
+        '''Seconds the task ran in worker'''
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+    @property
+    def queued(self):
+        '''Seconds between submission and start'''
+        if self.started is None:
+            return None
+        return self.started - self.submitted
+
+    def get(self):
+        '''Value of the task, or raise its error'''
+        if self.error is not None:
+            raise self.error
+        return self.value
+
 
 class ProcessPool:
-    '''Process Pool'''
-    def __init__(self, processes=5):
-        self.pool = multiprocessing.Pool(processes)
-        self.results = []
+    '''
+    Process Pool
+    initializer(*initargs) is called once in each worker process, e.g. to build
+    clients reused by all tasks of the worker.
+    At most max_pending tasks are submitted and not completed, add_task() blocks
+    until a running task completes or times out. Results are streamed by
+    as_completed(), the pool stays usable for next batches until close().
+    task_timeout is counted from submission, a timed out task is reported with
+    TimeoutError and its late result is dropped (the worker is not interrupted).
+    '''
+    # pylint: disable=too-many-arguments
+    def __init__(self, processes=5, initializer=None, initargs=(), max_pending=None,
+                 task_timeout=None):
+        self.pool = multiprocessing.Pool(processes, initializer, initargs)
+        self.max_pending = max_pending or processes * 2
+        self.task_timeout = task_timeout
+        self._slots = threading.Semaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._done = queue.Queue()
+        self._inflight = {}
+        # Completed tasks whose slot is released, results wait in _done
+        self._finished = set()
+        # Timed out tasks not yielded yet
+        self._expired = collections.deque()
+        self._index = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.close()
+        else:
+            self.terminate()
+
+    def __len__(self):
+        return len(self._inflight)
+
+    def _next_deadline(self):
+        with self._lock:
+            deadlines = [task.deadline for task in self._inflight.values()
+                         if task.deadline is not None]
+        return min(deadlines) if deadlines else None
+
+    def _acquire_slot(self):
+        # Slots of hung tasks are only freed by _expire, which must run while waiting
+        while True:
+            deadline = self._next_deadline()
+            wait = None if deadline is None else max(0, deadline - time.time())
+            if self._slots.acquire(timeout=wait):
+                return
+            self._expire(time.time())
 
     def add_task(self, func, *args, **kwargs):
-        '''Add task to pool'''
-        self.results.append(self.pool.apply_async(func, args, kwargs))
+        '''Add task to pool, returns its index'''
+        self._acquire_slot()
+        with self._lock:
+            index = self._index
+            self._index += 1
+            now = time.time()
+            deadline = now + self.task_timeout if self.task_timeout else None
+            self._inflight[index] = TaskResult(index, now, deadline)
+        self.pool.apply_async(_run_task, (func, args, kwargs),
+                              callback=functools.partial(self._on_done, index),
+                              error_callback=functools.partial(self._on_error, index))
+        return index
+
+    def _on_done(self, index, outcome):
+        with self._lock:
+            if index not in self._inflight:
+                # Timed out
+                return
+            self._finished.add(index)
+        self._slots.release()
+        self._done.put((index, outcome))
+
+    def _on_error(self, index, err):
+        # Task or its result could not be pickled
+        self._on_done(index, (False, err, None, None, time.time()))
+
+    def _complete(self, index, outcome):
+        with self._lock:
+            task = self._inflight.pop(index, None)
+            self._finished.discard(index)
+        if task is None:
+            return None
+        success, value, task.traceback, task.started, task.finished = outcome
+        if success:
+            task.value = value
+        else:
+            task.error = value
+        return task
+
+    def _expire(self, now):
+        '''Move tasks past their deadline to _expired and release their slots'''
+        expired = []
+        with self._lock:
+            for index, task in list(self._inflight.items()):
+                if (task.deadline is not None and task.deadline <= now
+                        and index not in self._finished):
+                    del self._inflight[index]
+                    task.error = TimeoutError("Task %s timed out in %ss"
+                                              % (index, self.task_timeout))
+                    task.finished = now
+                    expired.append(task)
+        self._expired.extend(expired)
+        for _ in expired:
+            self._slots.release()
+
+    def _pop_expired(self):
+        while self._expired:
+            yield self._expired.popleft()
 
-    def wait_completion(self):
-        '''Wait for completion of all tasks'''
+    def ready(self):
+        '''Yield TaskResult of tasks already completed, without blocking'''
+        while True:
+            try:
+                index, outcome = self._done.get_nowait()
+            except queue.Empty:
+                break
+            task = self._complete(index, outcome)
+            if task is not None:
+                yield task
+        self._expire(time.time())
+        for task in self._pop_expired():
+            yield task
+
+    def as_completed(self, timeout=None):
+        '''
+        Yield TaskResult of all submitted tasks as they complete.
+        Raises TimeoutError if tasks are left after timeout seconds.
+        '''
+        deadline = None if timeout is None else time.time() + timeout
+        for task in self._pop_expired():
+            yield task
+        while self._inflight:
+            now = time.time()
+            waits = [wait for wait in (self._next_deadline(), deadline) if wait is not None]
+            wait = max(0, min(waits) - now) if waits else None
+            try:
+                index, outcome = self._done.get(timeout=wait)
+            except queue.Empty:
+                now = time.time()
+                self._expire(now)
+                for task in self._pop_expired():
+                    yield task
+                if deadline is not None and now >= deadline and self._inflight:
+                    raise TimeoutError("%s tasks not completed in %ss"
+                                       % (len(self._inflight), timeout))
+                continue
+            task = self._complete(index, outcome)
+            if task is not None:
+                yield task
+
+    def stream(self, func, iterable, timeout=None):
+        '''
+        Run func(*args) for each args tuple of iterable, yield TaskResult as they
+        complete. Submission is throttled by max_pending, so iterable can be long.
+        '''
+        for args in iterable:
+            self.add_task(func, *args)
+            for task in self.ready():
+                yield task
+        for task in self.as_completed(timeout):
+            yield task
+
+    def wait_completion(self, timeout=None):
+        '''
+        Wait for completion of all submitted tasks.
+        :returns: [(value, None) or (None, exception), ...] in submission order
+        '''
+        tasks = sorted(self.as_completed(timeout), key=lambda task: task.index)
+        return [(task.value, None) if task.ok else (None, task.error) for task in tasks]
+
+    def close(self):
+        '''Wait for running tasks and stop workers'''
         self.pool.close()
         self.pool.join()
-        result = []
 
-        for task_res in self.results:
-            if task_res.ready():
-                if task_res.successful():
-                    result.append((task_res.get(), None))
-                else:
-                    result.append((None, "Error"))
-
-        return result
+    def terminate(self):
+        '''Stop workers now'''
+        self.pool.terminate()
+        self.pool.join()
 
 if __name__ == "__main__":
     import random
-    import time
 
     def _task_method(idx):
         rnd = random.randint(1, 10)
@@ -38,9 +265,6 @@ if __name__ == "__main__":
             raise Exception(rnd)
         return idx
 
-    POOL = ProcessPool(5)
-    for i in range(10):
-        POOL.add_task(_task_method, i)
-
-    for res in POOL.wait_completion():
-        print(res)
\ No newline at end of file
+    with ProcessPool(5, task_timeout=8) as POOL:
+        for res in POOL.stream(_task_method, ((i,) for i in range(10))):
+            print(res, res.duration, res.traceback)
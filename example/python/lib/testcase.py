@@ -7,9 +7,13 @@ import argparse
 import logging
 import traceback
 import json
+import xml.etree.ElementTree as ET
 
 from pathlib import Path
 
+from example.python.lib.processpool import ProcessPool
+from example.python.utils.metrics import METRICS
+
 PY_HELPER_DIR = Path(os.path.dirname(os.path.realpath(__file__)))
 PROJECT_ROOT_DIR = PY_HELPER_DIR.parent.parent
 LOGS_DIR = PROJECT_ROOT_DIR.joinpath("log")
@@ -37,36 +41,109 @@ def setup_logging(filename, log_level="INFO"):
     logging.getLogger().setLevel(log_level)
 
 
+class _ErrorRecord:
+    '''Stands for the test of an error outside test methods, e.g. of a test worker'''
+
+    def __init__(self, description):
+        self.description = description
+
+    def __str__(self):
+        return self.description
+
+
+def _test_name(test):
+    if hasattr(test, '_testMethodName'):
+        return getattr(test, '_testMethodName')
+    return str(test)
+
+
 class ThunderTestResult(unittest.result.TestResult):
     """unittest Result"""
+    # Outcome lists, in the order of records()
+    OUTCOMES = ('successes', 'failures', 'errors', 'skipped', 'expectedFailures',
+                'unexpectedSuccesses')
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.successes = []
+        self.durations = {}
+        self._started = {}
         self.log = logging.getLogger('ThunderTestResult')
 
     def startTest(self, test):
         super().startTest(test)
+        self._started[_test_name(test)] = time.time()
         self.log.info("###### Start to run -%s- ######", test)
 
     def stopTest(self, test):
+        name = _test_name(test)
+        if name in self._started:
+            self.durations[name] = time.time() - self._started.pop(name)
         self.log.info("###### Stop to run -%s- ######", test)
         super().stopTest(test)
 
     def addSuccess(self, test):
         self.successes.append((test, ''))
 
+    def records(self):
+        '''Picklable [(outcome, test name, detail, duration)], see merge()'''
+        ret = []
+        for outcome in self.OUTCOMES:
+            for item in getattr(self, outcome):
+                test, detail = item if isinstance(item, tuple) else (item, '')
+                name = _test_name(test)
+                ret.append((outcome, name, detail, self.durations.get(name)))
+        return ret
+
+    def merge(self, testclass, records):
+        '''Add records() of a result of another process'''
+        names = unittest.loader.getTestCaseNames(testclass, "test_")
+        for outcome, name, detail, duration in records:
+            test = testclass(name) if name in names else _ErrorRecord(name)
+            items = getattr(self, outcome)
+            items.append(test if outcome == 'unexpectedSuccesses' else (test, detail))
+            if duration is not None:
+                self.durations[name] = duration
+            if name in names:
+                self.testsRun += 1
+
+    def junit_xml(self, suite_name):
+        '''Results as JUnit XML string'''
+        suite = ET.Element('testsuite', name=suite_name)
+        counts = dict.fromkeys(('tests', 'failures', 'errors', 'skipped'), 0)
+        for outcome, name, detail, duration in self.records():
+            case = ET.SubElement(suite, 'testcase', classname=suite_name, name=name,
+                                 time='%.3f' % (duration or 0))
+            counts['tests'] += 1
+            if outcome in ('failures', 'unexpectedSuccesses'):
+                counts['failures'] += 1
+                message = detail.strip().splitlines()[-1] if detail.strip() else outcome
+                ET.SubElement(case, 'failure', message=message).text = detail
+            elif outcome == 'errors':
+                counts['errors'] += 1
+                message = detail.strip().splitlines()[-1] if detail.strip() else outcome
+                ET.SubElement(case, 'error', message=message).text = detail
+            elif outcome == 'skipped':
+                counts['skipped'] += 1
+                ET.SubElement(case, 'skipped', message=detail)
+        for key, value in counts.items():
+            suite.set(key, str(value))
+        suite.set('time', '%.3f' % sum(self.durations.values()))
+        return ET.tostring(suite, encoding='unicode')
+
     def summary(self):
         '''Summarize tests results'''
-        def _get_name(arg):
-            if hasattr(arg[0], '_testMethodName'):
-                return getattr(arg[0], '_testMethodName')
-            else:
-                return str(arg[0])
-        get_names = lambda x: list(map(_get_name, x))
+        get_names = lambda x: [_test_name(item[0] if isinstance(item, tuple) else item)
+                               for item in x]
         self.log.info("Successes: %s", get_names(self.successes))
         self.log.info("Failures: %s", get_names(self.failures))
         self.log.info("Errors: %s", get_names(self.errors))
         self.log.info("Skipped: %s", get_names(self.skipped))
+        self.log.info("Durations: %s", ', '.join(
+            '%s=%.1fs' % (name, duration) for name, duration in
+            sorted(self.durations.items(), key=lambda item: -item[1])))
+        if METRICS.enabled:
+            self.log.info("RPC metrics:\n%s", '\n'.join(METRICS.summary()))
 
         return len(self.failures) + len(self.errors)
 
@@ -90,6 +167,49 @@ def log_exceptions(func):
     return _wrapper
 
 
+def _init_test_worker(testclass, args):
+    testclass.ARGS = args
+
+
+def _run_tests(testclass, names):
+    '''Run test methods names of testclass in a worker, returns ThunderTestResult.records()'''
+    result = ThunderTestResult(sys.stdout)
+    unittest.suite.TestSuite(map(testclass, names))(result)
+    return result.records()
+
+
+def parse_shard(shard):
+    '''"i/n" (i from 1) to (i, n)'''
+    try:
+        index, total = (int(value) for value in shard.split('/'))
+    except ValueError as err:
+        raise argparse.ArgumentTypeError("Invalid shard '%s', expect i/n" % shard) from err
+    if not 1 <= index <= total:
+        raise argparse.ArgumentTypeError("Invalid shard '%s', expect 1 <= i <= n" % shard)
+    return index, total
+
+
+def run_parallel(testclass, testcase_names, jobs):
+    '''
+    Run testcase_names in jobs worker processes, each runs its share of the tests in one
+    suite (setUpClass / tearDownClass once per worker). Returns merged ThunderTestResult.
+    '''
+    groups = [testcase_names[idx::jobs] for idx in range(jobs)]
+    result = ThunderTestResult(sys.stdout)
+    with ProcessPool(jobs, _init_test_worker, (testclass, testclass.ARGS)) as pool:
+        for group in groups:
+            if group:
+                pool.add_task(_run_tests, testclass, group)
+        for task in pool.as_completed():
+            if task.ok:
+                result.merge(testclass, task.value)
+            else:
+                result.log.error("Test worker failed:\n%s", task.traceback)
+                result.errors.append((_ErrorRecord('worker %s' % task.index),
+                                      task.traceback or repr(task.error)))
+    return result
+
+
 def testmain(testclass, *methods):
     '''Main entry for test'''
     return testcli(testclass, None, *methods)
@@ -104,6 +224,13 @@ def testcli(testclass, argv, *methods):
     parser.add_argument('-x', action='append', help="Designate test cases which not to run")
     parser.add_argument('-l', action='store_true', help="List available test cases")
     parser.add_argument('-d', default="INFO", help="Log level: INFO, DEBUG")
+    parser.add_argument('-m', action='store_true',
+                        help="Record RPC metrics, saved in Prometheus text format in log dir")
+    parser.add_argument('-j', type=int, default=1,
+                        help="Run test cases in N worker processes")
+    parser.add_argument('--shard', type=parse_shard,
+                        help="Run shard i of n (i from 1), test cases are split round-robin")
+    parser.add_argument('--junit', help="Write a JUnit XML report to this path")
 
     args, unknown_args = parser.parse_known_args(argv)
 
@@ -114,9 +241,11 @@ def testcli(testclass, argv, *methods):
         if not testclass.ARGS.o:
             testclass.ARGS.o = []
 
-    setup_logging("%s_%s_log.txt" % (class_name, time.strftime("%Y-%m-%d_%H-%M")), args.d)
+    run_name = "%s_%s" % (class_name, time.strftime("%Y-%m-%d_%H-%M"))
+    setup_logging("%s_log.txt" % run_name, args.d)
+    if args.m:
+        METRICS.enable()
     log = logging.getLogger(class_name)
-    tests = None
     if args.l:
         testcase_names = unittest.loader.getTestCaseNames(testclass, "test_")
         #print(testcaseNames)
@@ -141,6 +270,10 @@ def testcli(testclass, argv, *methods):
                 testcase_names.append(testcase_name)
     else:
         testcase_names.extend(existed_names)
+    if args.shard:
+        index, total = args.shard
+        testcase_names = testcase_names[index - 1::total]
+        log.info("## Shard %s/%s: %s", index, total, testcase_names)
     if not testcase_names:
         log.info("## No test to run")
         return 0
@@ -151,11 +284,22 @@ def testcli(testclass, argv, *methods):
     for method_name in ['setUp', 'setUpClass', 'tearDown', 'tearDownClass']:
         orig_method = getattr(testclass, method_name)
         setattr(testclass, method_name, log_exceptions(orig_method))
-    tests = unittest.suite.TestSuite(map(testclass, testcase_names))
 
-    result = ThunderTestResult(sys.stdout)
-    tests(result)
+    if args.j > 1:
+        result = run_parallel(testclass, testcase_names, min(args.j, len(testcase_names)))
+    else:
+        tests = unittest.suite.TestSuite(map(testclass, testcase_names))
+        result = ThunderTestResult(sys.stdout)
+        tests(result)
     nr_fail_error = result.summary()
+    if args.junit:
+        with open(args.junit, 'w', encoding='utf-8') as file:
+            file.write(result.junit_xml(class_name))
+        log.info("JUnit report saved in %s", args.junit)
+    if METRICS.enabled:
+        metrics_path = LOGS_DIR.joinpath("%s_metrics.prom" % run_name)
+        metrics_path.write_text(METRICS.prometheus())
+        log.info("RPC metrics saved in %s", metrics_path)
     if nr_fail_error == 0:
         log.info("## Test %s: PASSED", class_name)
     else:
@@ -164,9 +308,13 @@ def testcli(testclass, argv, *methods):
 
 
 class TestBase(unittest.TestCase):
-    """TestBase for all tests"""
+    """TestBase for all tests
+    With --local, tests run against a LocalChain (see localchain.py) which is reverted
+    after each test method.
+    """
     LOG = logging.getLogger('TestBase')
     ARGS = None
+    LOCAL_CHAIN = None
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -178,18 +326,33 @@ class TestBase(unittest.TestCase):
         parser = argparse.ArgumentParser()
         parser.add_argument('--loop', help='Loop times for a test with @TestBase.loop', default='1')
         parser.add_argument('-o', action='append', help="options parameters")
+        parser.add_argument('--local', action='store_true',
+                            help="Run on a local chain with a deployed bridge, no RPC endpoints")
 
         return parser
 
     def setUp(self):
-        pass
+        if self.LOCAL_CHAIN:
+            self._snapshot = self.LOCAL_CHAIN.snapshot()
 
     def tearDown(self):
-        pass
+        if self.LOCAL_CHAIN:
+            self.LOCAL_CHAIN.revert(self._snapshot)
 
     @classmethod
     def setUpClass(cls):
-        pass
+        if getattr(cls.ARGS, 'local', False):
+            # Imported here, so tests without --local don't need the contracts build
+            from example.python.lib.localchain import get_local_chain
+            cls.LOCAL_CHAIN = get_local_chain()
+
+    @classmethod
+    def w3helper(cls, endpoint):
+        '''W3Helper of endpoint, or of the local chain with --local'''
+        if cls.LOCAL_CHAIN:
+            return cls.LOCAL_CHAIN.w3helper()
+        from example.python.utils.w3helper import W3Helper
+        return W3Helper(endpoint)
 
     @classmethod
     def tearDownClass(cls):
@@ -0,0 +1,39 @@
+import asyncio
+import inspect
+import unittest
+
+from example.python.utils import aiow3helper
+from example.python.utils.aiow3helper import AsyncSmartContract, AsyncW3Helper, close_clients
+from example.python.utils.w3helper import SmartContract
+
+URL = 'http://127.0.0.1:8545'
+
+
+class TestAsyncSmartContract(unittest.TestCase):
+
+    def test_same_signatures_as_blocking_contract(self):
+        for name in ('get_logs', 'watch'):
+            self.assertEqual(
+                list(inspect.signature(getattr(AsyncSmartContract, name)).parameters),
+                list(inspect.signature(getattr(SmartContract, name)).parameters), name)
+
+
+@unittest.skipIf(aiow3helper.aiohttp is None, 'needs aiohttp')
+class TestSharedClient(unittest.TestCase):
+
+    def test_close_keeps_client_of_other_helpers(self):
+        async def run():
+            first, second = AsyncW3Helper(URL), AsyncW3Helper(URL)
+            client = first.client
+            self.assertIs(second.client, client)
+            await first.close()
+            self.assertFalse(second.client.closed)
+            self.assertIs(second.client, client)
+            await close_clients()
+            return client
+
+        self.assertTrue(asyncio.run(run()).closed)
+
+
+if __name__ == '__main__':
+    unittest.main()
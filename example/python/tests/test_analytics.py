@@ -0,0 +1,141 @@
+import json
+import unittest
+from unittest import mock
+
+from example.python import bridge_analytics
+from example.python.bridge_analytics import (
+    ChainAnalytics, EventArrays, cross_check, exact_daily_totals, np)
+from example.python.utils.bridge import SECONDS_PER_DAY
+from example.python.utils.index import EventIndex, _to_column
+
+BRIDGE = '0x' + 'ab' * 20
+USER = '0x' + 'cd' * 20
+LIMITS = {'daily_limit': 100.0, 'exec_daily_limit': 50.0, 'min_per_tx': 1.0,
+          'max_per_tx': 40.0, 'fee_percent': 100}
+
+
+def _arrays(events):
+    '''EventArrays of [(day, value), ...]'''
+    return EventArrays(np.array([day for day, _ in events], dtype=np.int64),
+                       np.array([value for _, value in events], dtype=np.float64))
+
+
+@unittest.skipIf(np is None, 'numpy is not installed')
+class TestChainAnalytics(unittest.TestCase):
+
+    def setUp(self):
+        # days 10 ~ 13, nothing spent on day 12
+        spent = _arrays([(10, 40.0), (10, 60.0), (11, 1.0), (13, 20.0)])
+        executed = _arrays([(11, 30.0), (13, 50.0)])
+        self.analytics = ChainAnalytics('home', 10, 13, spent, executed, LIMITS)
+
+    def test_daily_vectors(self):
+        analytics = self.analytics
+        self.assertEqual(analytics.days.tolist(), [10, 11, 12, 13])
+        self.assertEqual(analytics.spent_volume.tolist(), [100.0, 1.0, 0.0, 20.0])
+        self.assertEqual(analytics.spent_count.tolist(), [2, 1, 0, 1])
+        self.assertEqual(analytics.executed_volume.tolist(), [0.0, 30.0, 0.0, 50.0])
+        self.assertEqual(analytics.executed_count.tolist(), [0, 1, 0, 1])
+        self.assertEqual(analytics.fees.tolist(), [0.0, 0.3, 0.0, 0.5])
+        self.assertEqual(analytics.spent_headroom.tolist(), [0.0, 99.0, 100.0, 80.0])
+        self.assertEqual(analytics.executed_headroom.tolist(), [50.0, 20.0, 50.0, 0.0])
+
+    def test_days_over(self):
+        self.assertEqual(self.analytics.days_over([0, 10, 99.9, 100]).tolist(), [3, 2, 1, 0])
+        self.assertEqual(self.analytics.days_over([40], executed=True).tolist(), [1])
+
+    def test_size_distribution(self):
+        sizes = self.analytics.size_distribution(percentiles=(50, 100))
+        self.assertEqual(sizes['count'], 4)
+        self.assertEqual((sizes['p50'], sizes['p100']), (30.0, 60.0))
+        self.assertEqual(sizes['at_max_per_tx'], 0.5)
+        self.assertEqual(sizes['at_min_per_tx'], 0.25)
+
+    def test_summary_and_daily(self):
+        summary = self.analytics.summary()
+        self.assertEqual((summary['days'], summary['requests']), (4, 4))
+        self.assertEqual((summary['spent'], summary['executed']), (121.0, 80.0))
+        self.assertAlmostEqual(summary['fees'], 0.8)
+        self.assertEqual((summary['spent_peak'], summary['executed_peak']), (100.0, 50.0))
+        self.assertEqual(summary['min_spent_headroom'], 0.0)
+        self.assertEqual(summary['days_over_90pct_limit'], 1)
+        rows = self.analytics.daily()
+        self.assertEqual(rows[0]['day'], '1970-01-11')
+        self.assertEqual([row['requests'] for row in rows], [2, 1, 0, 1])
+
+    def test_empty_range(self):
+        analytics = ChainAnalytics('home', 10, 11, _arrays([]), _arrays([]), LIMITS)
+        self.assertEqual(analytics.spent_volume.tolist(), [0.0, 0.0])
+        self.assertEqual(analytics.size_distribution(), {'count': 0})
+        self.assertEqual(analytics.summary()['requests'], 0)
+
+
+class FakeMulticall:
+    '''Multicall calling each getter on execute'''
+
+    def __init__(self, w3h):
+        self.calls = []
+
+    def add(self, getter, *args):
+        self.calls.append((getter, args))
+
+    def execute(self):
+        return [getter(*args) for getter, args in self.calls]
+
+
+class FakeBridge:
+    '''Bridge with daily totals kept in dicts'''
+
+    def __init__(self, spent, executed):
+        self.contract_addr = BRIDGE
+        self.w3h = None
+        self.spent = spent
+        self.executed = executed
+
+    def total_spent_per_day(self, day):
+        return self.spent.get(day, 0)
+
+    def total_exec_per_day(self, day):
+        return self.executed.get(day, 0)
+
+
+class TestCrossCheck(unittest.TestCase):
+
+    def setUp(self):
+        self.index = EventIndex(':memory:')
+        rows = [('UserRequestForSignature', '0x01', 10, 2 ** 200),
+                ('UserRequestForSignature', '0x02', 10, 1),
+                ('AffirmationCompleted', '0x03', 11, 3)]
+        for name, tx_hash, day, value in rows:
+            self.index.conn.execute(
+                'INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                ('home', BRIDGE, name, day, tx_hash, 0, day * SECONDS_PER_DAY, day,
+                 USER, _to_column(BRIDGE), _to_column(value), None, json.dumps([])))
+        patcher = mock.patch.object(bridge_analytics, 'Multicall', FakeMulticall)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.index.close()
+
+    def test_exact_daily_totals(self):
+        self.assertEqual(exact_daily_totals(self.index, 'home', 'UserRequestForSignature', 9, 12),
+                         {10: 2 ** 200 + 1})
+        self.assertEqual(exact_daily_totals(self.index, 'home', 'UserRequestForSignature', 11, 12),
+                         {})
+
+    def test_mismatches(self):
+        bridge = FakeBridge({10: 2 ** 200 + 1}, {11: 4})
+        self.assertEqual(cross_check(self.index, 'home', bridge, 10, 12),
+                         [(11, 'executed', 3, 4)])
+        bridge = FakeBridge({10: 2 ** 200 + 1}, {11: 3})
+        self.assertEqual(cross_check(self.index, 'home', bridge, 10, 12), [])
+
+    def test_totals_not_kept_are_skipped(self):
+        bridge = FakeBridge({}, {11: 3, 12: 1})
+        self.assertEqual(cross_check(self.index, 'home', bridge, 10, 12),
+                         [(12, 'executed', 0, 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
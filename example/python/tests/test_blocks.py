@@ -0,0 +1,91 @@
+import unittest
+
+from example.python.utils.blocks import BlockHistory, BlockRecord
+
+
+def _history(blocks, capacity=BlockHistory.CAPACITY):
+    '''BlockHistory of (number, timestamp, tx_count) with gas used 50 of limit 100'''
+    history = BlockHistory(capacity)
+    for number, timestamp, tx_count in blocks:
+        history.append(number, timestamp, tx_count, 50, 100, seen=timestamp + 0.5)
+    return history
+
+
+class TestBlockHistory(unittest.TestCase):
+
+    def test_invalid_capacity(self):
+        with self.assertRaises(ValueError):
+            BlockHistory(1)
+
+    def test_empty(self):
+        history = BlockHistory(4)
+        self.assertEqual(len(history), 0)
+        self.assertIsNone(history.last_number)
+        self.assertEqual(list(history), [])
+        stats = history.stats()
+        self.assertEqual(stats['blocks'], 0)
+        self.assertIsNone(stats['first_block'])
+        self.assertIsNone(stats['tps'])
+        self.assertIsNone(stats['gas_utilization'])
+
+    def test_ring_buffer_keeps_newest(self):
+        history = _history([(number, number * 2, number) for number in range(1, 6)], capacity=3)
+        self.assertEqual(len(history), 3)
+        self.assertEqual(history.last_number, 5)
+        self.assertEqual([record.number for record in history], [3, 4, 5])
+        self.assertEqual([record.number for record in history.last(2)], [4, 5])
+        self.assertEqual(len(history.last(10)), 3)
+        self.assertEqual(history.last(1)[0], BlockRecord(5, 10, 5, 50, 100, 10.5))
+
+    def test_append_block(self):
+        history = BlockHistory(2)
+        history.append_block({'number': 7, 'timestamp': 70, 'transactions': ['a', 'b'],
+                              'gasUsed': 21000, 'gasLimit': 8000000}, seen=71.0)
+        self.assertEqual(list(history), [BlockRecord(7, 70, 2, 21000, 8000000, 71.0)])
+
+    def test_stats(self):
+        history = _history([(1, 0, 10), (2, 2, 20), (3, 4, 30), (4, 6, 40)])
+        stats = history.stats()
+        self.assertEqual(stats['blocks'], 4)
+        self.assertEqual((stats['first_block'], stats['last_block']), (1, 4))
+        self.assertEqual(stats['transactions'], 100)
+        # transactions of the first block were sent before the measured interval
+        self.assertEqual(stats['tps'], 90 / 6)
+        self.assertEqual(stats['block_interval_avg'], 2)
+        self.assertEqual((stats['block_interval_min'], stats['block_interval_max']), (2, 2))
+        self.assertEqual(stats['gas_utilization'], 0.5)
+
+    def test_stats_window(self):
+        history = _history([(1, 0, 10), (2, 2, 20), (3, 5, 30)])
+        stats = history.stats(window=2)
+        self.assertEqual((stats['first_block'], stats['last_block']), (2, 3))
+        self.assertEqual(stats['transactions'], 50)
+        self.assertEqual(stats['tps'], 30 / 3)
+        self.assertEqual(stats['block_interval_avg'], 3)
+
+    def test_stats_of_missed_blocks_per_block(self):
+        history = _history([(1, 0, 1), (2, 2, 1), (5, 14, 1)])
+        stats = history.stats()
+        self.assertEqual(stats['block_interval_avg'], 14 / 4)
+        self.assertEqual(stats['block_interval_min'], 2)
+        self.assertEqual(stats['block_interval_max'], 4)
+
+    def test_stats_of_one_block(self):
+        stats = _history([(1, 0, 10)]).stats()
+        self.assertEqual(stats['blocks'], 1)
+        self.assertEqual(stats['transactions'], 10)
+        self.assertIsNone(stats['tps'])
+        self.assertIsNone(stats['block_interval_avg'])
+        self.assertEqual(stats['gas_utilization'], 0.5)
+
+    def test_clear(self):
+        history = _history([(1, 0, 1), (2, 2, 1)], capacity=2)
+        history.clear()
+        self.assertEqual(len(history), 0)
+        self.assertIsNone(history.last_number)
+        history.append(3, 4, 1, 0, 0)
+        self.assertEqual([record.number for record in history], [3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import types
+import unittest
+
+from example.python.utils.bridge import address_topic, block_at, percentile
+
+
+class TestPercentile(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertIsNone(percentile([], 50))
+
+    def test_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile(values, 100), 100)
+
+    def test_small_samples(self):
+        self.assertEqual(percentile([7], 0), 7)
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertEqual(percentile([1, 2, 3], 0), 1)
+        self.assertEqual(percentile([1, 2, 3], 50), 2)
+        self.assertEqual(percentile([1, 2, 3], 51), 2)
+        self.assertEqual(percentile([1, 2, 3], 67), 3)
+
+
+class TestAddressTopic(unittest.TestCase):
+
+    def test_left_padded_lower_case(self):
+        topic = address_topic('0x' + 'AbCd' * 10)
+        self.assertEqual(topic, '0x' + '0' * 24 + 'abcd' * 10)
+        self.assertEqual(len(topic), 66)
+
+
+class FakeW3Helper:
+    '''Blocks 0 ~ head with the given timestamps, counts getBlock calls'''
+
+    def __init__(self, timestamps):
+        self.timestamps = timestamps
+        self.eth = types.SimpleNamespace(blockNumber=len(timestamps) - 1)
+        self.calls = 0
+
+    def get_block(self, number, debug=True):
+        self.calls += 1
+        return {'number': number, 'timestamp': self.timestamps[number]}
+
+
+class TestBlockAt(unittest.TestCase):
+
+    def test_first_block_at_or_after(self):
+        w3h = FakeW3Helper([0, 10, 10, 20, 30, 45, 60, 61])
+        self.assertEqual(block_at(w3h, 10), 1)
+        self.assertEqual(block_at(w3h, 11), 3)
+        self.assertEqual(block_at(w3h, 0), 0)
+        self.assertEqual(block_at(w3h, 61), 7)
+        self.assertEqual(block_at(w3h, 45, head=4), 4)
+
+    def test_after_head(self):
+        w3h = FakeW3Helper([0, 10, 20])
+        self.assertEqual(block_at(w3h, 100), 2)
+
+    def test_binary_search(self):
+        w3h = FakeW3Helper(list(range(0, 10000, 10)))
+        self.assertEqual(block_at(w3h, 5555), 556)
+        self.assertLessEqual(w3h.calls, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import threading
+import unittest
+
+from example.python.utils.cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_get_counts_hits_and_misses(self):
+        cache = LRUCache(maxsize=2)
+        cache.put('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('b', 'default'), 'default')
+        self.assertEqual(cache.stats(), {'size': 1, 'maxsize': 2, 'hits': 1, 'misses': 2})
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.keys(), ['a', 'c'])
+        self.assertEqual(len(cache), 2)
+
+    def test_put_existing_key_marks_it_recent(self):
+        cache = LRUCache(maxsize=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.put('a', 10)
+        cache.put('c', 3)
+        self.assertEqual(cache.keys(), ['a', 'c'])
+        self.assertEqual(cache.get('a'), 10)
+
+    def test_pop_and_clear(self):
+        cache = LRUCache()
+        cache.put('a', 1)
+        cache.get('a')
+        self.assertEqual(cache.pop('a'), 1)
+        self.assertIsNone(cache.pop('a'))
+        cache.put('b', 2)
+        cache.clear()
+        self.assertEqual(cache.stats(), {'size': 0, 'maxsize': 4096, 'hits': 0, 'misses': 0})
+
+    def test_concurrent_puts_stay_bounded(self):
+        cache = LRUCache(maxsize=64)
+
+        def fill(offset):
+            for idx in range(1000):
+                cache.put(offset + idx, idx)
+                cache.get(offset + idx // 2)
+
+        threads = [threading.Thread(target=fill, args=(n * 1000,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(cache), 64)
+        self.assertEqual(cache.hits + cache.misses, 4000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import time
+import unittest
+
+from example.python.contracts import TransferTracker
+from example.python.utils.records import DecodedEvent
+
+RECIPIENT = '0x' + '22' * 20
+TX_A = b'\xaa' * 32
+TX_B = b'\xbb' * 32
+
+
+class FakeScanner:
+    '''Destination chain at block head, with the completion events of blocks'''
+
+    def __init__(self):
+        self.head_block = 0
+        self.events = []
+
+    def head(self):
+        return self.head_block
+
+    def scan(self, from_block, to_block):
+        return [event for event in self.events if from_block <= event.block_number <= to_block]
+
+    def complete(self, tx_hash, block_number):
+        self.events.append(DecodedEvent('RelayedMessage', 'RelayedMessage(address,uint256,bytes32)',
+                                        (RECIPIENT, 5, tx_hash), '0x' + '33' * 20,
+                                        block_number, b'\xdd' * 32, 0))
+        self.head_block = max(self.head_block, block_number)
+
+
+class FakeBridge:
+    contract_addr = '0x' + '33' * 20
+
+    def __init__(self, scanner):
+        self._scanner = scanner
+
+    @staticmethod
+    def descriptors():
+        return {'relayed_msg': None}
+
+    def scanner(self, events):
+        return self._scanner
+
+
+class TestTransferTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.scanner = FakeScanner()
+        self.tracker = TransferTracker.home_to_foreign(FakeBridge(self.scanner),
+                                                       poll_interval=0.01)
+
+    def test_completion_of_tracked_transfer(self):
+        sent_at = time.time() - 3
+        future = self.tracker.track(TX_A, sent_at=sent_at, from_block=1)
+        self.scanner.complete(TX_A, 2)
+        completion = future.result(5)
+        self.assertEqual(completion.tx_hash, TX_A)
+        self.assertEqual((completion.recipient, completion.value), (RECIPIENT, 5))
+        self.assertEqual(completion.dst_block, 2)
+        self.assertGreaterEqual(completion.latency, 3)
+        self.assertLess(completion.latency, 5)
+        self.assertEqual(len(self.tracker), 0)
+
+    def test_completion_seen_before_tracked(self):
+        self.scanner.complete(TX_B, 1)
+        future = self.tracker.track(TX_A, from_block=1)
+        self.scanner.complete(TX_A, 2)
+        future.result(5)
+        # TX_B completed while TX_A was tracked, its latency is measured from the time seen
+        completion = self.tracker.track('0x' + TX_B.hex(), sent_at=time.time() - 10,
+                                        from_block=3).result(0)
+        self.assertEqual(completion.tx_hash, TX_B)
+        self.assertGreaterEqual(completion.latency, 9)
+        self.assertLess(completion.latency, 11)
+
+    def test_seen_completion_is_not_before_sent(self):
+        self.scanner.complete(TX_B, 1)
+        self.scanner.complete(TX_A, 1)
+        self.tracker.track(TX_A, from_block=1).result(5)
+        completion = self.tracker.track(TX_B, sent_at=time.time() + 60).result(0)
+        self.assertEqual(completion.latency, 0)
+
+    def test_wait_timeout(self):
+        with self.assertRaises(TimeoutError):
+            self.tracker.wait(TX_A, timeout=0.05, from_block=1)
+        self.assertEqual(len(self.tracker), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import unittest
+
+from hexbytes import HexBytes
+
+from example.python.utils.gas import GasEstimateCache, GasPriceCache
+
+TOKEN = '0x' + 'Ab' * 20
+OTHER = '0x' + 'cd' * 20
+TRANSFER = 'transfer(address,uint256)'
+
+
+class Counter:
+    '''Fetch function returning value, counting the calls'''
+
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self, *args):
+        self.calls += 1
+        return self.value
+
+
+def _receipt(status, gas_used=30000, logs=()):
+    return {'status': status, 'gasUsed': gas_used, 'transactionHash': HexBytes(b'\x01' * 32),
+            'logs': list(logs)}
+
+
+class TestGasPriceCache(unittest.TestCase):
+
+    def test_cached_per_block(self):
+        fetch = Counter(10)
+        cache = GasPriceCache(fetch)
+        self.assertEqual([cache.get(5), cache.get(5)], [10, 10])
+        self.assertEqual(fetch.calls, 1)
+        fetch.value = 11
+        self.assertEqual(cache.get(6), 11)
+        self.assertEqual(fetch.calls, 2)
+
+    def test_ttl_and_invalidate(self):
+        fetch = Counter(10)
+        cache = GasPriceCache(fetch, ttl=0)
+        cache.get()
+        cache.get()
+        self.assertEqual(fetch.calls, 2)
+        cache = GasPriceCache(fetch)
+        cache.get()
+        cache.invalidate()
+        cache.get()
+        self.assertEqual(fetch.calls, 4)
+
+
+class TestGasEstimateCache(unittest.TestCase):
+
+    def setUp(self):
+        self.estimate = Counter(40000)
+        self.cache = GasEstimateCache(self.estimate, methods=[TRANSFER])
+        self.selector = self.cache.cache_method(TRANSFER)
+
+    def _tx(self, to=TOKEN, arg='00' * 64, **kwargs):
+        tx = {'to': to, 'data': '0x%s%s' % (self.selector, arg), 'value': 0}
+        tx.update(kwargs)
+        return tx
+
+    def test_opted_in_method_is_cached_per_shape(self):
+        self.assertEqual(self.cache.estimate(self._tx()), 50000)
+        self.assertEqual(self.cache.estimate(self._tx(arg='11' * 64)), 50000)
+        self.assertEqual(self.cache.estimate(self._tx(to=TOKEN.lower())), 50000)
+        self.assertEqual(self.estimate.calls, 1)
+        # other target, call data size or value is another shape
+        self.cache.estimate(self._tx(to=OTHER))
+        self.cache.estimate(self._tx(arg='00' * 96))
+        self.cache.estimate(self._tx(value=1))
+        self.assertEqual(self.estimate.calls, 4)
+
+    def test_other_methods_are_not_cached(self):
+        for tx in ({'to': TOKEN, 'data': '0x12345678' + '00' * 64},
+                   {'to': TOKEN, 'data': b'', 'value': 1},
+                   {'data': '0x%s' % self.selector}):
+            self.assertIsNone(self.cache.key(tx))
+            self.cache.estimate(tx)
+            self.cache.estimate(tx)
+        self.assertEqual(self.estimate.calls, 6)
+        self.assertEqual(len(self.cache.entries), 0)
+
+    def test_cache_method_by_selector(self):
+        cache = GasEstimateCache(self.estimate)
+        self.assertIsNone(cache.key(self._tx()))
+        self.assertEqual(cache.cache_method('0x%s' % self.selector.upper()), self.selector)
+        self.assertIsNotNone(cache.key(self._tx(data=bytes.fromhex(self.selector + '00' * 64))))
+
+    def test_failed_transaction_drops_estimate(self):
+        tx = self._tx(gas=self.cache.estimate(self._tx()))
+        # reverted before running out of gas
+        self.cache.check_receipt(tx, _receipt(0, gas_used=25000))
+        self.assertIsNone(self.cache.get(tx))
+        self.cache.check_receipt(tx, _receipt(1))
+
+    def test_failed_transaction_with_cached_gas_raises(self):
+        tx = self._tx()
+        self.cache.estimate(tx)
+        tx['gas'] = self.cache.get(tx)
+        with self.assertRaises(ValueError):
+            self.cache.check_receipt(tx, _receipt(0), cached=True)
+        self.assertIsNone(self.cache.get(tx))
+        self.cache.check_receipt(tx, _receipt(1), cached=True)
+
+    def test_upgrade_drops_estimates_of_contract(self):
+        self.cache.estimate(self._tx())
+        self.cache.estimate(self._tx(to=OTHER))
+        upgraded = {'address': TOKEN, 'topics': [HexBytes(GasEstimateCache.UPGRADED_TOPIC)]}
+        self.cache.check_receipt(self._tx(to=OTHER), _receipt(1, logs=[upgraded]))
+        self.assertIsNone(self.cache.get(self._tx()))
+        self.assertIsNotNone(self.cache.get(self._tx(to=OTHER)))
+
+    def test_invalidate_all(self):
+        self.cache.estimate(self._tx())
+        self.cache.invalidate()
+        self.assertIsNone(self.cache.get(self._tx()))
+
+
+if __name__ == '__main__':
+    unittest.main()
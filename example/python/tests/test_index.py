@@ -0,0 +1,88 @@
+import json
+import unittest
+
+from example.python.utils.bridge import SECONDS_PER_DAY
+from example.python.utils.index import EventIndex, _BigSum, _to_column
+
+UINT256_MAX = 2 ** 256 - 1
+BRIDGE = '0x' + 'AB' * 20
+USER = '0x' + 'Cd' * 20
+# (name, tx hash, log index, day, sender, recipient, value, ref hash)
+ROWS = [
+    ('Transfer', '0x01', 0, 10, USER, BRIDGE, UINT256_MAX, None),
+    ('Transfer', '0x02', 0, 10, USER, BRIDGE, 1, None),
+    ('Transfer', '0x03', 1, 11, BRIDGE, USER, 5, None),
+    ('RelayedMessage', '0x04', 2, 11, None, USER, 5, '0x01'),
+]
+
+
+class TestBigSum(unittest.TestCase):
+
+    def test_sum_beyond_int64(self):
+        total = _BigSum()
+        for value in (str(UINT256_MAX), '1', None, '0'):
+            total.step(value)
+        self.assertEqual(total.finalize(), str(2 ** 256))
+
+    def test_empty(self):
+        self.assertEqual(_BigSum().finalize(), '0')
+
+
+class TestToColumn(unittest.TestCase):
+
+    def test_values(self):
+        self.assertEqual(_to_column(b'\x01\xff'), '0x01ff')
+        self.assertEqual(_to_column(UINT256_MAX), str(UINT256_MAX))
+        self.assertEqual(_to_column(BRIDGE), BRIDGE.lower())
+        self.assertEqual(_to_column([1, 2]), '[1, 2]')
+
+
+class TestEventIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = EventIndex(':memory:')
+        for name, tx_hash, log_index, day, sender, recipient, value, ref_hash in ROWS:
+            timestamp = day * SECONDS_PER_DAY + 60
+            self.index.conn.execute(
+                'INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                ('home', BRIDGE.lower(), name, day, tx_hash, log_index, timestamp, day,
+                 _to_column(sender) if sender else None, _to_column(recipient),
+                 _to_column(value), ref_hash, json.dumps([])))
+
+    def tearDown(self):
+        self.index.close()
+
+    def test_daily_totals_are_exact(self):
+        self.assertEqual(self.index.daily_totals(), [
+            (10 * SECONDS_PER_DAY, 2, 2 ** 256),
+            (11 * SECONDS_PER_DAY, 1, 5),
+        ])
+        self.assertEqual(self.index.daily_totals('RelayedMessage', chain='home'),
+                         [(11 * SECONDS_PER_DAY, 1, 5)])
+        self.assertEqual(self.index.daily_totals(chain='foreign'), [])
+
+    def test_daily_totals_of_address(self):
+        self.assertEqual(self.index.daily_totals(address=USER),
+                         [(10 * SECONDS_PER_DAY, 2, 2 ** 256), (11 * SECONDS_PER_DAY, 1, 5)])
+
+    def test_transfers(self):
+        rows = self.index.transfers(USER)
+        self.assertEqual([row['tx_hash'] for row in rows], ['0x01', '0x02', '0x03', '0x04'])
+        self.assertEqual(len(self.index.transfers(USER, chain='home', limit=2)), 2)
+        self.assertEqual(self.index.transfers(USER, chain='foreign'), [])
+
+    def test_by_tx_includes_completions(self):
+        rows = self.index.by_tx('0x01')
+        self.assertEqual([(row['name'], row['tx_hash']) for row in rows],
+                         [('Transfer', '0x01'), ('RelayedMessage', '0x04')])
+
+    def test_checkpoint(self):
+        checkpoint = self.index.checkpoint
+        self.assertIsNone(checkpoint.load('home:events'))
+        checkpoint.save('home:events', 42)
+        checkpoint.save('home:events', 43)
+        self.assertEqual(checkpoint.load('home:events'), 43)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,192 @@
+import unittest
+
+from hexbytes import HexBytes
+
+from example.python.utils.jsonrpc import (
+    BatchRequest, batch_index, format_block, format_receipt, format_result, is_block_hash,
+    to_block_param, to_hex_data, to_rpc_transaction)
+
+# EIP-55 test vector
+ADDRESS = '0x5aaeb6053f3e94c9b9a09f33669435e7ef1beaed'
+CHECKSUM_ADDRESS = '0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAed'
+BLOCK_HASH = '0x' + '11' * 32
+TX_HASH = '0x' + '22' * 32
+TOPIC = '0x' + '33' * 32
+
+
+class TestParams(unittest.TestCase):
+
+    def test_to_hex_data(self):
+        self.assertEqual(to_hex_data(b'\x01\xab'), '0x01ab')
+        self.assertEqual(to_hex_data('01ab'), '0x01ab')
+        self.assertEqual(to_hex_data('0x01ab'), '0x01ab')
+
+    def test_to_block_param(self):
+        self.assertEqual(to_block_param(255), '0xff')
+        self.assertEqual(to_block_param('latest'), 'latest')
+
+    def test_is_block_hash(self):
+        self.assertTrue(is_block_hash(BLOCK_HASH))
+        self.assertTrue(is_block_hash(HexBytes(BLOCK_HASH)))
+        self.assertFalse(is_block_hash(12))
+        self.assertFalse(is_block_hash('latest'))
+        self.assertFalse(is_block_hash('0x12'))
+
+    def test_to_rpc_transaction(self):
+        tx = to_rpc_transaction({'to': ADDRESS, 'value': 16, 'data': b'\x12\x34'})
+        self.assertEqual(tx, {'to': ADDRESS, 'value': '0x10', 'data': '0x1234'})
+
+
+class TestBatchIndex(unittest.TestCase):
+
+    def test_valid(self):
+        self.assertEqual(batch_index({'jsonrpc': '2.0', 'id': 2, 'result': '0x1'}, 3), 2)
+
+    def test_null_id_raises_error_of_response(self):
+        error = {'code': -32700, 'message': 'Parse error'}
+        with self.assertRaises(ValueError) as ctx:
+            batch_index({'jsonrpc': '2.0', 'id': None, 'error': error}, 3)
+        self.assertEqual(ctx.exception.args[0], error)
+
+    def test_invalid_id(self):
+        for response in ({'id': 3}, {'id': -1}, {'id': '1'}, {}, 'not a dict'):
+            with self.assertRaises(ValueError, msg=response):
+                batch_index(response, 3)
+
+
+class TestFormat(unittest.TestCase):
+
+    def test_format_receipt(self):
+        receipt = format_receipt({
+            'blockHash': BLOCK_HASH,
+            'blockNumber': '0x10',
+            'contractAddress': None,
+            'effectiveGasPrice': '0x3b9aca00',
+            'from': ADDRESS,
+            'gasUsed': '0x5208',
+            'logs': [{'address': ADDRESS, 'data': '0x', 'logIndex': '0x0', 'topics': [TOPIC],
+                      'transactionHash': TX_HASH}],
+            'status': '0x1',
+            'transactionHash': TX_HASH,
+            'type': '0x2',
+            'unknownField': '0x7',
+        })
+        self.assertEqual(receipt.blockNumber, 16)
+        self.assertEqual(receipt['effectiveGasPrice'], 10 ** 9)
+        self.assertEqual(receipt['gasUsed'], 21000)
+        self.assertEqual(receipt['status'], 1)
+        self.assertEqual(receipt['type'], 2)
+        self.assertEqual(receipt['blockHash'], HexBytes(BLOCK_HASH))
+        self.assertIsInstance(receipt['transactionHash'], HexBytes)
+        self.assertEqual(receipt['from'], CHECKSUM_ADDRESS)
+        self.assertIsNone(receipt['contractAddress'])
+        self.assertEqual(receipt['unknownField'], '0x7')
+        log = receipt['logs'][0]
+        self.assertEqual(log['logIndex'], 0)
+        self.assertEqual(log['topics'], [HexBytes(TOPIC)])
+        self.assertEqual(log['data'], '0x')
+        self.assertIsNone(format_receipt(None))
+
+    def test_format_block(self):
+        block = format_block({
+            'baseFeePerGas': '0x7',
+            'hash': BLOCK_HASH,
+            'nonce': '0x0000000000000042',
+            'number': '0x1b4',
+            'timestamp': '0x5f5e100',
+            'transactions': [TX_HASH],
+            'uncles': [BLOCK_HASH],
+            'withdrawalsRoot': BLOCK_HASH,
+        })
+        self.assertEqual(block['number'], 436)
+        self.assertEqual(block['timestamp'], 10 ** 8)
+        self.assertEqual(block['baseFeePerGas'], 7)
+        self.assertEqual(block['nonce'], HexBytes('0x0000000000000042'))
+        self.assertEqual(block['transactions'], [HexBytes(TX_HASH)])
+        self.assertEqual(block['uncles'], [HexBytes(BLOCK_HASH)])
+        self.assertEqual(block['withdrawalsRoot'], HexBytes(BLOCK_HASH))
+        self.assertIsNone(format_block(None))
+
+    def test_format_block_with_transactions(self):
+        block = format_block({
+            'number': '0x1',
+            'transactions': [{'hash': TX_HASH, 'nonce': '0x5', 'to': None, 'value': '0x0',
+                              'maxFeePerGas': '0x10', 'yParity': '0x1'}],
+        })
+        transaction = block['transactions'][0]
+        self.assertEqual(transaction['hash'], HexBytes(TX_HASH))
+        self.assertEqual(transaction['nonce'], 5)
+        self.assertIsNone(transaction['to'])
+        self.assertEqual(transaction['maxFeePerGas'], 16)
+        self.assertEqual(transaction['yParity'], 1)
+        self.assertEqual(block['uncles'], [])
+
+    def test_format_result(self):
+        self.assertEqual(format_result('eth_blockNumber', '0x64'), 100)
+        self.assertEqual(format_result('eth_call', '0x01'), HexBytes('0x01'))
+        self.assertIsNone(format_result('eth_getTransactionReceipt', None))
+        self.assertIsNone(format_result('eth_getLogs', None))
+        self.assertEqual(format_result('net_version', '108'), '108')
+
+
+class FakeProvider:
+    '''Answers batches with the responses built by respond(payload)'''
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.batches = []
+
+    def request_batch(self, payload):
+        self.batches.append(payload)
+        return self.respond(payload)
+
+
+def _results(payload):
+    return [{'jsonrpc': '2.0', 'id': call['id'], 'result': '0x%x' % call['id']}
+            for call in reversed(payload)]
+
+
+class TestBatchRequest(unittest.TestCase):
+
+    def test_results_in_call_order(self):
+        provider = FakeProvider(_results)
+        batch = BatchRequest(provider, max_batch_size=2)
+        for _ in range(3):
+            batch.call_api('eth_blockNumber')
+        self.assertEqual(batch.execute(), [0, 1, 0])
+        self.assertEqual([len(payload) for payload in provider.batches], [2, 1])
+        self.assertEqual(len(batch), 0)
+
+    def test_errors(self):
+        def respond(payload):
+            return [{'jsonrpc': '2.0', 'id': 0, 'result': '0x1'},
+                    {'jsonrpc': '2.0', 'id': 1, 'error': {'code': -32000, 'message': 'failed'}}]
+        batch = BatchRequest(FakeProvider(respond))
+        batch.get_balance(ADDRESS)
+        batch.get_balance(ADDRESS)
+        self.assertEqual(batch.execute(raise_on_error=False), [1, None])
+        batch.get_balance(ADDRESS)
+        failed = batch.get_balance(ADDRESS)
+        with self.assertRaises(ValueError):
+            batch.execute()
+        self.assertEqual(failed.error['message'], 'failed')
+
+    def test_rejected_batch(self):
+        batch = BatchRequest(FakeProvider(lambda payload: {'error': 'too many calls'}))
+        batch.call_api('eth_blockNumber')
+        with self.assertRaises(ValueError):
+            batch.execute(raise_on_error=False)
+
+    def test_missing_responses(self):
+        batch = BatchRequest(FakeProvider(lambda payload: _results(payload)[1:]))
+        batch.call_api('eth_blockNumber')
+        batch.call_api('eth_chainId')
+        batch.call_api('eth_gasPrice')
+        with self.assertRaises(ValueError) as ctx:
+            batch.execute(raise_on_error=False)
+        self.assertIn('eth_gasPrice (id 2)', str(ctx.exception))
+        self.assertNotIn('eth_blockNumber', str(ctx.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+
+from example.python.utils.metrics import BUCKETS, Histogram, RPCMetrics
+
+URL = 'http://127.0.0.1:8545'
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_empty(self):
+        hist = Histogram()
+        self.assertIsNone(hist.percentile(50))
+        self.assertEqual(hist.count, 0)
+
+    def test_bucket_upper_bound_is_inclusive(self):
+        hist = Histogram()
+        hist.observe(BUCKETS[0])
+        hist.observe(0.003)
+        self.assertEqual(hist.counts[0], 1)
+        self.assertEqual(hist.counts[2], 1)
+        self.assertEqual(hist.count, 2)
+        self.assertAlmostEqual(hist.total, BUCKETS[0] + 0.003)
+        self.assertEqual(hist.max, 0.003)
+
+    def test_percentile_interpolates_in_bucket(self):
+        hist = Histogram()
+        for _ in range(10):
+            hist.observe(0.004)
+        # rank 1 of 10 samples in (0.0025, 0.005]
+        self.assertAlmostEqual(hist.percentile(10), 0.00275)
+        # interpolation beyond the largest sample is capped
+        self.assertEqual(hist.percentile(90), 0.004)
+        self.assertEqual(hist.percentile(100), 0.004)
+
+    def test_percentile_of_last_bucket_uses_max(self):
+        hist = Histogram()
+        hist.observe(100)
+        self.assertEqual(len(hist.counts), len(BUCKETS) + 1)
+        self.assertEqual(hist.counts[-1], 1)
+        self.assertAlmostEqual(hist.percentile(50), 65)
+        self.assertEqual(hist.percentile(100), 100)
+
+    def test_percentiles_are_ordered(self):
+        hist = Histogram()
+        for value in (0.002, 0.02, 0.2, 2, 20):
+            hist.observe(value)
+        values = [hist.percentile(pct) for pct in (20, 40, 60, 80, 100)]
+        self.assertEqual(values, sorted(values))
+        self.assertEqual(values[-1], 20)
+
+
+class TestRPCMetrics(unittest.TestCase):
+
+    def test_disabled_records_nothing(self):
+        metrics = RPCMetrics()
+        metrics.record('eth_call', URL, 0.01)
+        metrics.record_retry('eth_call', URL)
+        self.assertEqual(metrics.as_dict(), {})
+
+    def test_record(self):
+        metrics = RPCMetrics(enabled=True)
+        metrics.record('eth_call', URL, 0.01)
+        metrics.record('eth_call', URL, 0.03, error=True)
+        metrics.record_retry('eth_call', URL)
+        metrics.record('eth_blockNumber', URL, 0.002)
+        stats = metrics.as_dict()
+        self.assertEqual(sorted(stats), ['eth_blockNumber', 'eth_call'])
+        call = stats['eth_call'][URL]
+        self.assertEqual((call['calls'], call['errors'], call['retries']), (2, 1, 1))
+        self.assertAlmostEqual(call['latency_avg'], 0.02)
+        self.assertEqual(call['latency_max'], 0.03)
+
+    def test_disable_keeps_stats_and_reset_drops_them(self):
+        metrics = RPCMetrics(enabled=True)
+        metrics.record('eth_call', URL, 0.01)
+        metrics.disable()
+        metrics.record('eth_call', URL, 0.01)
+        self.assertEqual(metrics.as_dict()['eth_call'][URL]['calls'], 1)
+        metrics.reset()
+        self.assertEqual(metrics.as_dict(), {})
+
+    def test_prometheus(self):
+        metrics = RPCMetrics(enabled=True)
+        metrics.record('eth_call', URL, 0.004)
+        metrics.record('eth_call', URL, 100, error=True)
+        metrics.record('eth_call', 'http://x/"q"', 0.004)
+        lines = metrics.prometheus().splitlines()
+        labels = 'method="eth_call",endpoint="%s"' % URL
+        self.assertIn('# TYPE thunder_rpc_calls_total counter', lines)
+        self.assertIn('thunder_rpc_calls_total{%s} 2' % labels, lines)
+        self.assertIn('thunder_rpc_errors_total{%s} 1' % labels, lines)
+        self.assertIn('thunder_rpc_retries_total{%s} 0' % labels, lines)
+        # buckets are cumulative, +Inf holds all samples
+        self.assertIn('thunder_rpc_latency_seconds_bucket{%s,le="0.0025"} 0' % labels, lines)
+        self.assertIn('thunder_rpc_latency_seconds_bucket{%s,le="0.005"} 1' % labels, lines)
+        self.assertIn('thunder_rpc_latency_seconds_bucket{%s,le="30"} 1' % labels, lines)
+        self.assertIn('thunder_rpc_latency_seconds_bucket{%s,le="+Inf"} 2' % labels, lines)
+        self.assertIn('thunder_rpc_latency_seconds_count{%s} 2' % labels, lines)
+        self.assertIn('thunder_rpc_calls_total{method="eth_call",endpoint="http://x/\\"q\\""} 1',
+                      lines)
+
+    def test_summary_slowest_first(self):
+        metrics = RPCMetrics(enabled=True)
+        metrics.record('eth_blockNumber', URL, 0.001)
+        metrics.record('eth_call', URL, 0.5)
+        lines = metrics.summary()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith('eth_call'))
+        self.assertIn('calls=1', lines[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
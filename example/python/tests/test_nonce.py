@@ -0,0 +1,192 @@
+import asyncio
+import threading
+import types
+import unittest
+
+from requests.exceptions import ConnectionError as RequestsConnectionError
+
+from example.python.utils.nonce import AsyncNonceManager, NonceManager, is_nonce_too_low
+from example.python.utils.w3helper import W3Helper
+
+ACC = '0x' + '11' * 20
+
+
+class PendingNonce:
+    '''fetch_pending_nonce of a node whose pending nonce is value'''
+
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self, acc):
+        self.calls += 1
+        return self.value
+
+
+class TestIsNonceTooLow(unittest.TestCase):
+
+    def test_messages(self):
+        self.assertTrue(is_nonce_too_low(ValueError({'code': -32000, 'message': 'nonce too low'})))
+        self.assertTrue(is_nonce_too_low(ValueError('Transaction nonce is too low.')))
+        self.assertTrue(is_nonce_too_low({'message': 'Nonce has already been used'}))
+        self.assertFalse(is_nonce_too_low(ValueError({'message': 'insufficient funds'})))
+        self.assertFalse(is_nonce_too_low(ValueError()))
+
+
+class TestNonceManager(unittest.TestCase):
+
+    def test_allocate_reads_node_once(self):
+        pending = PendingNonce(5)
+        nonces = NonceManager(pending)
+        self.assertEqual([nonces.allocate(ACC) for _ in range(3)], [5, 6, 7])
+        self.assertEqual(nonces.allocate_many(ACC, 3), [8, 9, 10])
+        self.assertEqual(pending.calls, 1)
+
+    def test_released_nonces_are_reused_lowest_first(self):
+        nonces = NonceManager(PendingNonce(0))
+        for _ in range(5):
+            nonces.allocate(ACC)
+        nonces.release(ACC, 3)
+        nonces.release(ACC, 1)
+        nonces.release(ACC, 1)
+        self.assertEqual([nonces.allocate(ACC) for _ in range(3)], [1, 3, 5])
+
+    def test_release_of_last_nonces_rewinds_counter(self):
+        nonces = NonceManager(PendingNonce(0))
+        for _ in range(4):
+            nonces.allocate(ACC)
+        nonces.release(ACC, 2)
+        nonces.release(ACC, 3)
+        self.assertEqual(nonces.allocate(ACC), 2)
+        self.assertEqual(nonces.allocate(ACC), 3)
+        self.assertEqual(nonces.allocate(ACC), 4)
+
+    def test_release_unknown_nonce_is_ignored(self):
+        nonces = NonceManager(PendingNonce(0))
+        nonces.release(ACC, 0)
+        nonces.allocate(ACC)
+        nonces.release(ACC, 7)
+        self.assertEqual(nonces.allocate(ACC), 1)
+
+    def test_reconcile(self):
+        pending = PendingNonce(0)
+        nonces = NonceManager(pending)
+        for _ in range(3):
+            nonces.allocate(ACC)
+        nonces.release(ACC, 0)
+        # local counter is ahead of the node, nonces in flight are kept
+        self.assertEqual(nonces.reconcile(ACC), 3)
+        self.assertEqual(nonces.allocate(ACC), 0)
+        # the node used nonces another client sent, released ones below are dropped
+        nonces.release(ACC, 1)
+        pending.value = 10
+        self.assertEqual(nonces.reconcile(ACC), 10)
+        self.assertEqual(nonces.allocate(ACC), 10)
+
+    def test_reset(self):
+        pending = PendingNonce(0)
+        nonces = NonceManager(pending)
+        nonces.allocate(ACC)
+        pending.value = 4
+        nonces.reset(ACC)
+        self.assertEqual(nonces.allocate(ACC), 4)
+        nonces.reset()
+        self.assertEqual(nonces.allocate(ACC), 4)
+        self.assertEqual(pending.calls, 3)
+
+    def test_threads_get_distinct_nonces(self):
+        nonces = NonceManager(PendingNonce(0))
+        allocated = []
+
+        def allocate():
+            for _ in range(200):
+                allocated.append(nonces.allocate(ACC))
+
+        threads = [threading.Thread(target=allocate) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(allocated), list(range(800)))
+
+
+class TestAsyncNonceManager(unittest.TestCase):
+
+    def test_allocate_release_reconcile(self):
+        async def fetch(acc):
+            return 2
+
+        async def run():
+            nonces = AsyncNonceManager(fetch)
+            allocated = await asyncio.gather(*[nonces.allocate(ACC) for _ in range(4)])
+            nonces.release(ACC, 3)
+            nonces.release(ACC, 2)
+            return allocated, await nonces.allocate(ACC), await nonces.reconcile(ACC)
+
+        allocated, reused, reconciled = asyncio.run(run())
+        self.assertEqual(sorted(allocated), [2, 3, 4, 5])
+        self.assertEqual(reused, 2)
+        self.assertEqual(reconciled, 6)
+
+
+class FakeW3Helper(W3Helper):
+    '''W3Helper whose sends fail with the exceptions of outcomes in order'''
+
+    # pylint: disable=super-init-not-called
+    def __init__(self, pending, outcomes):
+        account = types.SimpleNamespace(address=ACC)
+        self.web3 = types.SimpleNamespace(eth=types.SimpleNamespace(
+            account=types.SimpleNamespace(privateKeyToAccount=lambda key: account)))
+        self.nonces = NonceManager(pending)
+        self.outcomes = list(outcomes)
+        self.sent = []
+
+    @staticmethod
+    def sign_transaction(src_private_key, transaction):
+        return types.SimpleNamespace(rawTransaction=bytes([transaction['nonce']]))
+
+    def send_raw_transaction(self, raw_transaction):
+        self.sent.append(raw_transaction[0])
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+class TestExecuteTransaction(unittest.TestCase):
+
+    def _execute(self, w3h):
+        return w3h.execute_transaction('key', {'nonce': w3h.allocate_nonce(ACC)})
+
+    def test_rejected_transaction_releases_nonce(self):
+        w3h = FakeW3Helper(PendingNonce(0), [ValueError({'message': 'insufficient funds'}),
+                                             b'hash'])
+        with self.assertRaises(ValueError):
+            self._execute(w3h)
+        tx_hash, _ = self._execute(w3h)
+        self.assertEqual(tx_hash, b'hash')
+        self.assertEqual(w3h.sent, [0, 0])
+
+    def test_transport_error_keeps_nonce(self):
+        pending = PendingNonce(0)
+        w3h = FakeW3Helper(pending, [RequestsConnectionError('reset'), b'hash'])
+        with self.assertRaises(RequestsConnectionError):
+            self._execute(w3h)
+        # the first transaction may have reached the node, its nonce is not reused
+        self._execute(w3h)
+        self.assertEqual(w3h.sent, [0, 1])
+        self.assertEqual(pending.calls, 2)
+
+    def test_nonce_too_low_resends_with_new_nonce(self):
+        pending = PendingNonce(0)
+        w3h = FakeW3Helper(pending, [ValueError({'message': 'nonce too low'}), b'hash'])
+        nonce = w3h.allocate_nonce(ACC)
+        # another client used the nonce
+        pending.value = 3
+        tx_hash, _ = w3h.execute_transaction('key', {'nonce': nonce})
+        self.assertEqual(tx_hash, b'hash')
+        self.assertEqual(w3h.sent, [0, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import time
+import unittest
+
+from example.python.lib.processpool import ProcessPool
+
+_WORKER_STATE = {}
+
+
+def _init_worker(value):
+    _WORKER_STATE['value'] = value
+
+
+def _worker_value(offset):
+    return _WORKER_STATE['value'] + offset
+
+
+def _square(value):
+    return value * value
+
+
+def _sleep(seconds, value):
+    time.sleep(seconds)
+    return value
+
+
+def _fail(message):
+    raise ValueError(message)
+
+
+class _Unpicklable(Exception):
+    def __init__(self):
+        super().__init__()
+        self.lock = lambda: None
+
+
+def _fail_unpicklable():
+    raise _Unpicklable()
+
+
+class TestProcessPool(unittest.TestCase):
+
+    def test_stream_all_results(self):
+        with ProcessPool(2, max_pending=2) as pool:
+            tasks = list(pool.stream(_square, ((value,) for value in range(20))))
+        self.assertEqual(sorted(task.value for task in tasks), [v * v for v in range(20)])
+        self.assertEqual(sorted(task.index for task in tasks), list(range(20)))
+        self.assertTrue(all(task.ok and task.duration is not None for task in tasks))
+
+    def test_results_in_completion_order(self):
+        with ProcessPool(3) as pool:
+            pool.add_task(_sleep, 0.6, 'slow')
+            pool.add_task(_sleep, 0.3, 'medium')
+            pool.add_task(_sleep, 0, 'fast')
+            values = [task.value for task in pool.as_completed()]
+        self.assertEqual(values, ['fast', 'medium', 'slow'])
+
+    def test_exceptions(self):
+        with ProcessPool(2) as pool:
+            pool.add_task(_fail, 'broken')
+            pool.add_task(_fail_unpicklable)
+            tasks = sorted(pool.as_completed(), key=lambda task: task.index)
+        self.assertIsInstance(tasks[0].error, ValueError)
+        self.assertIn('ValueError: broken', tasks[0].traceback)
+        with self.assertRaises(ValueError):
+            tasks[0].get()
+        self.assertIsInstance(tasks[1].error, RuntimeError)
+        self.assertIn('_Unpicklable', str(tasks[1].error))
+
+    def test_initializer(self):
+        with ProcessPool(2, _init_worker, (100,)) as pool:
+            for offset in range(4):
+                pool.add_task(_worker_value, offset)
+            self.assertEqual(pool.wait_completion(),
+                             [(100, None), (101, None), (102, None), (103, None)])
+
+    def test_hung_tasks_expire_without_blocking_add_task(self):
+        pool = ProcessPool(2, max_pending=2, task_timeout=0.3)
+        try:
+            started = time.time()
+            tasks = list(pool.stream(_sleep, [(5, idx) for idx in range(4)]))
+            elapsed = time.time() - started
+        finally:
+            pool.terminate()
+        self.assertLess(elapsed, 3)
+        self.assertEqual(len(tasks), 4)
+        self.assertTrue(all(isinstance(task.error, TimeoutError) for task in tasks))
+
+    def test_as_completed_timeout(self):
+        pool = ProcessPool(1)
+        try:
+            pool.add_task(_sleep, 5, None)
+            with self.assertRaises(TimeoutError):
+                list(pool.as_completed(timeout=0.2))
+            self.assertEqual(len(pool), 1)
+        finally:
+            pool.terminate()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import copy
+import pickle
+import unittest
+
+from hexbytes import HexBytes
+
+from example.python.utils.records import DecodedEvent, Log, Receipt
+
+TX_HASH = '0x' + '01' * 32
+BLOCK_HASH = '0x' + '02' * 32
+TOKEN = '0x' + 'ab' * 20
+
+
+def _log(log_index=0, **kwargs):
+    log = {
+        'address': TOKEN,
+        'topics': ['0x' + '03' * 32],
+        'data': '0x%064x' % 7,
+        'blockNumber': '0x10',
+        'blockHash': BLOCK_HASH,
+        'transactionHash': TX_HASH,
+        'transactionIndex': 0,
+        'logIndex': log_index,
+    }
+    log.update(kwargs)
+    return log
+
+
+def _receipt(**kwargs):
+    receipt = {
+        'transactionHash': TX_HASH,
+        'transactionIndex': 0,
+        'blockHash': BLOCK_HASH,
+        'blockNumber': 16,
+        'from': TOKEN,
+        'to': TOKEN,
+        'gasUsed': '0x5208',
+        'cumulativeGasUsed': 21000,
+        'effectiveGasPrice': 1,
+        'contractAddress': None,
+        'status': 1,
+        'type': 0,
+        'logsBloom': '0x00',
+        'logs': [_log(0), _log(1)],
+    }
+    receipt.update(kwargs)
+    return receipt
+
+
+class TestLog(unittest.TestCase):
+
+    def test_fields_and_web3_keys(self):
+        log = Log.from_dict(_log(removed=False))
+        self.assertEqual((log.block_number, log.log_index), (16, 0))
+        self.assertEqual(log.transaction_hash, bytes(HexBytes(TX_HASH)))
+        self.assertEqual(log['transactionHash'], HexBytes(TX_HASH))
+        self.assertEqual(log.data, (7).to_bytes(32, 'big'))
+        self.assertEqual(log['data'], '0x%064x' % 7)
+        self.assertEqual(log.blockNumber, 16)
+        self.assertIs(log['removed'], False)
+        self.assertIs(log.removed, False)
+        self.assertEqual(dict(log)['logIndex'], 0)
+        self.assertIs(Log.from_dict(log), log)
+
+    def test_immutable(self):
+        log = Log.from_dict(_log())
+        with self.assertRaises(AttributeError):
+            log.log_index = 1
+        with self.assertRaises(AttributeError):
+            getattr(log, 'missing')
+
+    def test_identity(self):
+        self.assertEqual(Log.from_dict(_log(data='0x')), Log.from_dict(_log()))
+        self.assertEqual(len({Log.from_dict(_log(0)), Log.from_dict(_log(1)),
+                              Log.from_dict(_log(0))}), 2)
+
+
+class TestReceipt(unittest.TestCase):
+
+    def test_fields_and_web3_keys(self):
+        receipt = Receipt.from_dict(_receipt())
+        self.assertEqual((receipt.gas_used, receipt['gasUsed'], receipt.gasUsed), (21000,) * 3)
+        self.assertEqual(receipt['from'], receipt.sender)
+        self.assertEqual([log.log_index for log in receipt.logs], [0, 1])
+        self.assertEqual(receipt['logs'][1]['logIndex'], 1)
+        self.assertIsNone(receipt.get('l1Fee'))
+        self.assertEqual(set(receipt), set(_receipt()))
+
+    def test_events_are_not_web3_keys(self):
+        event = DecodedEvent('Transfer', 'Transfer(address,address,uint256)', (TOKEN, TOKEN, 7),
+                             TOKEN, 16, TX_HASH, 0)
+        receipt = Receipt.from_dict(_receipt()).with_events([event])
+        self.assertEqual(receipt.events, (event,))
+        self.assertNotIn('events', receipt)
+        self.assertNotIn('events', receipt.keys())
+        self.assertNotIn('events', dict(receipt))
+        self.assertEqual(len(receipt), len(_receipt()))
+        self.assertIsNone(Receipt.from_dict(_receipt()).events)
+
+    def test_copy_and_pickle(self):
+        event = DecodedEvent('Transfer', 'Transfer(address,address,uint256)', (TOKEN, TOKEN, 7),
+                             TOKEN, 16, TX_HASH, 0)
+        receipt = Receipt.from_dict(_receipt(l1Fee=5)).with_events([event])
+        for other in (copy.copy(receipt), copy.deepcopy(receipt),
+                      pickle.loads(pickle.dumps(receipt))):
+            self.assertIsInstance(other, Receipt)
+            self.assertEqual(other, receipt)
+            self.assertEqual(dict(other), dict(receipt))
+            self.assertEqual(other.events, (event,))
+            self.assertEqual(other.logs, receipt.logs)
+            self.assertEqual(other['l1Fee'], 5)
+        log = receipt.logs[0]
+        self.assertEqual(dict(pickle.loads(pickle.dumps(log))), dict(log))
+
+
+if __name__ == '__main__':
+    unittest.main()
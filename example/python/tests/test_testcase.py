@@ -0,0 +1,80 @@
+import argparse
+import unittest
+import xml.etree.ElementTree as ET
+
+from example.python.lib.testcase import ThunderTestResult, parse_shard
+
+
+class TestParseShard(unittest.TestCase):
+
+    def test_valid(self):
+        self.assertEqual(parse_shard('1/1'), (1, 1))
+        self.assertEqual(parse_shard('2/3'), (2, 3))
+        self.assertEqual(parse_shard('3/3'), (3, 3))
+
+    def test_invalid_format(self):
+        for shard in ('', '1', '1/', 'a/3', '1/2/3', '1.5/3'):
+            with self.assertRaises(argparse.ArgumentTypeError, msg=shard):
+                parse_shard(shard)
+
+    def test_out_of_range(self):
+        for shard in ('0/3', '4/3', '-1/3', '1/0'):
+            with self.assertRaises(argparse.ArgumentTypeError, msg=shard):
+                parse_shard(shard)
+
+
+class TestThunderTestResult(unittest.TestCase):
+
+    class Sample(unittest.TestCase):
+        '''Tests run by the tests, not collected as a module level TestCase'''
+
+        def test_pass(self):
+            pass
+
+        def test_fail(self):
+            self.fail('broken')
+
+        @unittest.skip('not now')
+        def test_skip(self):
+            pass
+
+    def _run(self, names):
+        result = ThunderTestResult(None)
+        unittest.TestSuite(map(self.Sample, names))(result)
+        return result
+
+    def test_records(self):
+        records = self._run(['test_pass', 'test_fail', 'test_skip']).records()
+        outcomes = {name: outcome for outcome, name, _, _ in records}
+        self.assertEqual(outcomes, {'test_pass': 'successes', 'test_fail': 'failures',
+                                    'test_skip': 'skipped'})
+        detail = [detail for _, name, detail, _ in records if name == 'test_fail'][0]
+        self.assertIn('AssertionError: broken', detail)
+
+    def test_merge_of_workers(self):
+        result = ThunderTestResult(None)
+        result.merge(self.Sample, self._run(['test_pass']).records())
+        result.merge(self.Sample, self._run(['test_fail']).records())
+        result.merge(self.Sample, [('errors', 'setUpClass (Sample)', 'ValueError: boom', None)])
+        self.assertEqual(result.testsRun, 2)
+        self.assertEqual(len(result.successes), 1)
+        self.assertEqual(len(result.failures), 1)
+        self.assertEqual([str(test) for test, _ in result.errors], ['setUpClass (Sample)'])
+        self.assertEqual(result.summary(), 2)
+
+    def test_junit_xml(self):
+        result = self._run(['test_pass', 'test_fail', 'test_skip'])
+        result.merge(self.Sample, [('errors', 'worker 1', 'RuntimeError: died', None)])
+        suite = ET.fromstring(result.junit_xml('Sample'))
+        self.assertEqual({key: suite.get(key) for key in ('tests', 'failures', 'errors',
+                                                            'skipped')},
+                         {'tests': '4', 'failures': '1', 'errors': '1', 'skipped': '1'})
+        cases = {case.get('name'): case for case in suite.iter('testcase')}
+        self.assertEqual(cases['test_fail'].find('failure').get('message'),
+                         'AssertionError: broken')
+        self.assertEqual(cases['worker 1'].find('error').get('message'), 'RuntimeError: died')
+        self.assertIsNone(cases['test_pass'].find('failure'))
+
+
+if __name__ == '__main__':
+    unittest.main()
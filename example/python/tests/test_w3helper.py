@@ -0,0 +1,108 @@
+import threading
+import unittest
+
+from hexbytes import HexBytes
+
+from example.python.utils.w3helper import EventRegistry, W3Helper, compile_event
+
+ERC20_TRANSFER = 'Transfer(i:address,i:address,uint256)'
+# Same topic as the ERC20 Transfer, the token id is indexed
+ERC721_TRANSFER = 'Transfer(i:address,i:address,i:uint256)'
+APPROVAL = 'Approval(i:address,i:address,uint256)'
+SENDER = '0x' + '11' * 20
+RECIPIENT = '0x' + '22' * 20
+
+
+def _word(value):
+    return HexBytes(value.to_bytes(32, 'big'))
+
+
+def _address_word(address):
+    return HexBytes('0x' + '00' * 12 + address[2:])
+
+
+def _log(event, topics, data='0x', **kwargs):
+    log = {'topics': [HexBytes(compile_event(event).topic)] + topics, 'data': data}
+    log.update(kwargs)
+    return log
+
+
+class TestEventRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = EventRegistry([ERC20_TRANSFER, ERC721_TRANSFER])
+
+    def test_same_topic_keyed_by_topic_count(self):
+        self.assertEqual(len(self.registry), 2)
+        erc20 = _log(ERC20_TRANSFER, [_address_word(SENDER), _address_word(RECIPIENT)],
+                     data='0x%064x' % 5)
+        erc721 = _log(ERC721_TRANSFER, [_address_word(SENDER), _address_word(RECIPIENT),
+                                        _word(5)])
+        self.assertEqual(self.registry.lookup(erc20).signature, ERC20_TRANSFER)
+        self.assertEqual(self.registry.lookup(erc721).signature, ERC721_TRANSFER)
+
+    def test_lookup_unknown(self):
+        self.assertIsNone(self.registry.lookup({'topics': [], 'data': '0x'}))
+        self.assertIsNone(self.registry.lookup(
+            _log(APPROVAL, [_address_word(SENDER), _address_word(RECIPIENT)])))
+        # registered topic with a topic count of no registered event
+        self.assertIsNone(self.registry.lookup(_log(ERC20_TRANSFER, [])))
+
+    def test_add_spec(self):
+        registry = EventRegistry()
+        spec = compile_event(APPROVAL)
+        self.assertIs(registry.add(spec), spec)
+        self.assertIsNotNone(registry.lookup(
+            _log(APPROVAL, [_address_word(SENDER), _address_word(RECIPIENT)])))
+
+    def test_decode_many_skips_unregistered(self):
+        logs = [
+            _log(APPROVAL, [_address_word(SENDER), _address_word(RECIPIENT)],
+                 data='0x%064x' % 1),
+            _log(ERC20_TRANSFER, [_address_word(SENDER), _address_word(RECIPIENT)],
+                 data='0x%064x' % 7, address=RECIPIENT, blockNumber=3, logIndex=0),
+            _log(ERC721_TRANSFER, [_address_word(SENDER), _address_word(RECIPIENT), _word(9)],
+                 blockNumber=4, logIndex=1),
+        ]
+        events = self.registry.decode_many(logs)
+        self.assertEqual([event.signature for event in events],
+                         ['Transfer(address,address,uint256)'] * 2)
+        self.assertEqual([event.values[2] for event in events], [7, 9])
+        self.assertEqual([event.values[1].lower() for event in events], [RECIPIENT] * 2)
+        self.assertEqual((events[0].address, events[0].block_number), (RECIPIENT, 3))
+
+    def test_decode_logs(self):
+        log = _log(ERC20_TRANSFER, [_address_word(SENDER), _address_word(RECIPIENT)],
+                   data='0x%064x' % 7)
+        self.assertEqual([text.lower() for text in self.registry.decode_logs([log])],
+                         ['transfer(%s, %s, 7)' % (SENDER, RECIPIENT)])
+
+
+class FakeW3Helper(W3Helper):
+    '''W3Helper whose latest block is the next of numbers, stop_event is set after the last'''
+
+    # pylint: disable=super-init-not-called
+    def __init__(self, numbers, stop_event):
+        self.numbers = list(numbers)
+        self.stop_event = stop_event
+
+    def get_block(self, block_id='latest', debug=True):
+        number = self.numbers.pop(0)
+        if not self.numbers:
+            self.stop_event.set()
+        return {'number': number, 'timestamp': number * 2, 'transactions': [],
+                'gasUsed': 0, 'gasLimit': 100}
+
+
+class TestCreateBlockHistory(unittest.TestCase):
+
+    def test_appends_new_blocks_to_list(self):
+        stop_event = threading.Event()
+        w3h = FakeW3Helper([1, 1, 2, 2, 2, 3, 5], stop_event)
+        block_history = []
+        w3h.create_block_history(block_history, stop_event)
+        self.assertEqual([block['number'] for block, _ in block_history], [2, 3, 5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,593 @@
+"""
+asyncio counterparts of W3Helper, SmartContract and Funcall, so one process can drive
+many concurrent transactions without a process pool.
+Requests go through aiohttp; all helpers of the same endpoint share one connection
+pool (HTTP) or one connection (ws:// and wss:// endpoints).
+"""
+
+import asyncio
+import datetime
+import itertools
+import json
+import logging
+import time
+from binascii import hexlify
+
+from eth_account import Account
+from hexbytes import HexBytes
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from example.python.utils.gas import GasEstimateCache
+from example.python.utils.jsonrpc import (batch_index, format_result, is_block_hash,
+                                          to_block_param, to_hex_data, to_rpc_transaction,
+                                          BatchRequest)
+from example.python.utils.metrics import METRICS
+from example.python.utils.nonce import AsyncNonceManager, is_nonce_too_low
+from example.python.utils.records import Log, Receipt
+from example.python.utils.scanner import EventScanner, is_too_many_results
+from example.python.utils.w3helper import EventRegistry, Funcall, SmartContract, W3Helper
+
+LOG = logging.getLogger(__name__)
+
+_CLIENTS = {}
+
+
+def get_client(endpoint, pool_size=100):
+    '''Get the client of endpoint shared by all helpers in the running event loop'''
+    if aiohttp is None:
+        raise ImportError("aiohttp is required by AsyncW3Helper: pip3 install aiohttp")
+    key = (endpoint, id(asyncio.get_event_loop()))
+    client = _CLIENTS.get(key)
+    if client is None or client.closed:
+        if endpoint.startswith(('ws://', 'wss://')):
+            client = AsyncWSClient(endpoint)
+        else:
+            client = AsyncHTTPClient(endpoint, pool_size)
+        _CLIENTS[key] = client
+    return client
+
+
+async def close_clients():
+    '''Close all clients of the running event loop'''
+    loop_id = id(asyncio.get_event_loop())
+    for key in [key for key in _CLIENTS if key[1] == loop_id]:
+        await _CLIENTS.pop(key).close()
+
+
+def _payload(req_id, method, params):
+    return {"jsonrpc": "2.0", "id": req_id, "method": method, "params": params}
+
+
+class AsyncHTTPClient:
+    '''JSON-RPC over HTTP with a keep-alive connection pool'''
+
+    def __init__(self, endpoint, pool_size=100, timeout=30):
+        self.endpoint = endpoint
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=pool_size),
+            timeout=aiohttp.ClientTimeout(total=timeout))
+        self._ids = itertools.count()
+
+    @property
+    def closed(self):
+        '''Whether the session is closed'''
+        return self.session.closed
+
+    async def _post(self, payload, label):
+        if not METRICS.enabled:
+            async with self.session.post(self.endpoint, json=payload) as resp:
+                resp.raise_for_status()
+                return await resp.json(content_type=None)
+        start = time.monotonic()
+        try:
+            async with self.session.post(self.endpoint, json=payload) as resp:
+                resp.raise_for_status()
+                response = await resp.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            METRICS.record(label, self.endpoint, time.monotonic() - start, error=True)
+            raise
+        METRICS.record(label, self.endpoint, time.monotonic() - start,
+                       error=isinstance(response, dict) and 'error' in response)
+        return response
+
+    async def request(self, method, params):
+        '''Send one call, returns the raw response'''
+        return await self._post(_payload(next(self._ids), method, params), method)
+
+    async def request_batch(self, calls):
+        '''Send [(method, params), ...] as one JSON array, returns raw responses in order'''
+        payload = [_payload(idx, method, params) for idx, (method, params) in enumerate(calls)]
+        responses = await self._post(payload, 'batch')
+        if isinstance(responses, dict):
+            # Node rejected the whole batch
+            raise ValueError(responses.get('error', responses))
+        ret = [None] * len(calls)
+        for response in responses:
+            ret[batch_index(response, len(calls))] = response
+        return ret
+
+    async def close(self):
+        '''Close the session'''
+        await self.session.close()
+
+
+class AsyncWSClient:
+    '''JSON-RPC over one WebSocket connection, responses are matched by request id'''
+
+    def __init__(self, endpoint, timeout=30):
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.session = aiohttp.ClientSession()
+        self._ws = None
+        self._connecting = asyncio.Lock()
+        self._waiting = {}
+        self._ids = itertools.count()
+
+    @property
+    def closed(self):
+        '''Whether the session is closed'''
+        return self.session.closed
+
+    async def _connect(self):
+        async with self._connecting:
+            if self._ws is None or self._ws.closed:
+                self._ws = await self.session.ws_connect(self.endpoint, max_msg_size=0)
+                asyncio.ensure_future(self._read(self._ws))
+        return self._ws
+
+    async def _read(self, ws):
+        async for msg in ws:
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                continue
+            data = json.loads(msg.data)
+            for response in data if isinstance(data, list) else [data]:
+                future = self._waiting.pop(response.get('id'), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        for future in list(self._waiting.values()):
+            if not future.done():
+                future.set_exception(ConnectionError("WebSocket %s closed" % self.endpoint))
+
+    async def _send(self, payload, ids):
+        ws = await self._connect()
+        loop = asyncio.get_event_loop()
+        waiting = []
+        for req_id in ids:
+            self._waiting[req_id] = loop.create_future()
+            waiting.append(self._waiting[req_id])
+        try:
+            await ws.send_json(payload)
+            return await asyncio.wait_for(asyncio.gather(*waiting), self.timeout)
+        finally:
+            for req_id in ids:
+                self._waiting.pop(req_id, None)
+
+    async def request(self, method, params):
+        '''Send one call, returns the raw response'''
+        req_id = next(self._ids)
+        responses = await self._send(_payload(req_id, method, params), [req_id])
+        return responses[0]
+
+    async def request_batch(self, calls):
+        '''Send [(method, params), ...] as one JSON array, returns raw responses in order'''
+        ids = [next(self._ids) for _ in calls]
+        payload = [_payload(req_id, method, params)
+                   for req_id, (method, params) in zip(ids, calls)]
+        return await self._send(payload, ids)
+
+    async def close(self):
+        '''Close the connection and session'''
+        if self._ws is not None:
+            await self._ws.close()
+        await self.session.close()
+
+
+class AsyncReceiptTracker:
+    '''asyncio counterpart of ReceiptTracker, polls all outstanding receipts once per block'''
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, w3h, poll_interval=POLL_INTERVAL):
+        self.w3h = w3h
+        self.poll_interval = poll_interval
+        self._pending = {}
+        self._task = None
+        self._last_block = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def track(self, tx_hash, callback=None):
+        '''
+        Start tracking tx_hash.
+        :param callback Called with the future once the receipt arrives
+        :returns: asyncio Future of the transaction receipt
+        '''
+        key = HexBytes(tx_hash)
+        future = self._pending.get(key)
+        if future is None:
+            future = asyncio.get_event_loop().create_future()
+            self._pending[key] = future
+        if self._task is None or self._task.done():
+            self._last_block = None
+            self._task = asyncio.ensure_future(self._run())
+        if callback:
+            future.add_done_callback(callback)
+        return future
+
+    def untrack(self, tx_hash):
+        '''Stop tracking tx_hash, its future is cancelled'''
+        future = self._pending.pop(HexBytes(tx_hash), None)
+        if future is not None:
+            future.cancel()
+
+    async def wait(self, tx_hash_list, timeout=60):
+        '''
+        Wait for all transactions in tx_hash_list.
+        :returns: List of receipts, one for each transaction in-order.
+        '''
+        if not tx_hash_list:
+            return []
+        pending = [self.track(tx_hash) for tx_hash in tx_hash_list]
+        _, not_done = await asyncio.wait(pending, timeout=timeout)
+        if not_done:
+            timed_out = []
+            for tx_hash, future in zip(tx_hash_list, pending):
+                if future in not_done:
+                    self.untrack(tx_hash)
+                    timed_out.append(to_hex_data(HexBytes(tx_hash)))
+            raise TimeoutError("Transaction %s timed out" % ', '.join(timed_out))
+        return [future.result() for future in pending]
+
+    async def poll(self):
+        '''Query receipts of all outstanding transactions with one batch request'''
+        tx_hashes = list(self._pending)
+        if not tx_hashes:
+            return
+        receipts = await self.w3h.batch(
+            [('eth_getTransactionReceipt', [to_hex_data(tx_hash)]) for tx_hash in tx_hashes],
+            raise_on_error=False)
+        for tx_hash, receipt in zip(tx_hashes, receipts):
+            if receipt is None or not receipt['blockNumber']:
+                continue
+            future = self._pending.pop(tx_hash, None)
+            if future is not None and not future.done():
+                future.set_result(Receipt.from_dict(receipt))
+
+    async def _run(self):
+        while self._pending:
+            try:
+                block_number = await self.w3h.block_number()
+                if block_number != self._last_block:
+                    await self.poll()
+                    self._last_block = block_number
+            except Exception:  # pylint: disable=broad-except
+                LOG.exception("Failed to poll transaction receipts")
+            await asyncio.sleep(self.poll_interval)
+
+
+# pylint: disable=too-many-public-methods
+class AsyncW3Helper:
+    ''' asyncio counterpart of W3Helper '''
+    DEFAULT_GAS_PRICE = W3Helper.DEFAULT_GAS_PRICE
+    DEFAULT_GAS = W3Helper.DEFAULT_GAS
+
+    def __init__(self, fullnode_endpoint, pool_size=100):
+        self.endpoint = fullnode_endpoint
+        self.pool_size = pool_size
+        self.nonces = AsyncNonceManager(self.get_nonce_for_next_transaction_pending)
+        self.receipts = AsyncReceiptTracker(self)
+        # Filled with get / put, estimate_gas is async
+        self.gas_estimates = GasEstimateCache(None)
+
+    @property
+    def client(self):
+        '''Client shared by all helpers of this endpoint'''
+        return get_client(self.endpoint, self.pool_size)
+
+    @staticmethod
+    def _unwrap(method, response):
+        if 'error' in response:
+            raise ValueError(response['error'])
+        return format_result(method, response.get('result'))
+
+    async def call_api(self, method, *args):
+        '''Call RPC api'''
+        return self._unwrap(method, await self.client.request(method, list(args)))
+
+    async def batch(self, calls, raise_on_error=True, max_batch_size=BatchRequest.MAX_BATCH_SIZE):
+        '''
+        Send [(method, params), ...] with JSON array requests, chunks are sent concurrently.
+        :returns: list of formatted results in order, None for failed calls if not raise_on_error
+        '''
+        chunks = [calls[start:start + max_batch_size]
+                  for start in range(0, len(calls), max_batch_size)]
+        responses = await asyncio.gather(*[self.client.request_batch(chunk) for chunk in chunks])
+        ret = []
+        for (method, _), response in zip(calls, itertools.chain(*responses)):
+            if response is None or 'error' in response:
+                if raise_on_error:
+                    raise ValueError(response['error'] if response else "No response")
+                ret.append(None)
+            else:
+                ret.append(format_result(method, response.get('result')))
+        return ret
+
+    async def close(self):
+        '''
+        Nothing to close per helper: the client of the endpoint is shared with the other
+        helpers of the event loop, close_clients() closes it once all are done.
+        '''
+
+    async def eth_call(self, transaction, block_identifier='latest'):
+        '''Call eth_call'''
+        return await self.call_api('eth_call', to_rpc_transaction(transaction),
+                                   to_block_param(block_identifier))
+
+    async def estimate_gas(self, transaction):
+        '''Gas limit for transaction, cached per call shape, see GasEstimateCache'''
+        gas = self.gas_estimates.get(transaction)
+        if gas is None:
+            gas = self.gas_estimates.put(transaction, await self.call_api(
+                'eth_estimateGas', to_rpc_transaction(transaction)))
+        return gas
+
+    async def gas_price(self):
+        '''Call eth_gasPrice'''
+        return await self.call_api('eth_gasPrice')
+
+    async def block_number(self):
+        '''Call eth_blockNumber'''
+        return await self.call_api('eth_blockNumber')
+
+    async def get_balance(self, acc, block_identifier='latest'):
+        """ Get current balance for given account """
+        balance = await self.call_api('eth_getBalance', acc, to_block_param(block_identifier))
+        LOG.debug('Balance of %s = %s', acc, balance)
+        return balance
+
+    async def get_logs(self, event_filter):
+        '''Call eth_getLogs'''
+        return await self.call_api('eth_getLogs', event_filter)
+
+    async def get_block(self, block_id='latest', full_transactions=False):
+        """ Gets the block information, block_id can be block number, hash or tag """
+        if is_block_hash(block_id):
+            return await self.call_api('eth_getBlockByHash', to_hex_data(block_id),
+                                       full_transactions)
+        return await self.call_api('eth_getBlockByNumber', to_block_param(block_id),
+                                   full_transactions)
+
+    async def get_transaction(self, tx_hash):
+        '''Get TX'''
+        return await self.call_api('eth_getTransactionByHash', to_hex_data(tx_hash))
+
+    async def get_receipt_for_transaction(self, tx_hash):
+        """ Get transaction receipt from hash """
+        return await self.call_api('eth_getTransactionReceipt', to_hex_data(tx_hash))
+
+    async def get_nonce_for_next_transaction(self, acc, block_identifier='latest'):
+        """ Gets the next nonce value for transaction for a given account """
+        return await self.call_api('eth_getTransactionCount', acc,
+                                   to_block_param(block_identifier))
+
+    async def get_nonce_for_next_transaction_pending(self, acc):
+        """ Same as get_nonce_for_next_transaction with "pending" parameter """
+        return await self.get_nonce_for_next_transaction(acc, 'pending')
+
+    async def allocate_nonce(self, acc):
+        '''Get nonce for next transaction of account from local AsyncNonceManager'''
+        return await self.nonces.allocate(acc)
+
+    @staticmethod
+    def address_of(private_key):
+        '''Address of private key'''
+        return Account.privateKeyToAccount(private_key).address
+
+    @staticmethod
+    def sign_transaction(src_private_key, transaction):
+        """ Sign the transaction, returns signed transaction """
+        return Account.signTransaction(transaction, src_private_key)
+
+    async def send_raw_transaction(self, raw_transaction):
+        """ Sends raw transaction, returns transaction hash """
+        return await self.call_api('eth_sendRawTransaction', to_hex_data(raw_transaction))
+
+    async def execute_transaction(self, src_private_key, transaction):
+        """
+        Sends the transaction without waiting for it to complete, see
+        W3Helper.execute_transaction.
+        :returns: transaction hash
+        """
+        addr = self.address_of(src_private_key)
+        signed_txn = None
+        try:
+            signed_txn = self.sign_transaction(src_private_key, transaction)
+            try:
+                tx_hash = await self.send_raw_transaction(signed_txn.rawTransaction)
+            except ValueError as err:
+                if not is_nonce_too_low(err):
+                    raise
+                await self.nonces.reconcile(addr)
+                transaction = dict(transaction, nonce=await self.allocate_nonce(addr))
+                LOG.info("Nonce too low for %s, resend with nonce %s", addr,
+                         transaction['nonce'])
+                signed_txn = self.sign_transaction(src_private_key, transaction)
+                tx_hash = await self.send_raw_transaction(signed_txn.rawTransaction)
+        except Exception as err:
+            if signed_txn is None or isinstance(err, ValueError):
+                # Not signed, or rejected by the node (JSON-RPC error)
+                self.nonces.release(addr, transaction['nonce'])
+            else:
+                LOG.warning("Sending nonce %s of %s failed: %r, keep it allocated",
+                            transaction['nonce'], addr, err)
+                try:
+                    await self.nonces.reconcile(addr)
+                except Exception:  # pylint: disable=broad-except
+                    LOG.warning("Failed to reconcile nonce of %s", addr, exc_info=True)
+            raise
+        now = datetime.datetime.now()
+        LOG.debug("Execute transaction hash = %s on %s", hexlify(tx_hash), str(now))
+        return tx_hash, now
+
+    async def execute_and_wait_for_transaction(self, src_private_key, transaction, timeout=60):
+        """ Sends the transaction and waits for it to complete.
+        :returns: transaction receipt
+        """
+        tx_hash, _ = await self.execute_transaction(src_private_key, transaction)
+        LOG.info("TX hash: %s", hexlify(tx_hash))
+        receipt = await self.wait_receipt_for_transaction(tx_hash, timeout)
+        LOG.info("Transaction %s executed. blockHash=%s  blockNumber=%s, cumulativeGasUsed=%s",
+                 hexlify(tx_hash), hexlify(receipt['blockHash']), receipt['blockNumber'],
+                 receipt['cumulativeGasUsed'])
+        return receipt
+
+    async def execute_and_wait_for_transactions(self, src_private_key, transactions, timeout=60):
+        """ Sends the transactions concurrently and waits for them to complete.
+        :returns: List of receipts, one for each transaction in-order.
+        """
+        sent = await asyncio.gather(*[self.execute_transaction(src_private_key, txn)
+                                      for txn in transactions])
+        return await self.wait_for_transactions([tx_hash for tx_hash, _ in sent], timeout)
+
+    async def wait_receipt_for_transaction(self, tx_hash, timeout=60):
+        """ Waits for the transaction receipt, raises TimeoutError after timeout """
+        return (await self.receipts.wait([tx_hash], timeout))[0]
+
+    async def wait_for_transactions(self, tx_hash_list, timeout=60):
+        """ Waits for all transactions in tx_hash_list to finish.
+        :returns: List of receipts, one for each transaction in-order.
+        """
+        return await self.receipts.wait(tx_hash_list, timeout)
+
+    async def send_tokens(self, private_key, dest_acc, value, data=b''):
+        '''Send tokens to account'''
+        addr = self.address_of(private_key)
+        tx = {
+            "value": value,
+            "to": dest_acc,
+            "data": data,
+            "from": addr,
+            "gasPrice": await self.gas_price()
+        }
+        LOG.debug(tx)
+        try:
+            cached_gas = self.gas_estimates.get(tx)
+            tx["gas"] = cached_gas or await self.estimate_gas(tx)
+            tx['nonce'] = await self.allocate_nonce(addr)
+            receipt = await self.execute_and_wait_for_transaction(private_key, tx)
+        except Exception:
+            return None
+        # Raises if the transaction failed with a cached estimate
+        self.gas_estimates.check_receipt(tx, receipt, cached=cached_gas is not None)
+        return receipt
+
+
+class AsyncFuncall(Funcall):
+    '''Funcall of AsyncSmartContract, calling it returns a coroutine'''
+    __slots__ = ()
+
+    def __call__(self, *args, **kwargs):
+        if self.is_event:
+            async def _func(_from, count=1, timeout=120):
+                return await self.contract.get_logs(self.signature, _from, count=count,
+                                                    timeout=timeout)
+            _func.__event__ = self.signature
+            return _func
+        return self._call(*args, **kwargs)
+
+    async def _call(self, *args, **kwargs):
+        private_key, data = self.prepare(*args)
+        if private_key:
+            return self.attach_events(await self.contract.call(private_key, data, **kwargs))
+        try:
+            return self.decode_return(await self.contract.view(data, **kwargs))
+        except Exception:
+            return None
+
+
+class AsyncSmartContract(SmartContract):
+    '''asyncio Contract Base, w3h is an AsyncW3Helper'''
+    FUNCALL = AsyncFuncall
+
+    async def view(self, data, block_identifier='latest'):
+        '''Call readonly method ...'''
+        tx = {
+            "to": self.contract_addr,
+            "data": data,
+            "from": self.contract_addr,
+        }
+        return await self.w3h.eth_call(tx, block_identifier)
+
+    async def call(self, private_key, _data, **kwargs):
+        '''Execute TX'''
+        addr = self.w3h.address_of(private_key)
+        tx = {
+            "value": 0,
+            "to": self.contract_addr,
+            "data": _data,
+            "from": addr,
+            "gasPrice": await self.w3h.gas_price()
+        }
+        LOG.debug(tx)
+        cached_gas = self.w3h.gas_estimates.get(tx)
+        tx["gas"] = cached_gas or await self.w3h.estimate_gas(tx)
+        tx['nonce'] = await self.w3h.allocate_nonce(addr)
+        timeout = kwargs.get("timeout", 60)
+
+        receipt = await self.w3h.execute_and_wait_for_transaction(private_key, tx,
+                                                                  timeout=timeout)
+        self.w3h.gas_estimates.check_receipt(tx, receipt, cached=cached_gas is not None)
+        return receipt
+
+    async def _poll_logs(self, events, _from, count, timeout, poll_interval=5):
+        '''
+        Scan from block _from like EventScanner.follow_logs: logs of new blocks are fetched
+        in adaptive chunks and dispatched by EventRegistry, sleeps only when caught up.
+        '''
+        registry = EventRegistry(events)
+        topics = [list(dict.fromkeys(spec.topic_hex for spec in registry.decoders.values()))]
+        chunk_size = EventScanner.INITIAL_CHUNK
+        deadline = time.time() + timeout
+        next_block = _from
+        results = []
+        while True:
+            head = await self.w3h.block_number()
+            while next_block <= head:
+                end = min(next_block + chunk_size - 1, head)
+                try:
+                    logs = await self.w3h.get_logs({
+                        "address": self.contract_addr,
+                        "topics": topics,
+                        "fromBlock": hex(next_block),
+                        "toBlock": hex(end),
+                    })
+                except ValueError as err:
+                    if not is_too_many_results(err) or chunk_size <= EventScanner.MIN_CHUNK:
+                        raise
+                    chunk_size = max(EventScanner.MIN_CHUNK, chunk_size // 2)
+                    continue
+                for log in logs:
+                    spec = registry.lookup(log)
+                    if spec is None:
+                        continue
+                    results.append((spec.format(log), Log.from_dict(log)))
+                    if len(results) >= count:
+                        return results
+                if len(logs) < EventScanner.SMALL_RESPONSE:
+                    chunk_size = min(EventScanner.MAX_CHUNK, chunk_size * 2)
+                next_block = end + 1
+            if time.time() >= deadline:
+                return results
+            await asyncio.sleep(poll_interval)
+
+    async def get_logs(self, event, _from, count=1, timeout=120):
+        '''Filter log and decode'''
+        return await self._poll_logs([event], _from, count, timeout)
+
+    async def watch(self, events, _from, count=1, timeout=120):
+        '''Filter logs of any of events and decode, returns [(decoded, log), ...]'''
+        return await self._poll_logs(events, _from, count, timeout)
@@ -0,0 +1,242 @@
+"""
+Block history of long running tests: the head is polled with eth_blockNumber and each
+new block header is fetched once (batched when several blocks arrived), only
+(number, timestamp, tx count, gasUsed, gasLimit) is kept in a fixed size ring buffer.
+"""
+
+import array
+import collections
+import logging
+import threading
+import time
+
+from requests.exceptions import RequestException
+
+from example.python.utils.jsonrpc import BatchRequest
+from example.python.utils.transport import RPCTransportError
+
+LOG = logging.getLogger(__name__)
+
+BlockRecord = collections.namedtuple(
+    'BlockRecord', ['number', 'timestamp', 'tx_count', 'gas_used', 'gas_limit', 'seen'])
+
+
+class BlockHistory:
+    '''
+    Ring buffer of BlockRecord in typed arrays, the oldest record is overwritten once
+    capacity records are stored. Not thread safe, see BlockRecorder.
+    '''
+    CAPACITY = 4096
+
+    def __init__(self, capacity=CAPACITY):
+        if capacity < 2:
+            raise ValueError("Invalid capacity: %s" % capacity)
+        self.capacity = capacity
+        self.numbers = array.array('q', bytes(8 * capacity))
+        self.timestamps = array.array('q', bytes(8 * capacity))
+        self.tx_counts = array.array('l', bytes(array.array('l').itemsize * capacity))
+        self.gas_used = array.array('q', bytes(8 * capacity))
+        self.gas_limits = array.array('q', bytes(8 * capacity))
+        # time.time() when the block was seen by the recorder
+        self.seen = array.array('d', bytes(8 * capacity))
+        self._next = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        '''Records, oldest first'''
+        for pos in self._positions(self._size):
+            yield self._record(pos)
+
+    def _positions(self, count):
+        start = self._next - count
+        return [(start + idx) % self.capacity for idx in range(count)]
+
+    def _record(self, pos):
+        return BlockRecord(self.numbers[pos], self.timestamps[pos], self.tx_counts[pos],
+                           self.gas_used[pos], self.gas_limits[pos], self.seen[pos])
+
+    # pylint: disable=too-many-arguments
+    def append(self, number, timestamp, tx_count, gas_used, gas_limit, seen=None):
+        '''Add the record of a new block'''
+        pos = self._next
+        self.numbers[pos] = number
+        self.timestamps[pos] = timestamp
+        self.tx_counts[pos] = tx_count
+        self.gas_used[pos] = gas_used
+        self.gas_limits[pos] = gas_limit
+        self.seen[pos] = time.time() if seen is None else seen
+        self._next = (pos + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def append_block(self, block, seen=None):
+        '''Add the record of a block dict returned by getBlock'''
+        self.append(block['number'], block['timestamp'], len(block['transactions']),
+                    block['gasUsed'], block['gasLimit'], seen)
+
+    @property
+    def last_number(self):
+        '''Number of the newest block, None if empty'''
+        if not self._size:
+            return None
+        return self.numbers[(self._next - 1) % self.capacity]
+
+    def last(self, count=None):
+        '''Up to count newest records (all by default), oldest first'''
+        count = self._size if count is None else min(count, self._size)
+        return [self._record(pos) for pos in self._positions(count)]
+
+    def clear(self):
+        '''Drop all records'''
+        self._next = 0
+        self._size = 0
+
+    def stats(self, window=None):
+        '''
+        Throughput of the newest window blocks (all by default).
+        Transactions of the first block of the window are not counted in TPS, they were
+        sent before the measured interval.
+        :returns: dict, times in seconds, None when there are less than 2 blocks
+        '''
+        positions = self._positions(self._size if window is None else min(window, self._size))
+        ret = {
+            'blocks': len(positions),
+            'first_block': self.numbers[positions[0]] if positions else None,
+            'last_block': self.numbers[positions[-1]] if positions else None,
+            'transactions': sum(self.tx_counts[pos] for pos in positions),
+            'tps': None,
+            'block_interval_avg': None,
+            'block_interval_min': None,
+            'block_interval_max': None,
+            'gas_utilization': None,
+        }
+        gas_limit = sum(self.gas_limits[pos] for pos in positions)
+        if gas_limit:
+            ret['gas_utilization'] = sum(self.gas_used[pos] for pos in positions) / gas_limit
+        if len(positions) < 2:
+            return ret
+        first, last = positions[0], positions[-1]
+        span = self.timestamps[last] - self.timestamps[first]
+        # Blocks may be missing after the recorder fell behind, intervals are per block
+        intervals = [(self.timestamps[cur] - self.timestamps[prev])
+                     / max(1, self.numbers[cur] - self.numbers[prev])
+                     for prev, cur in zip(positions, positions[1:])]
+        ret['block_interval_avg'] = span / max(1, self.numbers[last] - self.numbers[first])
+        ret['block_interval_min'] = min(intervals)
+        ret['block_interval_max'] = max(intervals)
+        if span > 0:
+            ret['tps'] = (ret['transactions'] - self.tx_counts[first]) / span
+        return ret
+
+
+class BlockRecorder:
+    '''
+    Record new blocks of w3h into a BlockHistory, in a background thread (start/stop or
+    as context manager) or in the caller thread with run(stop_event).
+    Each round costs one eth_blockNumber, plus one batch of eth_getBlockByNumber
+    (without transactions) when new blocks arrived. When more than capacity blocks were
+    missed only the newest ones are fetched.
+    '''
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, w3h, capacity=BlockHistory.CAPACITY, poll_interval=POLL_INTERVAL,
+                 max_batch_size=BatchRequest.MAX_BATCH_SIZE):
+        self.w3h = w3h
+        self.history = BlockHistory(capacity)
+        self.poll_interval = poll_interval
+        self.max_batch_size = max_batch_size
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def poll(self):
+        '''
+        Record blocks produced since the last call, the first call records the head only.
+        :returns: number of new blocks
+        '''
+        head = self.w3h.eth.blockNumber
+        last = self.history.last_number
+        if last is None:
+            last = head - 1
+        elif head < last:
+            LOG.warning("Chain head went back from %s to %s, history cleared", last, head)
+            with self._lock:
+                self.history.clear()
+            last = head - 1
+        first = max(last + 1, head - self.history.capacity + 1)
+        if first > last + 1:
+            LOG.warning("Blocks %s ~ %s are not recorded", last + 1, first - 1)
+        recorded = 0
+        for start in range(first, head + 1, self.max_batch_size):
+            batch = self.w3h.batch(self.max_batch_size)
+            for number in range(start, min(head + 1, start + self.max_batch_size)):
+                batch.get_block(number)
+            blocks = batch.execute()
+            seen = time.time()
+            with self._lock:
+                for block in blocks:
+                    if block is None:
+                        # Not known yet by the endpoint which served the batch, next round
+                        return recorded
+                    self.history.append_block(block, seen)
+                    recorded += 1
+        return recorded
+
+    def run(self, stop_event):
+        '''Poll until stop_event is set, RPC failures are logged and retried'''
+        while not stop_event.is_set():
+            try:
+                self.poll()
+            except (RequestException, RPCTransportError, ValueError) as err:
+                LOG.warning("Block history poll failed: %s", err)
+            stop_event.wait(self.poll_interval)
+
+    def start(self):
+        '''Start recording in a daemon thread'''
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, args=(self._stop,),
+                                        name='BlockRecorder', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        '''Stop the recording thread, records are kept'''
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def records(self, count=None):
+        '''Up to count newest BlockRecord, oldest first'''
+        with self._lock:
+            return self.history.last(count)
+
+    def stats(self, window=None):
+        '''BlockHistory.stats() of the newest window blocks'''
+        with self._lock:
+            return self.history.stats(window)
+
+    def summary(self, window=None):
+        '''Stats as one line for logs'''
+        stats = self.stats(window)
+
+        def _fmt(value, fmt):
+            return '-' if value is None else fmt % value
+        return ('blocks=%s (%s ~ %s) txs=%s tps=%s interval=%s (min %s, max %s) gas=%s'
+                % (stats['blocks'], stats['first_block'], stats['last_block'],
+                   stats['transactions'], _fmt(stats['tps'], '%.2f'),
+                   _fmt(stats['block_interval_avg'], '%.2fs'),
+                   _fmt(stats['block_interval_min'], '%.2fs'),
+                   _fmt(stats['block_interval_max'], '%.2fs'),
+                   _fmt(stats['gas_utilization'] and stats['gas_utilization'] * 100, '%.1f%%')))
@@ -0,0 +1,85 @@
+"""
+Helpers shared by the bridge CLI scripts (bridge_load, bridge_reconcile, bridge_index,
+bridge_analytics): bridge config of env.json or the e2e devnet, transfer directions
+and small block / topic utilities.
+"""
+
+import json
+import math
+import os
+
+H2F = 'H->F'
+F2H = 'F->H'
+DIRECTIONS = (H2F, F2H)
+
+ENV_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'env.json'))
+E2E_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..',
+                                       'validator', 'e2e'))
+E2E_HOME_RPC = 'http://127.0.0.1:8541'
+E2E_FOREIGN_RPC = 'http://127.0.0.1:8542'
+CONFIG_OVERRIDES = ('h_rpc', 'f_rpc', 'h_bridge', 'f_bridge')
+# Bridges count daily limits per now / 1 days
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def percentile(values, pct):
+    '''pct (0 ~ 100) percentile of sorted values, None if empty'''
+    if not values:
+        return None
+    return values[max(0, math.ceil(pct / 100 * len(values)) - 1)]
+
+
+def load_e2e_config(e2e_dir=E2E_DIR):
+    '''Endpoints, bridges and user key of the devnet of validator/e2e'''
+    with open(os.path.join(e2e_dir, 'data', 'deployed.json')) as file:
+        deployed = json.load(file)
+    with open(os.path.join(e2e_dir, 'constants.json')) as file:
+        constants = json.load(file)
+    return {
+        'h_rpc': E2E_HOME_RPC,
+        'f_rpc': E2E_FOREIGN_RPC,
+        'h_bridge': deployed['homeBridge']['address'],
+        'f_bridge': deployed['foreignBridge']['address'],
+        'keys': [constants['user']['privateKey']],
+    }
+
+
+def add_config_args(parser):
+    '''Add --token, --e2e and endpoint / bridge overrides, read by config_from_args()'''
+    parser.add_argument('--token', default='usdt', help='Entry of env.json: usdt or dai')
+    parser.add_argument('--e2e', nargs='?', const=E2E_DIR,
+                        help='Use devnet of validator/e2e (default dir %s)' % E2E_DIR)
+    parser.add_argument('--h-rpc', help='Home RPC URL, overrides config')
+    parser.add_argument('--f-rpc', help='Foreign RPC URL, overrides config')
+    parser.add_argument('--h-bridge', help='Home bridge address, overrides config')
+    parser.add_argument('--f-bridge', help='Foreign bridge address, overrides config')
+
+
+def config_from_args(args):
+    '''Bridge config of the e2e devnet or the env.json entry, with overrides of args'''
+    if args.e2e:
+        config = load_e2e_config(args.e2e)
+    else:
+        with open(ENV_PATH) as file:
+            config = json.load(file)[args.token]
+    for name in CONFIG_OVERRIDES:
+        if getattr(args, name):
+            config[name] = getattr(args, name)
+    return config
+
+
+def block_at(w3h, timestamp, head=None):
+    '''First block with timestamp >= timestamp, by binary search'''
+    low, high = 0, w3h.eth.blockNumber if head is None else head
+    while low < high:
+        mid = (low + high) // 2
+        if w3h.get_block(mid, debug=False)['timestamp'] < timestamp:
+            low = mid + 1
+        else:
+            high = mid
+    return low
+
+
+def address_topic(address):
+    '''Indexed address param as topic'''
+    return '0x%s%s' % ('0' * 24, address[2:].lower())
@@ -0,0 +1,143 @@
+"""
+Bounded LRU caches for immutable chain data fetched by W3Helper.
+"""
+
+import collections
+import threading
+
+from hexbytes import HexBytes
+
+from example.python.utils.jsonrpc import is_block_hash
+from example.python.utils.records import Receipt
+
+
+class LRUCache:
+    '''Bounded LRU cache with hit / miss counters, safe across threads'''
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._data = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        '''Get value of key and mark it as recently used'''
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        '''Set value of key, evicts the least recently used key when full'''
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        '''Remove key, returns its value'''
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def keys(self):
+        '''Snapshot of keys, least recently used first'''
+        with self._lock:
+            return list(self._data)
+
+    def clear(self):
+        '''Drop all entries and reset counters'''
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        '''Size and hit / miss counters'''
+        return {'size': len(self._data), 'maxsize': self.maxsize,
+                'hits': self.hits, 'misses': self.misses}
+
+
+class ChainCache:
+    '''
+    Cache of immutable chain data: blocks by hash, receipts and transactions of mined
+    transactions by tx hash, and block number to hash once the block is at least
+    `confirmations` blocks below the highest block seen.
+    '''
+    CONFIRMATIONS = 12
+
+    def __init__(self, maxsize=4096, confirmations=CONFIRMATIONS):
+        self.confirmations = confirmations
+        self.head = None
+        self.blocks = LRUCache(maxsize)
+        self.block_hashes = LRUCache(maxsize)
+        self.receipts = LRUCache(maxsize)
+        self.transactions = LRUCache(maxsize)
+
+    def confirmed(self, block_number):
+        '''Whether block_number is past the confirmation depth'''
+        return self.head is not None and self.head - block_number >= self.confirmations
+
+    def get_block(self, block_id):
+        '''Cached block by hash or confirmed number, None for tags and misses'''
+        if is_block_hash(block_id):
+            return self.blocks.get(HexBytes(block_id))
+        if isinstance(block_id, int) and self.confirmed(block_id):
+            block_hash = self.block_hashes.get(block_id)
+            if block_hash is not None:
+                return self.blocks.get(block_hash)
+        return None
+
+    def put_block(self, block):
+        '''Cache block, pending blocks are ignored'''
+        if block is None or block['hash'] is None:
+            return
+        number = block['number']
+        if self.head is None or number > self.head:
+            self.head = number
+        self.blocks.put(HexBytes(block['hash']), block)
+        if self.confirmed(number):
+            self.block_hashes.put(number, HexBytes(block['hash']))
+
+    def get_receipt(self, tx_hash):
+        '''Cached receipt by tx hash, bytes or hex string'''
+        return self.receipts.get(HexBytes(tx_hash))
+
+    def put_receipt(self, receipt):
+        '''Cache receipt of mined transaction, as compact Receipt record'''
+        if receipt is not None and receipt['blockNumber']:
+            self.receipts.put(HexBytes(receipt['transactionHash']), Receipt.from_dict(receipt))
+
+    def get_transaction(self, tx_hash):
+        '''Cached transaction by tx hash, bytes or hex string'''
+        return self.transactions.get(HexBytes(tx_hash))
+
+    def put_transaction(self, transaction):
+        '''Cache mined transaction'''
+        if transaction is not None and transaction['blockNumber']:
+            self.transactions.put(HexBytes(transaction['hash']), transaction)
+
+    def clear(self):
+        '''Drop all entries, e.g. after the chain is reverted to a snapshot'''
+        self.head = None
+        for cache in (self.blocks, self.block_hashes, self.receipts, self.transactions):
+            cache.clear()
+
+    def stats(self):
+        '''Hit / miss counters of each cache'''
+        return {
+            'blocks': self.blocks.stats(),
+            'block_hashes': self.block_hashes.stats(),
+            'receipts': self.receipts.stats(),
+            'transactions': self.transactions.stats(),
+        }
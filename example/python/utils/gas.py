@@ -0,0 +1,167 @@
+"""
+Caches of gas related RPC results used on the write paths of W3Helper and SmartContract.
+"""
+
+import logging
+import threading
+import time
+
+import eth_utils
+
+from example.python.utils.cache import LRUCache
+
+LOG = logging.getLogger(__name__)
+
+
+class GasPriceCache:
+    '''
+    eth_gasPrice cached per block: an entry is reused at most ttl seconds, and only while
+    the block number passed to get() is the same. Callers pass the head they already
+    know (see W3Helper.gas_price), None only relies on ttl.
+    '''
+    TTL = 15
+
+    def __init__(self, fetch_gas_price, ttl=TTL):
+        self.fetch_gas_price = fetch_gas_price
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._value = None
+        self._block = None
+        self._expires = 0
+
+    def get(self, block_number=None):
+        '''Cached gas price, fetched again on a new block_number or expiry'''
+        with self._lock:
+            now = time.monotonic()
+            if (self._value is not None and now < self._expires
+                    and (block_number is None or block_number == self._block)):
+                return self._value
+            self._value = self.fetch_gas_price()
+            self._block = block_number
+            self._expires = now + self.ttl
+            LOG.debug("Gas price %s at block %s", self._value, block_number)
+            return self._value
+
+    def invalidate(self):
+        '''Drop cached gas price'''
+        with self._lock:
+            self._value = None
+
+
+def _selector_and_size(data):
+    if isinstance(data, (bytes, bytearray)):
+        return bytes(data[:4]).hex(), len(data)
+    data = (data or '0x')[2:]
+    return data[:8].lower(), len(data) // 2
+
+
+class GasEstimateCache:
+    '''
+    eth_estimateGas results keyed by call shape: target address, selector, call data size
+    and whether value is sent. Only methods opted in with cache_method() are cached, e.g.
+    ERC20.transfer of a fixed amount to the bridge, whose gas cost does not depend on
+    argument values; the first estimate of a shape is reused for other arguments.
+    All estimates are raised by margin. Entries are dropped when a transaction of the
+    shape fails, or when its target contract is upgraded (see check_receipt). Contract
+    creations and plain transfers are never cached.
+    '''
+    MARGIN = 1.25
+    MAX_ENTRIES = 1024
+    # Emitted by upgradeability proxies, see UpgradeabilityProxy.sol
+    UPGRADED_TOPIC = eth_utils.to_hex(eth_utils.keccak(text='Upgraded(uint256,address)'))
+
+    def __init__(self, estimate_gas, methods=(), margin=MARGIN, max_entries=MAX_ENTRIES):
+        self.estimate_gas = estimate_gas
+        self.margin = margin
+        self.entries = LRUCache(max_entries)
+        self.methods = set()
+        for method in methods:
+            self.cache_method(method)
+
+    def cache_method(self, method):
+        '''
+        Opt in caching of method, a signature like "transfer(address,uint256)" or a
+        0x-prefixed selector. Its gas cost must not depend on argument values.
+        '''
+        if '(' in method:
+            selector = eth_utils.keccak(text=method)[:4].hex()
+        else:
+            selector = method[2:].lower()
+        self.methods.add(selector)
+        return selector
+
+    def key(self, transaction):
+        '''Shape of transaction, None if it is not cached'''
+        if not transaction.get('to'):
+            return None
+        selector, size = _selector_and_size(transaction.get('data'))
+        if selector not in self.methods:
+            return None
+        return (transaction['to'].lower(), selector, size, bool(transaction.get('value')))
+
+    def get(self, transaction):
+        '''Cached estimate with margin, None on miss'''
+        key = self.key(transaction)
+        if key is None:
+            return None
+        gas = self.entries.get(key)
+        return None if gas is None else int(gas * self.margin)
+
+    def put(self, transaction, gas):
+        '''Cache a live estimate of transaction, returns it with margin'''
+        key = self.key(transaction)
+        if key is not None:
+            self.entries.put(key, gas)
+        return int(gas * self.margin)
+
+    def estimate(self, transaction):
+        '''Cached estimate with margin, estimated by the node on miss'''
+        gas = self.get(transaction)
+        if gas is None:
+            gas = self.put(transaction, self.estimate_gas(transaction))
+        return gas
+
+    def invalidate(self, address=None, transaction=None):
+        '''Drop the entry of transaction, all entries of address, or everything'''
+        if transaction is not None:
+            key = self.key(transaction)
+            if key is not None:
+                self.entries.pop(key)
+        elif address is not None:
+            address = address.lower()
+            for key in self.entries.keys():
+                if key[0] == address:
+                    self.entries.pop(key)
+        else:
+            self.entries.clear()
+
+    def check_receipt(self, transaction, receipt, cached=False):
+        '''
+        Drop stale entries after transaction is mined: failed, or contract upgraded.
+        A cached estimate skips the revert check of eth_estimateGas, so raises ValueError
+        when transaction failed and cached says its gas came from the cache.
+        '''
+        for log in receipt.get('logs', ()):
+            topics = log['topics']
+            if topics and _to_hex(topics[0]) == self.UPGRADED_TOPIC:
+                LOG.info("Contract %s upgraded, drop its gas estimates", log['address'])
+                self.invalidate(address=log['address'])
+        if receipt['status']:
+            return
+        if self.key(transaction) is not None:
+            LOG.warning("Transaction %s failed, drop estimate of %s",
+                        receipt['transactionHash'].hex(), self.key(transaction))
+            self.invalidate(transaction=transaction)
+        if cached:
+            raise ValueError("Transaction %s failed with cached gas estimate %s" % (
+                receipt['transactionHash'].hex(), transaction.get('gas')))
+
+    def stats(self):
+        '''LRUCache.stats() of estimates'''
+        return self.entries.stats()
+
+
+def _to_hex(value):
+    if isinstance(value, (bytes, bytearray)):
+        return '0x' + bytes(value).hex()
+    return value.lower()
@@ -0,0 +1,227 @@
+"""
+SQLite index of decoded bridge events, filled by EventIndex.sync() / sync_bridge():
+each chunk of logs is inserted with the scan checkpoint in one transaction, so an
+interrupted sync resumes where it stopped. See bridge_index.py for the CLI.
+"""
+
+import json
+import logging
+import sqlite3
+
+from example.python.utils.bridge import SECONDS_PER_DAY, address_topic
+from example.python.utils.scanner import EventScanner
+from example.python.utils.w3helper import EventRegistry
+
+LOG = logging.getLogger(__name__)
+
+DB_PATH = 'bridge_events.sqlite'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS events (
+    chain TEXT NOT NULL,
+    contract TEXT NOT NULL,
+    name TEXT NOT NULL,
+    block INTEGER NOT NULL,
+    tx_hash TEXT NOT NULL,
+    log_index INTEGER NOT NULL,
+    timestamp INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    sender TEXT,
+    recipient TEXT,
+    value TEXT,
+    ref_hash TEXT,
+    args TEXT NOT NULL,
+    PRIMARY KEY (chain, tx_hash, log_index)
+);
+CREATE INDEX IF NOT EXISTS events_block ON events (chain, block);
+CREATE INDEX IF NOT EXISTS events_tx_hash ON events (tx_hash);
+CREATE INDEX IF NOT EXISTS events_ref_hash ON events (ref_hash);
+CREATE INDEX IF NOT EXISTS events_sender ON events (sender);
+CREATE INDEX IF NOT EXISTS events_recipient ON events (recipient);
+CREATE INDEX IF NOT EXISTS events_day ON events (day, name);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    key TEXT PRIMARY KEY,
+    block INTEGER NOT NULL
+);
+'''
+
+# Event params stored in the sender / recipient / value / ref_hash columns
+COLUMNS = {
+    'Transfer': ('sender', 'recipient', 'value'),
+    'UserRequestForSignature': ('recipient', 'value'),
+    'AffirmationCompleted': ('recipient', 'value', 'ref_hash'),
+    'RelayedMessage': ('recipient', 'value', 'ref_hash'),
+    'SignedForAffirmation': ('sender', 'ref_hash'),
+    'SignedForUserRequest': ('sender', 'ref_hash'),
+}
+
+BRIDGE_EVENTS = ('user_request', 'affirm_completed', 'relayed_msg', 'signed_affirm',
+                 'signed_request')
+
+
+def _to_column(value):
+    '''Event param as SQLite value: addresses lower case, bytes as hex, uint256 as text'''
+    if isinstance(value, bytes):
+        return '0x' + value.hex()
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, str):
+        return value.lower()
+    return json.dumps(value, default=str)
+
+
+class _BigSum:
+    '''SQLite aggregate summing uint256 values stored as text'''
+
+    def __init__(self):
+        self.total = 0
+
+    def step(self, value):
+        '''Add one row'''
+        if value is not None:
+            self.total += int(value)
+
+    def finalize(self):
+        '''Total as text, it may not fit SQLite INTEGER'''
+        return str(self.total)
+
+
+class IndexCheckpoint:
+    '''
+    Last indexed block per scanner key in the checkpoints table, same interface as
+    scanner.Checkpoint. save() commits, with the rows inserted for the chunk.
+    '''
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def load(self, key):
+        '''Last indexed block of key, None if never indexed'''
+        row = self.conn.execute('SELECT block FROM checkpoints WHERE key = ?', (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def save(self, key, block_number):
+        '''Persist last indexed block of key and commit the chunk'''
+        self.conn.execute('INSERT OR REPLACE INTO checkpoints (key, block) VALUES (?, ?)',
+                          (key, block_number))
+        self.conn.commit()
+
+
+class EventIndex:
+    '''SQLite database of decoded events, with incremental sync and a small query API'''
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.create_aggregate('bigsum', 1, _BigSum)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+        self.checkpoint = IndexCheckpoint(self.conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        '''Close the database'''
+        self.conn.close()
+
+    @staticmethod
+    def _timestamps(w3h, numbers):
+        batch = w3h.batch()
+        numbers = sorted(set(numbers))
+        for number in numbers:
+            batch.get_block(number)
+        return dict(zip(numbers, (block['timestamp'] for block in batch.execute())))
+
+    def _rows(self, chain, registry, logs, timestamps):
+        for log in logs:
+            spec = registry.lookup(log)
+            values = spec.decode_values(log)
+            row = {'sender': None, 'recipient': None, 'value': None, 'ref_hash': None}
+            row.update(zip(COLUMNS.get(spec.name, ()), (_to_column(val) for val in values)))
+            timestamp = timestamps[log['blockNumber']]
+            yield (chain, log['address'].lower(), spec.name, log['blockNumber'],
+                   '0x' + bytes(log['transactionHash']).hex(), log['logIndex'], timestamp,
+                   timestamp // SECONDS_PER_DAY, row['sender'], row['recipient'], row['value'],
+                   row['ref_hash'], json.dumps([_to_column(val) for val in values]))
+
+    # pylint: disable=too-many-arguments
+    def sync(self, chain, contract, specs, from_block=0, to_block=None, extra_topics=(),
+             key=None):
+        '''
+        Index events of specs (EventSpec) emitted by contract in [from_block, to_block],
+        resuming after the checkpoint of key.
+        :returns: number of indexed events
+        '''
+        key = '%s:%s:%s' % (chain, contract.contract_addr.lower(), key or 'events')
+        scanner = EventScanner(contract.w3h, contract.contract_addr, EventRegistry(specs),
+                               self.checkpoint, key, extra_topics=extra_topics)
+        count = 0
+        for end, logs in scanner.scan_chunks(from_block, to_block):
+            logs = [log for log in logs if scanner.registry.lookup(log) is not None]
+            if logs:
+                timestamps = self._timestamps(contract.w3h,
+                                              [log['blockNumber'] for log in logs])
+                self.conn.executemany(
+                    'INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    self._rows(chain, scanner.registry, logs, timestamps))
+                count += len(logs)
+            LOG.info("Indexed %s ~ %s, %s events", key, end, count)
+        return count
+
+    def sync_bridge(self, chain, bridge, from_block=0, to_block=None):
+        '''Index bridge events and token Transfers from / to the bridge'''
+        count = self.sync(chain, bridge, [bridge.descriptors()[name] for name in BRIDGE_EVENTS],
+                          from_block, to_block)
+        _, token = bridge.contracts()
+        transfer = [token.descriptors()['transfer_event']]
+        topic = address_topic(bridge.contract_addr)
+        count += self.sync(chain, token, transfer, from_block, to_block,
+                           extra_topics=[topic], key='from_bridge')
+        count += self.sync(chain, token, transfer, from_block, to_block,
+                           extra_topics=[None, topic], key='to_bridge')
+        return count
+
+    def query(self, sql, params=()):
+        '''Raw query, returns list of sqlite3.Row'''
+        return self.conn.execute(sql, params).fetchall()
+
+    def transfers(self, address, chain=None, limit=None):
+        '''Events sent or received by address, oldest first'''
+        sql = 'SELECT * FROM events WHERE (sender = ? OR recipient = ?)'
+        address = address.lower()
+        params = [address, address]
+        if chain:
+            sql += ' AND chain = ?'
+            params.append(chain)
+        sql += ' ORDER BY timestamp, chain, block, log_index'
+        if limit:
+            sql += ' LIMIT %d' % limit
+        return self.query(sql, params)
+
+    def by_tx(self, tx_hash):
+        '''Events of tx_hash, and events referring to it (completions, signatures)'''
+        tx_hash = tx_hash.lower()
+        return self.query('SELECT * FROM events WHERE tx_hash = ? OR ref_hash = ? '
+                          'ORDER BY timestamp, log_index', (tx_hash, tx_hash))
+
+    def daily_totals(self, name='Transfer', chain=None, address=None):
+        '''
+        Per day count and total value of events named name.
+        :returns: [(day start timestamp, count, total), ...]
+        '''
+        sql = 'SELECT day, COUNT(*), bigsum(value) FROM events WHERE name = ?'
+        params = [name]
+        if chain:
+            sql += ' AND chain = ?'
+            params.append(chain)
+        if address:
+            sql += ' AND (sender = ? OR recipient = ?)'
+            params += [address.lower(), address.lower()]
+        sql += ' GROUP BY day ORDER BY day'
+        return [(day * SECONDS_PER_DAY, count, int(total))
+                for day, count, total in self.query(sql, params)]
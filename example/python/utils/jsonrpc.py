@@ -0,0 +1,296 @@
+"""
+JSON-RPC helpers shared by W3Helper: request param encoding, result formatting
+and batch (JSON array) requests.
+"""
+
+import logging
+from binascii import hexlify
+
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.datastructures import AttributeDict
+
+LOG = logging.getLogger(__name__)
+
+QUANTITY_KEYS = frozenset([
+    'baseFeePerGas', 'blobGasPrice', 'blobGasUsed', 'blockNumber', 'chainId',
+    'cumulativeGasUsed', 'difficulty', 'effectiveGasPrice', 'excessBlobGas', 'gas', 'gasLimit',
+    'gasPrice', 'gasUsed', 'logIndex', 'maxFeePerBlobGas', 'maxFeePerGas',
+    'maxPriorityFeePerGas', 'nonce', 'number', 'size', 'status', 'timestamp',
+    'totalDifficulty', 'transactionIndex', 'type', 'v', 'value', 'yParity',
+])
+DATA_KEYS = frozenset([
+    'blockHash', 'extraData', 'hash', 'input', 'logsBloom', 'mixHash', 'parentBeaconBlockRoot',
+    'parentHash', 'r', 'receiptsRoot', 'root', 's', 'sha3Uncles', 'stateRoot',
+    'transactionHash', 'transactionsRoot', 'withdrawalsRoot',
+])
+ADDRESS_KEYS = frozenset(['address', 'contractAddress', 'from', 'miner', 'to'])
+
+
+def to_hex_data(value):
+    '''Encode bytes / hex string as 0x-prefixed hex string for RPC params'''
+    if isinstance(value, str):
+        return value if value.startswith('0x') else '0x%s' % value
+    return '0x%s' % hexlify(value).decode()
+
+
+def to_block_param(block_id):
+    '''Encode block number or predefined tag ('latest', 'pending', ...) for RPC params'''
+    if isinstance(block_id, int):
+        return hex(block_id)
+    return block_id
+
+
+def is_block_hash(block_id):
+    '''Whether block_id is a block hash rather than a number or tag'''
+    if isinstance(block_id, (bytes, bytearray)):
+        return len(block_id) == 32
+    return isinstance(block_id, str) and block_id.startswith('0x') and len(block_id) == 66
+
+
+def to_rpc_transaction(transaction):
+    '''Encode transaction dict for eth_call / eth_estimateGas params'''
+    tx = {}
+    for key, value in transaction.items():
+        if isinstance(value, int):
+            tx[key] = hex(value)
+        elif isinstance(value, (bytes, bytearray)):
+            tx[key] = to_hex_data(value)
+        else:
+            tx[key] = value
+    return tx
+
+
+def batch_index(response, size):
+    '''
+    Index of response in a batch of size calls sent with ids 0 ~ size - 1.
+    Nodes answer a call they can not parse with a null id, raises ValueError with the
+    JSON-RPC error then, since it can not be matched with a call.
+    '''
+    req_id = response.get('id') if isinstance(response, dict) else None
+    if not isinstance(req_id, int) or not 0 <= req_id < size:
+        raise ValueError(response.get('error', response) if isinstance(response, dict)
+                         else response)
+    return req_id
+
+
+def _format_dict(value, quantity_keys=QUANTITY_KEYS):
+    ret = {}
+    for key, val in value.items():
+        if val is None:
+            ret[key] = val
+        elif key in quantity_keys:
+            ret[key] = int(val, 16)
+        elif key in DATA_KEYS:
+            ret[key] = HexBytes(val)
+        elif key in ADDRESS_KEYS:
+            ret[key] = Web3.toChecksumAddress(val)
+        elif key == 'topics':
+            ret[key] = [HexBytes(topic) for topic in val]
+        elif key == 'logs':
+            ret[key] = [format_log(log) for log in val]
+        else:
+            ret[key] = val
+    return ret
+
+
+def format_log(log):
+    '''Format raw log like web3 does, "data" stays a hex string'''
+    return AttributeDict(_format_dict(log))
+
+
+def format_transaction(transaction):
+    '''Format raw transaction'''
+    if transaction is None:
+        return None
+    return AttributeDict(_format_dict(transaction))
+
+
+def format_receipt(receipt):
+    '''Format raw transaction receipt'''
+    if receipt is None:
+        return None
+    return AttributeDict(_format_dict(receipt))
+
+
+def format_block(block):
+    '''Format raw block, block "nonce" is 8 bytes data instead of a quantity'''
+    if block is None:
+        return None
+    ret = _format_dict(block, QUANTITY_KEYS - {'nonce'})
+    if ret.get('nonce') is not None:
+        ret['nonce'] = HexBytes(ret['nonce'])
+    transactions = []
+    for transaction in ret.get('transactions', []):
+        if isinstance(transaction, dict):
+            transactions.append(format_transaction(transaction))
+        else:
+            transactions.append(HexBytes(transaction))
+    ret['transactions'] = transactions
+    ret['uncles'] = [HexBytes(uncle) for uncle in ret.get('uncles', [])]
+    return AttributeDict(ret)
+
+
+def _to_int(value):
+    return int(value, 16) if value is not None else None
+
+
+def _to_bytes(value):
+    return HexBytes(value) if value is not None else None
+
+
+def _to_logs(value):
+    return [format_log(log) for log in value] if value is not None else None
+
+
+RESULT_FORMATTERS = {
+    'eth_blockNumber': _to_int,
+    'eth_call': _to_bytes,
+    'eth_estimateGas': _to_int,
+    'eth_gasPrice': _to_int,
+    'eth_getBalance': _to_int,
+    'eth_getBlockByHash': format_block,
+    'eth_getBlockByNumber': format_block,
+    'eth_getCode': _to_bytes,
+    'eth_getLogs': _to_logs,
+    'eth_getTransactionByHash': format_transaction,
+    'eth_getTransactionCount': _to_int,
+    'eth_getTransactionReceipt': format_receipt,
+    'eth_sendRawTransaction': _to_bytes,
+}
+
+
+def format_result(method, result):
+    '''Convert raw RPC result into the types web3 returns for the same call'''
+    formatter = RESULT_FORMATTERS.get(method)
+    if formatter is None:
+        return result
+    return formatter(result)
+
+
+class BatchResult:
+    '''Placeholder of one call in a batch, filled once the batch is executed'''
+    __slots__ = ('method', 'params', 'value', 'error', 'done')
+
+    def __init__(self, method, params):
+        self.method = method
+        self.params = params
+        self.value = None
+        self.error = None
+        self.done = False
+
+    @property
+    def result(self):
+        '''Formatted result, raises ValueError if the node returned an error'''
+        if not self.done:
+            raise RuntimeError("Batch %s(%s) is not executed yet" % (self.method, self.params))
+        if self.error is not None:
+            raise ValueError(self.error)
+        return self.value
+
+
+class BatchRequest:
+    '''
+    Pack many JSON-RPC calls into JSON array requests, sent by provider.request_batch()
+    (see FailoverProvider).
+
+    Use as builder:
+        batch = w3h.batch()
+        batch.get_balance(acc)
+        batch.get_receipt_for_transaction(tx_hash)
+        balance, receipt = batch.execute()
+
+    or as context manager, executed on exit:
+        with w3h.batch() as batch:
+            balance = batch.get_balance(acc)
+        balance.result
+    '''
+    MAX_BATCH_SIZE = 100
+
+    def __init__(self, provider, max_batch_size=MAX_BATCH_SIZE):
+        self.provider = provider
+        self.max_batch_size = max_batch_size
+        self.calls = []
+
+    def __len__(self):
+        return len(self.calls)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.execute(raise_on_error=False)
+
+    def call_api(self, method, *args):
+        '''Add raw RPC call to batch'''
+        entry = BatchResult(method, list(args))
+        self.calls.append(entry)
+        return entry
+
+    def get_balance(self, acc, block_identifier='latest'):
+        '''Add eth_getBalance'''
+        return self.call_api('eth_getBalance', acc, to_block_param(block_identifier))
+
+    def get_transaction(self, tx_hash):
+        '''Add eth_getTransactionByHash'''
+        return self.call_api('eth_getTransactionByHash', to_hex_data(tx_hash))
+
+    def get_receipt_for_transaction(self, tx_hash):
+        '''Add eth_getTransactionReceipt'''
+        return self.call_api('eth_getTransactionReceipt', to_hex_data(tx_hash))
+
+    def get_block(self, block_id='latest', full_transactions=False):
+        '''Add eth_getBlockByHash / eth_getBlockByNumber depends on block_id'''
+        if is_block_hash(block_id):
+            return self.call_api('eth_getBlockByHash', to_hex_data(block_id), full_transactions)
+        return self.call_api('eth_getBlockByNumber', to_block_param(block_id), full_transactions)
+
+    def get_nonce_for_next_transaction(self, acc, block_identifier='latest'):
+        '''Add eth_getTransactionCount'''
+        return self.call_api('eth_getTransactionCount', acc, to_block_param(block_identifier))
+
+    def eth_call(self, transaction, block_identifier='latest'):
+        '''Add eth_call'''
+        return self.call_api('eth_call', to_rpc_transaction(transaction),
+                             to_block_param(block_identifier))
+
+    def _send(self, entries):
+        payload = []
+        for idx, entry in enumerate(entries):
+            payload.append({
+                "jsonrpc": "2.0",
+                "id": idx,
+                "method": entry.method,
+                "params": entry.params,
+            })
+        LOG.debug("Send batch of %s calls to %s", len(payload), self.provider)
+        responses = self.provider.request_batch(payload)
+        if isinstance(responses, dict):
+            # Node rejected the whole batch
+            raise ValueError(responses.get('error', responses))
+        for response in responses:
+            entry = entries[batch_index(response, len(entries))]
+            if 'error' in response:
+                entry.error = response['error']
+            else:
+                entry.value = format_result(entry.method, response.get('result'))
+            entry.done = True
+        missing = ['%s (id %s)' % (entry.method, idx)
+                   for idx, entry in enumerate(entries) if not entry.done]
+        if missing:
+            # Nodes or proxies may drop responses, the calls would look never executed
+            raise ValueError("No response to %s of batch" % ', '.join(missing))
+
+    def execute(self, raise_on_error=True):
+        '''
+        Send all pending calls, at most max_batch_size calls per HTTP request.
+        Raises ValueError if some calls got no response, also when not raise_on_error.
+        :returns: list of results in the order the calls were added
+        '''
+        entries, self.calls = self.calls, []
+        for start in range(0, len(entries), self.max_batch_size):
+            self._send(entries[start:start + self.max_batch_size])
+        if raise_on_error:
+            return [entry.result for entry in entries]
+        return [entry.value for entry in entries]
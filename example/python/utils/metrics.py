@@ -0,0 +1,173 @@
+"""
+Counters and latency histograms of JSON-RPC calls per method and endpoint.
+Recording is off unless METRICS.enable() is called (or THUNDER_RPC_METRICS is set),
+a disabled recorder costs one attribute check per call.
+"""
+
+import bisect
+import os
+import threading
+
+# Upper bounds (seconds) of latency buckets, last bucket is unbounded
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram:
+    '''Latency histogram with fixed buckets, percentiles are interpolated in buckets'''
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        '''Add one sample'''
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, pct):
+        '''Estimated pct (0 ~ 100) percentile, None without samples'''
+        if not self.count:
+            return None
+        rank = self.count * pct / 100
+        seen = 0
+        for idx, num in enumerate(self.counts):
+            if num and seen + num >= rank:
+                lower = BUCKETS[idx - 1] if idx else 0.0
+                upper = BUCKETS[idx] if idx < len(BUCKETS) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - seen) / num)
+            seen += num
+        return self.max
+
+
+class CallStats:
+    '''Calls, errors, retries and latency of one (method, endpoint)'''
+    __slots__ = ('calls', 'errors', 'retries', 'latency')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.latency = Histogram()
+
+    def as_dict(self):
+        '''Counters and latency percentiles in seconds'''
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'retries': self.retries,
+            'latency_avg': self.latency.total / self.latency.count if self.latency.count else None,
+            'latency_p50': self.latency.percentile(50),
+            'latency_p95': self.latency.percentile(95),
+            'latency_p99': self.latency.percentile(99),
+            'latency_max': self.latency.max,
+        }
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+class RPCMetrics:
+    '''Per (method, endpoint) CallStats, shared by all providers of a process'''
+    PREFIX = 'thunder_rpc'
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def enable(self):
+        '''Start recording'''
+        self.enabled = True
+
+    def disable(self):
+        '''Stop recording, recorded stats are kept'''
+        self.enabled = False
+
+    def reset(self):
+        '''Drop recorded stats'''
+        with self._lock:
+            self._stats = {}
+
+    def _get(self, method, endpoint):
+        stats = self._stats.get((method, endpoint))
+        if stats is None:
+            stats = self._stats[(method, endpoint)] = CallStats()
+        return stats
+
+    def record(self, method, endpoint, latency, error=False):
+        '''Record one call which took latency seconds'''
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self._get(method, endpoint)
+            stats.calls += 1
+            stats.latency.observe(latency)
+            if error:
+                stats.errors += 1
+
+    def record_retry(self, method, endpoint):
+        '''Record a call sent again after a failure on endpoint'''
+        if not self.enabled:
+            return
+        with self._lock:
+            self._get(method, endpoint).retries += 1
+
+    def as_dict(self):
+        '''{method: {endpoint: CallStats.as_dict()}}'''
+        ret = {}
+        with self._lock:
+            for (method, endpoint), stats in sorted(self._stats.items()):
+                ret.setdefault(method, {})[endpoint] = stats.as_dict()
+        return ret
+
+    def prometheus(self):
+        '''Stats in Prometheus text exposition format'''
+        prefix = self.PREFIX
+        with self._lock:
+            items = [('method="%s",endpoint="%s"' % (_escape(method), _escape(endpoint)), stats)
+                     for (method, endpoint), stats in sorted(self._stats.items())]
+            lines = []
+            for name in ('calls', 'errors', 'retries'):
+                lines.append('# TYPE %s_%s_total counter' % (prefix, name))
+                for labels, stats in items:
+                    lines.append('%s_%s_total{%s} %s'
+                                 % (prefix, name, labels, getattr(stats, name)))
+            lines.append('# TYPE %s_latency_seconds histogram' % prefix)
+            for labels, stats in items:
+                cumulative = 0
+                for bound, num in zip(BUCKETS + ('+Inf',), stats.latency.counts):
+                    cumulative += num
+                    lines.append('%s_latency_seconds_bucket{%s,le="%s"} %s'
+                                 % (prefix, labels, bound, cumulative))
+                lines.append('%s_latency_seconds_sum{%s} %s'
+                             % (prefix, labels, stats.latency.total))
+                lines.append('%s_latency_seconds_count{%s} %s'
+                             % (prefix, labels, stats.latency.count))
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        '''One line per (method, endpoint) for logs, slowest total time first'''
+        with self._lock:
+            items = sorted(self._stats.items(), key=lambda item: -item[1].latency.total)
+            rows = [(method, endpoint, stats.as_dict()) for (method, endpoint), stats in items]
+
+        def _ms(value):
+            return '-' if value is None else '%.1f' % (value * 1000)
+        lines = []
+        for method, endpoint, stats in rows:
+            lines.append('%-32s %-40s calls=%-7s errors=%-5s retries=%-5s '
+                         'p50=%sms p95=%sms p99=%sms'
+                         % (method, endpoint, stats['calls'], stats['errors'], stats['retries'],
+                            _ms(stats['latency_p50']), _ms(stats['latency_p95']),
+                            _ms(stats['latency_p99'])))
+        return lines
+
+
+METRICS = RPCMetrics(enabled=bool(os.environ.get('THUNDER_RPC_METRICS')))
@@ -0,0 +1,178 @@
+"""
+Local nonce allocation, so one account can keep many transactions in flight
+without asking the node for a nonce before every send.
+"""
+
+import asyncio
+import heapq
+import logging
+import threading
+
+LOG = logging.getLogger(__name__)
+
+NONCE_TOO_LOW_MESSAGES = (
+    'nonce too low',          # geth
+    'nonce is too low',       # parity / openethereum
+    'nonce has already been used',
+)
+
+
+def is_nonce_too_low(error):
+    '''Whether the error returned by eth_sendRawTransaction means the nonce was already used'''
+    message = error.args[0] if getattr(error, 'args', None) else error
+    if isinstance(message, dict):
+        message = message.get('message', '')
+    message = str(message).lower()
+    return any(msg in message for msg in NONCE_TOO_LOW_MESSAGES)
+
+
+def _release(next_nonces, released, acc, nonce):
+    if next_nonces.get(acc) is None or nonce >= next_nonces[acc]:
+        return
+    heap = released.setdefault(acc, [])
+    if nonce in heap:
+        return
+    heapq.heappush(heap, nonce)
+    # Released nonces on top of the counter are not needed to fill a gap
+    while heap and max(heap) == next_nonces[acc] - 1:
+        next_nonces[acc] -= 1
+        heap.remove(next_nonces[acc])
+        heapq.heapify(heap)
+    LOG.debug("Release nonce %s of %s, next: %s", nonce, acc, next_nonces[acc])
+
+
+def _reconcile(next_nonces, released, acc, pending):
+    local = next_nonces.get(acc)
+    next_nonces[acc] = pending if local is None else max(local, pending)
+    # Nonces below pending are used by the node already
+    heap = [nonce for nonce in released.get(acc, ()) if nonce >= pending]
+    heapq.heapify(heap)
+    released[acc] = heap
+
+
+class NonceManager:
+    '''
+    Per account nonce allocator, safe across threads.
+    The first allocation for an account and every reconcile() read the nonce
+    from the node with 'pending' block identifier, later allocations are local.
+    Nonces of transactions which failed to send are given back with release(), so no
+    gap blocks later transactions of the account.
+    '''
+
+    def __init__(self, fetch_pending_nonce):
+        self.fetch_pending_nonce = fetch_pending_nonce
+        self._lock = threading.Lock()
+        self._locks = {}
+        self._next = {}
+        self._released = {}
+
+    def _account_lock(self, acc):
+        with self._lock:
+            if acc not in self._locks:
+                self._locks[acc] = threading.Lock()
+            return self._locks[acc]
+
+    def allocate(self, acc):
+        '''Hand out the lowest released nonce of account, or the next one'''
+        with self._account_lock(acc):
+            if self._released.get(acc):
+                nonce = heapq.heappop(self._released[acc])
+            else:
+                nonce = self._next.get(acc)
+                if nonce is None:
+                    nonce = self.fetch_pending_nonce(acc)
+                self._next[acc] = nonce + 1
+        LOG.debug("Allocate nonce %s for %s", nonce, acc)
+        return nonce
+
+    def allocate_many(self, acc, num):
+        '''Hand out num consecutive nonces of account'''
+        with self._account_lock(acc):
+            nonce = self._next.get(acc)
+            if nonce is None:
+                nonce = self.fetch_pending_nonce(acc)
+            self._next[acc] = nonce + num
+        LOG.debug("Allocate nonce %s ~ %s for %s", nonce, nonce + num - 1, acc)
+        return list(range(nonce, nonce + num))
+
+    def release(self, acc, nonce):
+        '''
+        Give back nonce of a transaction which was not sent. It is handed out again
+        first, or dropped from the counter if it is the last allocated one.
+        '''
+        with self._account_lock(acc):
+            _release(self._next, self._released, acc, nonce)
+
+    def reconcile(self, acc):
+        '''
+        Re-sync with the node, e.g. on "nonce too low" errors.
+        Local value is kept if it is ahead of the node, since those nonces are
+        already handed out to transactions still in flight.
+        '''
+        with self._account_lock(acc):
+            pending = self.fetch_pending_nonce(acc)
+            local = self._next.get(acc)
+            _reconcile(self._next, self._released, acc, pending)
+            LOG.info("Reconcile nonce of %s, local: %s, pending: %s", acc, local, pending)
+            return self._next[acc]
+
+    def reset(self, acc=None):
+        '''Forget local state, next allocation reads the nonce from the node again'''
+        if acc is None:
+            with self._lock:
+                self._next.clear()
+                self._released.clear()
+        else:
+            with self._account_lock(acc):
+                self._next.pop(acc, None)
+                self._released.pop(acc, None)
+
+
+class AsyncNonceManager:
+    '''asyncio counterpart of NonceManager, fetch_pending_nonce is a coroutine function'''
+
+    def __init__(self, fetch_pending_nonce):
+        self.fetch_pending_nonce = fetch_pending_nonce
+        self._locks = {}
+        self._next = {}
+        self._released = {}
+
+    def _account_lock(self, acc):
+        if acc not in self._locks:
+            self._locks[acc] = asyncio.Lock()
+        return self._locks[acc]
+
+    async def allocate(self, acc):
+        '''Hand out the lowest released nonce of account, or the next one'''
+        async with self._account_lock(acc):
+            if self._released.get(acc):
+                nonce = heapq.heappop(self._released[acc])
+            else:
+                nonce = self._next.get(acc)
+                if nonce is None:
+                    nonce = await self.fetch_pending_nonce(acc)
+                self._next[acc] = nonce + 1
+        LOG.debug("Allocate nonce %s for %s", nonce, acc)
+        return nonce
+
+    def release(self, acc, nonce):
+        '''Give back nonce of a transaction which was not sent, see NonceManager.release'''
+        _release(self._next, self._released, acc, nonce)
+
+    async def reconcile(self, acc):
+        '''Re-sync with the node, see NonceManager.reconcile'''
+        async with self._account_lock(acc):
+            pending = await self.fetch_pending_nonce(acc)
+            local = self._next.get(acc)
+            _reconcile(self._next, self._released, acc, pending)
+            LOG.info("Reconcile nonce of %s, local: %s, pending: %s", acc, local, pending)
+            return self._next[acc]
+
+    def reset(self, acc=None):
+        '''Forget local state, next allocation reads the nonce from the node again'''
+        if acc is None:
+            self._next.clear()
+            self._released.clear()
+        else:
+            self._next.pop(acc, None)
+            self._released.pop(acc, None)
@@ -0,0 +1,122 @@
+"""
+Receipt tracker which waits for many transactions at once: all outstanding
+hashes are polled with one batched eth_getTransactionReceipt per new block.
+"""
+
+import logging
+import threading
+import time
+from concurrent import futures
+
+from hexbytes import HexBytes
+
+from example.python.utils.jsonrpc import to_hex_data
+from example.python.utils.records import Receipt
+
+LOG = logging.getLogger(__name__)
+
+
+class ReceiptTracker:
+    '''
+    Track receipts of outstanding transactions in a background thread.
+    track() returns a concurrent.futures.Future resolved with the receipt once the
+    transaction is included in a block. The thread stops when nothing is tracked.
+    '''
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, w3h, poll_interval=POLL_INTERVAL):
+        self.w3h = w3h
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._thread = None
+        self._last_block = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    @property
+    def last_block(self):
+        '''Latest block number seen by the polling thread, None when it is not running'''
+        with self._lock:
+            return self._last_block if self._thread is not None else None
+
+    def track(self, tx_hash, callback=None):
+        '''
+        Start tracking tx_hash.
+        :param callback Called with the future once the receipt arrives
+        :returns: Future of the transaction receipt
+        '''
+        key = HexBytes(tx_hash)
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                future = futures.Future()
+                self._pending[key] = future
+            if self._thread is None:
+                self._last_block = None
+                self._thread = threading.Thread(target=self._run, name='ReceiptTracker',
+                                                daemon=True)
+                self._thread.start()
+        if callback:
+            future.add_done_callback(callback)
+        return future
+
+    def untrack(self, tx_hash):
+        '''Stop tracking tx_hash, its future is cancelled'''
+        with self._lock:
+            future = self._pending.pop(HexBytes(tx_hash), None)
+        if future is not None:
+            future.cancel()
+
+    def wait(self, tx_hash_list, timeout=60):
+        '''
+        Wait for all transactions in tx_hash_list.
+        :returns: List of receipts, one for each transaction in-order.
+        '''
+        pending = [self.track(tx_hash) for tx_hash in tx_hash_list]
+        _, not_done = futures.wait(pending, timeout=timeout)
+        if not_done:
+            timed_out = []
+            for tx_hash, future in zip(tx_hash_list, pending):
+                if future in not_done:
+                    self.untrack(tx_hash)
+                    timed_out.append(to_hex_data(HexBytes(tx_hash)))
+            raise TimeoutError("Transaction %s timed out" % ', '.join(timed_out))
+        return [future.result() for future in pending]
+
+    def poll(self):
+        '''Query receipts of all outstanding transactions with one batch request'''
+        with self._lock:
+            tx_hashes = list(self._pending)
+        if not tx_hashes:
+            return
+        batch = self.w3h.batch()
+        for tx_hash in tx_hashes:
+            batch.get_receipt_for_transaction(tx_hash)
+        receipts = batch.execute(raise_on_error=False)
+        for tx_hash, receipt in zip(tx_hashes, receipts):
+            if receipt is None or not receipt['blockNumber']:
+                continue
+            with self._lock:
+                future = self._pending.pop(tx_hash, None)
+            if future is not None and not future.done():
+                LOG.debug("Receipt of %s arrives in block %s",
+                          to_hex_data(tx_hash), receipt['blockNumber'])
+                future.set_result(Receipt.from_dict(receipt))
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._thread = None
+                    return
+            try:
+                block_number = self.w3h.eth.blockNumber
+                if block_number != self._last_block:
+                    self.poll()
+                    self._last_block = block_number
+            except Exception:  # pylint: disable=broad-except
+                # Keep polling, waiters would time out silently if this thread died
+                LOG.exception("Failed to poll transaction receipts")
+            time.sleep(self.poll_interval)
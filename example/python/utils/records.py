@@ -0,0 +1,210 @@
+"""
+Compact immutable records of receipts, logs and decoded events kept by long runs.
+Hashes and data are stored as raw bytes, fields are attributes (receipt.gas_used) and
+are also readable with web3 keys, as item or attribute like web3 AttributeDict
+(receipt['gasUsed'], receipt.gasUsed), where hashes come back as HexBytes and log data
+as hex string like web3 returns them. Keys without a field (e.g. of newer nodes) are
+kept as they are in extra.
+Receipts and logs compare and hash by identity on chain, so sets of them are cheap.
+"""
+
+import collections
+
+from hexbytes import HexBytes
+from web3 import Web3
+
+DecodedEvent = collections.namedtuple('DecodedEvent', [
+    'name', 'signature', 'values', 'address', 'block_number', 'transaction_hash', 'log_index'])
+
+
+def _raw(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return bytes(HexBytes(value))
+    return bytes(value)
+
+
+def _hex_bytes(value):
+    return None if value is None else HexBytes(value)
+
+
+def _hex_data(value):
+    return None if value is None else '0x' + value.hex()
+
+
+def _address(value):
+    return None if value is None else Web3.toChecksumAddress(value)
+
+
+def _same(value):
+    return value
+
+
+def _int(value):
+    if isinstance(value, str):
+        return int(value, 16)
+    return value
+
+
+def _rebuild(cls, kwargs):
+    return cls(**kwargs)
+
+
+class _Record:
+    '''
+    Immutable __slots__ record readable as a Mapping of web3 keys.
+    Subclasses have an "extra" slot for web3 keys without a field.
+    '''
+    __slots__ = ()
+    # web3 key: (attribute, convert from web3 value, convert to web3 value)
+    FIELDS = {}
+
+    def __init__(self, extra=None, **kwargs):
+        for attr, convert, _ in self.FIELDS.values():
+            object.__setattr__(self, attr, convert(kwargs.get(attr)))
+        object.__setattr__(self, 'extra', dict(extra) if extra else None)
+
+    @classmethod
+    def from_dict(cls, value):
+        '''Record of web3 dict / AttributeDict, returned as is if it is a record already'''
+        if value is None or isinstance(value, cls):
+            return value
+        extra = {key: val for key, val in value.items() if key not in cls.FIELDS}
+        return cls(extra, **{attr: value.get(key) for key, (attr, _, _) in cls.FIELDS.items()})
+
+    def __setattr__(self, name, value):
+        raise AttributeError("%s is immutable" % type(self).__name__)
+
+    def __reduce__(self):
+        # copy, deepcopy and pickle can not set slots through __setattr__
+        return (_rebuild, (type(self), self._kwargs()))
+
+    def __getattr__(self, name):
+        # Only called for names which are not slots: web3 keys, e.g. receipt.blockNumber
+        if name in type(self).FIELDS or (not name.startswith('_') and name != 'extra'
+                                         and self.extra and name in self.extra):
+            return self[name]
+        raise AttributeError("%r has no attribute %r" % (type(self).__name__, name))
+
+    def __getitem__(self, key):
+        try:
+            attr, _, to_web3 = self.FIELDS[key]
+        except KeyError:
+            if self.extra and key in self.extra:
+                return self.extra[key]
+            raise KeyError(key) from None
+        return to_web3(getattr(self, attr))
+
+    def get(self, key, default=None):
+        '''Value of web3 key'''
+        if key not in self:
+            return default
+        return self[key]
+
+    def __contains__(self, key):
+        return key in self.FIELDS or bool(self.extra and key in self.extra)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.FIELDS) + len(self.extra or ())
+
+    def keys(self):
+        '''web3 keys, so dict(record) works'''
+        if not self.extra:
+            return self.FIELDS.keys()
+        return list(self.FIELDS) + list(self.extra)
+
+    def _kwargs(self):
+        kwargs = {attr: getattr(self, attr) for attr, _, _ in self.FIELDS.values()}
+        kwargs['extra'] = self.extra
+        return kwargs
+
+    def _identity(self):
+        raise NotImplementedError
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self._identity() == other._identity()
+
+    def __hash__(self):
+        return hash(self._identity())
+
+
+class Log(_Record):
+    '''Log of a mined transaction'''
+    __slots__ = ('address', 'topics', 'data', 'block_number', 'block_hash', 'transaction_hash',
+                 'transaction_index', 'log_index', 'extra')
+    FIELDS = {
+        'address': ('address', _address, _same),
+        'topics': ('topics', lambda topics: tuple(_raw(topic) for topic in topics or ()),
+                   lambda topics: [HexBytes(topic) for topic in topics]),
+        'data': ('data', lambda data: _raw(data) or b'', _hex_data),
+        'blockNumber': ('block_number', _int, _same),
+        'blockHash': ('block_hash', _raw, _hex_bytes),
+        'transactionHash': ('transaction_hash', _raw, _hex_bytes),
+        'transactionIndex': ('transaction_index', _int, _same),
+        'logIndex': ('log_index', _int, _same),
+    }
+
+    def __repr__(self):
+        return 'Log(%s, block=%s, tx=0x%s, index=%s)' % (
+            self.address, self.block_number,
+            self.transaction_hash.hex() if self.transaction_hash else None, self.log_index)
+
+    def _identity(self):
+        return (self.block_hash, self.transaction_hash, self.log_index)
+
+
+def _logs(logs):
+    return tuple(Log.from_dict(log) for log in logs or ())
+
+
+class Receipt(_Record):
+    '''
+    Receipt of a mined transaction. events holds what a Funcall decoded from logs, see
+    with_events(); it is an attribute only, not a web3 key of the receipt.
+    '''
+    __slots__ = ('transaction_hash', 'transaction_index', 'block_hash', 'block_number',
+                 'sender', 'to', 'gas_used', 'cumulative_gas_used', 'effective_gas_price',
+                 'contract_address', 'status', 'type', 'logs_bloom', 'logs', 'events', 'extra')
+    FIELDS = {
+        'transactionHash': ('transaction_hash', _raw, _hex_bytes),
+        'transactionIndex': ('transaction_index', _int, _same),
+        'blockHash': ('block_hash', _raw, _hex_bytes),
+        'blockNumber': ('block_number', _int, _same),
+        'from': ('sender', _address, _same),
+        'to': ('to', _address, _same),
+        'gasUsed': ('gas_used', _int, _same),
+        'cumulativeGasUsed': ('cumulative_gas_used', _int, _same),
+        'effectiveGasPrice': ('effective_gas_price', _int, _same),
+        'contractAddress': ('contract_address', _address, _same),
+        'status': ('status', _int, _same),
+        'type': ('type', _int, _same),
+        'logsBloom': ('logs_bloom', _raw, _hex_bytes),
+        'logs': ('logs', _logs, list),
+    }
+
+    def __init__(self, extra=None, events=None, **kwargs):
+        super().__init__(extra, **kwargs)
+        object.__setattr__(self, 'events', None if events is None else tuple(events))
+
+    def __repr__(self):
+        return 'Receipt(0x%s, block=%s, status=%s)' % (
+            self.transaction_hash.hex() if self.transaction_hash else None, self.block_number,
+            self.status)
+
+    def _kwargs(self):
+        kwargs = super()._kwargs()
+        kwargs['events'] = self.events
+        return kwargs
+
+    def _identity(self):
+        return (self.transaction_hash, self.block_hash)
+
+    def with_events(self, events):
+        '''Copy with decoded events'''
+        kwargs = self._kwargs()
+        kwargs['events'] = events
+        return Receipt(**kwargs)
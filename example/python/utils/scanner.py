@@ -0,0 +1,176 @@
+"""
+Event scanner which streams contract logs over large block ranges.
+Ranges are split in chunks that shrink when the node refuses a query for returning
+too many results and grow while responses are small. The last scanned block can be
+persisted in a checkpoint file, like lastProcessedBlock of validator watcher in Redis.
+"""
+
+import json
+import logging
+import os
+import time
+
+from requests.exceptions import Timeout
+
+from example.python.utils.transport import RPCTransportError
+
+LOG = logging.getLogger(__name__)
+
+TOO_MANY_RESULTS_MESSAGES = (
+    'query returned more than',
+    'too many results',
+    'limit exceeded',
+    'response size exceeded',
+    'block range',
+    'query timeout exceeded',
+)
+
+
+def is_too_many_results(error):
+    '''Whether the error returned by eth_getLogs asks for a smaller block range'''
+    if isinstance(error, Timeout):
+        return True
+    if isinstance(error, RPCTransportError):
+        # Every endpoint timed out on the range
+        return bool(error.errors) and all(isinstance(err, Timeout) for err in error.errors)
+    message = error.args[0] if error.args else ''
+    if isinstance(message, dict):
+        if message.get('code') == -32005:
+            return True
+        message = message.get('message', '')
+    message = str(message).lower()
+    return any(msg in message for msg in TOO_MANY_RESULTS_MESSAGES)
+
+
+class Checkpoint:
+    '''Last scanned block per scanner key, persisted in a JSON file'''
+
+    def __init__(self, path):
+        self.path = path
+        self.blocks = {}
+        if os.path.exists(path):
+            with open(path) as file:
+                self.blocks = json.load(file)
+
+    def load(self, key):
+        '''Last scanned block of key, None if never scanned'''
+        return self.blocks.get(key)
+
+    def save(self, key, block_number):
+        '''Persist last scanned block of key'''
+        self.blocks[key] = block_number
+        tmp_path = '%s.tmp' % self.path
+        with open(tmp_path, 'w') as file:
+            json.dump(self.blocks, file, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+class EventScanner:
+    '''
+    Scan logs of events in registry (an EventRegistry) emitted by one contract.
+    extra_topics filter indexed params, e.g. [None, padded address] for the 2nd topic.
+    scan() / scan_logs() go through a fixed block range, follow() keeps scanning new
+    blocks until timeout. Decoded events are yielded chunk by chunk.
+    '''
+    MIN_CHUNK = 1
+    MAX_CHUNK = 100000
+    INITIAL_CHUNK = 1000
+    # Grow chunk when a response has less logs than this
+    SMALL_RESPONSE = 1000
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, w3h, address, registry, checkpoint=None, key=None,
+                 chunk_size=INITIAL_CHUNK, max_chunk=MAX_CHUNK, confirmations=0,
+                 extra_topics=()):
+        self.w3h = w3h
+        self.address = address
+        self.registry = registry
+        self.topics = [list(dict.fromkeys(spec.topic_hex for spec in registry.decoders.values()))]
+        self.topics.extend(extra_topics)
+        self.checkpoint = checkpoint
+        self.key = key or '%s:lastProcessedBlock' % address
+        self.chunk_size = chunk_size
+        self.max_chunk = max_chunk
+        self.confirmations = confirmations
+
+    @property
+    def last_block(self):
+        '''Last scanned block in checkpoint, None without checkpoint'''
+        if self.checkpoint is None:
+            return None
+        return self.checkpoint.load(self.key)
+
+    def head(self):
+        '''Latest block with enough confirmations'''
+        return self.w3h.eth.blockNumber - self.confirmations
+
+    def _get_logs(self, from_block, to_block):
+        event_filter = {
+            "address": self.address,
+            "topics": self.topics,
+            "fromBlock": hex(from_block),
+            "toBlock": hex(to_block),
+        }
+        return self.w3h.get_logs(event_filter, retry=False)
+
+    def scan_chunks(self, from_block, to_block=None):
+        '''
+        Scan blocks [from_block, to_block] with adaptive chunk size.
+        Resumes after the checkpoint if it is ahead of from_block.
+        :returns: generator of (chunk_end_block, logs)
+        '''
+        if to_block is None:
+            to_block = self.head()
+        last_block = self.last_block
+        if last_block is not None:
+            from_block = max(from_block, last_block + 1)
+        while from_block <= to_block:
+            end = min(from_block + self.chunk_size - 1, to_block)
+            try:
+                logs = self._get_logs(from_block, end)
+            except (ValueError, Timeout, RPCTransportError) as err:
+                if not is_too_many_results(err) or self.chunk_size <= self.MIN_CHUNK:
+                    raise
+                self.chunk_size = max(self.MIN_CHUNK, self.chunk_size // 2)
+                LOG.info("Too many results in %s ~ %s, shrink chunk to %s",
+                         from_block, end, self.chunk_size)
+                continue
+            LOG.debug("Scanned %s ~ %s, %s logs", from_block, end, len(logs))
+            yield end, logs
+            if self.checkpoint is not None:
+                self.checkpoint.save(self.key, end)
+            if len(logs) < self.SMALL_RESPONSE:
+                self.chunk_size = min(self.max_chunk, self.chunk_size * 2)
+            from_block = end + 1
+
+    def scan_logs(self, from_block, to_block=None):
+        '''Scan blocks [from_block, to_block], yields raw logs of registered events'''
+        for _, logs in self.scan_chunks(from_block, to_block):
+            for log in logs:
+                if self.registry.lookup(log) is not None:
+                    yield log
+
+    def scan(self, from_block, to_block=None):
+        '''Scan blocks [from_block, to_block], yields DecodedEvent records'''
+        for _, logs in self.scan_chunks(from_block, to_block):
+            for event in self.registry.decode_many(logs):
+                yield event
+
+    def follow_logs(self, from_block, timeout=None, poll_interval=5):
+        '''Scan from from_block and keep scanning new blocks until timeout, yields raw logs'''
+        deadline = None if timeout is None else time.time() + timeout
+        next_block = from_block
+        while True:
+            head = self.head()
+            if head >= next_block:
+                for log in self.scan_logs(next_block, head):
+                    yield log
+                next_block = head + 1
+            if deadline is not None and time.time() >= deadline:
+                return
+            time.sleep(poll_interval)
+
+    def follow(self, from_block, timeout=None, poll_interval=5):
+        '''Same as follow_logs, yields DecodedEvent records'''
+        for log in self.follow_logs(from_block, timeout, poll_interval):
+            yield self.registry.lookup(log).decode_event(log)
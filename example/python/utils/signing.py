@@ -0,0 +1,201 @@
+"""
+Bulk send pipeline: nonces are allocated at once, transactions are signed in chunks
+by worker processes (ECDSA signing is CPU bound) and the raw transactions of each chunk
+go out as one batch of eth_sendRawTransaction.
+"""
+
+import collections
+import logging
+import os
+
+from eth_account import Account
+from hexbytes import HexBytes
+from requests.exceptions import RequestException
+
+from example.python.lib.processpool import ProcessPool
+from example.python.utils.jsonrpc import BatchRequest, to_hex_data
+from example.python.utils.nonce import is_nonce_too_low
+from example.python.utils.transport import RPCTransportError, is_known_transaction
+
+LOG = logging.getLogger(__name__)
+
+SentTransaction = collections.namedtuple('SentTransaction', ['index', 'tx_hash', 'nonce', 'error'])
+
+
+def sign_transactions(private_key, transactions):
+    '''
+    Sign transactions with one key, run in worker processes.
+    :returns: [(raw transaction, tx hash), ...]
+    '''
+    account = Account.privateKeyToAccount(private_key)
+    ret = []
+    for transaction in transactions:
+        signed = account.signTransaction(transaction)
+        ret.append((bytes(signed.rawTransaction), bytes(signed.hash)))
+    return ret
+
+
+class BulkSender:
+    '''
+    Sign and send many transactions of one account.
+    send() yields SentTransaction of each transaction once its chunk is sent. Chunks are
+    sent in nonce order, so the node never sees long nonce gaps, while the next chunks
+    are signed by processes workers. processes=0 signs in the caller process.
+    The worker pool is started on first use and kept until close().
+    '''
+    CHUNK_SIZE = 200
+
+    def __init__(self, w3h, processes=None, chunk_size=CHUNK_SIZE,
+                 max_batch_size=BatchRequest.MAX_BATCH_SIZE):
+        self.w3h = w3h
+        self.processes = os.cpu_count() if processes is None else processes
+        self.chunk_size = chunk_size
+        self.max_batch_size = max_batch_size
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        '''Stop signing workers'''
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    def prepare(self, address, transactions):
+        '''
+        Copy of transactions with nonces allocated at once for those without one, and
+        the current gas price for those without gasPrice.
+        '''
+        transactions = [dict(transaction) for transaction in transactions]
+        missing = [transaction for transaction in transactions if 'nonce' not in transaction]
+        if missing:
+            for transaction, nonce in zip(missing,
+                                          self.w3h.nonces.allocate_many(address, len(missing))):
+                transaction['nonce'] = nonce
+        if any('gasPrice' not in transaction for transaction in transactions):
+            gas_price = self.w3h.gas_price()
+            for transaction in transactions:
+                transaction.setdefault('gasPrice', gas_price)
+        return transactions
+
+    def _sign_inline(self, private_key, chunks):
+        for start, transactions in chunks:
+            try:
+                yield start, sign_transactions(private_key, transactions)
+            except Exception as err: # pylint: disable=broad-except
+                yield start, err
+
+    def _sign(self, private_key, chunks):
+        '''Yield (start, signed or exception) of chunks, in order'''
+        if self.processes <= 1:
+            for item in self._sign_inline(private_key, chunks):
+                yield item
+            return
+        if self._pool is None:
+            self._pool = ProcessPool(self.processes)
+        starts = {}
+        done = {}
+        order = collections.deque(start for start, _ in chunks)
+
+        def _collect(tasks):
+            for task in tasks:
+                start = starts.pop(task.index, None)
+                if start is not None:
+                    done[start] = task.value if task.ok else task.error
+
+        for start, transactions in chunks:
+            starts[self._pool.add_task(sign_transactions, private_key, transactions)] = start
+            _collect(self._pool.ready())
+            while order and order[0] in done:
+                yield order[0], done.pop(order.popleft())
+        _collect(self._pool.as_completed())
+        while order:
+            yield order[0], done.pop(order.popleft())
+
+    def _sent_earlier(self, tx_hashes):
+        '''
+        Hashes of tx_hashes the node has. "nonce too low" on a retried batch means the
+        first attempt was mined if the node has the same signed transaction.
+        '''
+        tx_hashes = [bytes(tx_hash) for tx_hash in tx_hashes]
+        if not tx_hashes:
+            return set()
+        batch = self.w3h.batch(self.max_batch_size)
+        for tx_hash in tx_hashes:
+            batch.get_transaction(tx_hash)
+        try:
+            transactions = batch.execute(raise_on_error=False)
+        except (RequestException, RPCTransportError, ValueError):
+            # Unknown, reported as failed
+            LOG.exception("Failed to look up %s transactions", len(tx_hashes))
+            return set()
+        return {tx_hash for tx_hash, transaction in zip(tx_hashes, transactions)
+                if transaction is not None}
+
+    def _submit(self, start, transactions, signed):
+        '''Send one signed chunk, returns list of SentTransaction'''
+        if isinstance(signed, Exception):
+            return [SentTransaction(start + idx, None, transaction['nonce'], signed)
+                    for idx, transaction in enumerate(transactions)]
+        batch = self.w3h.batch(self.max_batch_size)
+        entries = [batch.call_api('eth_sendRawTransaction', to_hex_data(raw_transaction))
+                   for raw_transaction, _ in signed]
+        try:
+            batch.execute(raise_on_error=False)
+        except (RequestException, RPCTransportError, ValueError) as err:
+            return [SentTransaction(start + idx, HexBytes(tx_hash), transaction['nonce'], err)
+                    for idx, (transaction, (_, tx_hash)) in enumerate(zip(transactions, signed))]
+        sent_earlier = self._sent_earlier(
+            tx_hash for entry, (_, tx_hash) in zip(entries, signed)
+            if entry.error is not None and is_nonce_too_low(entry.error))
+        ret = []
+        for idx, (transaction, entry, (_, tx_hash)) in enumerate(zip(transactions, entries,
+                                                                      signed)):
+            error = None
+            if (entry.error is not None and not is_known_transaction(entry.error)
+                    and bytes(tx_hash) not in sent_earlier):
+                error = ValueError(entry.error)
+            ret.append(SentTransaction(start + idx, HexBytes(tx_hash), transaction['nonce'],
+                                       error))
+        return ret
+
+    def send(self, private_key, transactions):
+        '''
+        Sign and send transactions.
+        Failed transactions leave nonce gaps, so nonces of the account are read from the
+        node again by the next allocation.
+        :returns: generator of SentTransaction, index is the position in transactions
+        '''
+        address = Account.privateKeyToAccount(private_key).address
+        transactions = self.prepare(address, transactions)
+        chunks = [(start, transactions[start:start + self.chunk_size])
+                  for start in range(0, len(transactions), self.chunk_size)]
+        failed = 0
+        try:
+            for start, signed in self._sign(private_key, chunks):
+                chunk = transactions[start:start + self.chunk_size]
+                for sent in self._submit(start, chunk, signed):
+                    if sent.error is not None:
+                        failed += 1
+                    yield sent
+        finally:
+            if failed:
+                LOG.warning("%s transactions of %s failed", failed, address)
+                self.w3h.nonces.reset(address)
+        LOG.debug("Sent %s transactions of %s", len(transactions), address)
+
+    def send_all(self, private_key, transactions):
+        '''
+        Send all transactions.
+        :returns: list of tx hashes in order, raises the first error
+        '''
+        ret = []
+        for sent in self.send(private_key, transactions):
+            if sent.error is not None:
+                raise sent.error
+            ret.append(sent.tx_hash)
+        return ret
@@ -0,0 +1,279 @@
+"""
+Retry and failover layer under all JSON-RPC calls of W3Helper.
+Requests go to the healthiest of a list of endpoints; on transport errors the next
+endpoint is tried right away, full rounds are retried with exponential backoff and
+jitter, like RpcUrlsManager / HttpRetryProvider of the validator.
+"""
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+import eth_utils
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+from web3.providers.base import JSONBaseProvider
+
+from example.python.utils.metrics import METRICS
+from example.python.utils.nonce import is_nonce_too_low
+
+LOG = logging.getLogger(__name__)
+
+KNOWN_TRANSACTION_MESSAGES = (
+    'already known',
+    'known transaction',
+    'already imported',
+)
+
+
+class RPCTransportError(ConnectionError):
+    '''Request failed on all endpoints'''
+
+    def __init__(self, message, errors):
+        super().__init__(message)
+        self.errors = errors
+
+
+class RetryPolicy:
+    '''
+    Exponential backoff with jitter between rounds over all endpoints.
+    Methods which let the node sign and send (so a resend may double spend) are never
+    retried. eth_sendRawTransaction is retried with the same signed bytes, a "known
+    transaction" error on retry means the first attempt went through. So does "nonce too
+    low" once the first attempt is mined, if a node has the hash of the signed bytes.
+    '''
+    RETRIES = 3
+    NON_IDEMPOTENT_METHODS = frozenset([
+        'eth_sendTransaction',
+        'personal_sendTransaction',
+    ])
+
+    def __init__(self, retries=RETRIES, backoff=0.1, max_backoff=5):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def retryable(self, methods):
+        '''Whether a request of methods can be sent again'''
+        return not any(method in self.NON_IDEMPOTENT_METHODS for method in methods)
+
+    def delay(self, attempt):
+        '''Seconds to wait before round attempt (from 1), full jitter'''
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+
+class Endpoint:
+    '''RPC endpoint with health score: latency EWMA and consecutive failures'''
+    __slots__ = ('url', 'latency', 'failures', 'down_until')
+    ALPHA = 0.3
+
+    def __init__(self, url):
+        self.url = url
+        self.latency = 0.0
+        self.failures = 0
+        self.down_until = 0.0
+
+    def __repr__(self):
+        return 'Endpoint(%s, latency=%.3f, failures=%s)' % (self.url, self.latency,
+                                                             self.failures)
+
+
+class EndpointPool:
+    '''Endpoints ordered by health: healthy ones by latency, then the ones cooling down'''
+    COOLDOWN = 5
+    MAX_COOLDOWN = 120
+
+    def __init__(self, urls, cooldown=COOLDOWN):
+        if isinstance(urls, str):
+            urls = urls.split(',')
+        if not urls:
+            raise ValueError("Invalid URLs: '%s'" % urls)
+        self.endpoints = [Endpoint(url.strip()) for url in urls]
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        return iter(self.endpoints)
+
+    def ordered(self):
+        '''Endpoints in the order they should be tried'''
+        now = time.monotonic()
+        with self._lock:
+            healthy = [ep for ep in self.endpoints if ep.down_until <= now]
+            down = [ep for ep in self.endpoints if ep.down_until > now]
+        healthy.sort(key=lambda ep: ep.latency)
+        down.sort(key=lambda ep: ep.down_until)
+        return healthy + down
+
+    def success(self, endpoint, latency):
+        '''Record successful request'''
+        with self._lock:
+            endpoint.latency = (endpoint.latency * (1 - Endpoint.ALPHA) + latency * Endpoint.ALPHA
+                                if endpoint.latency else latency)
+            endpoint.failures = 0
+            endpoint.down_until = 0.0
+
+    def failure(self, endpoint):
+        '''Record failed request, endpoint cools down longer on each consecutive failure'''
+        with self._lock:
+            endpoint.failures += 1
+            cooldown = min(self.MAX_COOLDOWN, self.cooldown * 2 ** (endpoint.failures - 1))
+            endpoint.down_until = time.monotonic() + cooldown
+        LOG.warning("RPC endpoint %s failed %s times, cool down %ss",
+                    endpoint.url, endpoint.failures, cooldown)
+
+
+def is_known_transaction(error):
+    '''Whether the error of eth_sendRawTransaction means the node has the transaction'''
+    if not error:
+        return False
+    message = str(error.get('message', '') if isinstance(error, dict) else error).lower()
+    return any(msg in message for msg in KNOWN_TRANSACTION_MESSAGES)
+
+
+class FailoverProvider(JSONBaseProvider):
+    '''web3 provider sending requests through EndpointPool with RetryPolicy'''
+
+    def __init__(self, urls, retry_policy=None, session=None, timeout=30):
+        super().__init__()
+        self.endpoints = urls if isinstance(urls, EndpointPool) else EndpointPool(urls)
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.session = session or requests.Session()
+        self.timeout = timeout
+
+    def __str__(self):
+        return 'FailoverProvider(%s)' % ', '.join(ep.url for ep in self.endpoints)
+
+    def with_retry_policy(self, retry_policy):
+        '''Provider sharing endpoints and session of this one, with another RetryPolicy'''
+        return FailoverProvider(self.endpoints, retry_policy, self.session, self.timeout)
+
+    @property
+    def endpoint_uri(self):
+        '''URL of the healthiest endpoint'''
+        return self.endpoints.ordered()[0].url
+
+    def _post(self, endpoint, body, label):
+        start = time.monotonic()
+        try:
+            resp = self.session.post(endpoint.url, data=body, timeout=self.timeout,
+                                     headers={'Content-Type': 'application/json'})
+            resp.raise_for_status()
+            response = resp.json()
+        except (RequestException, ValueError):
+            METRICS.record(label, endpoint.url, time.monotonic() - start, error=True)
+            raise
+        latency = time.monotonic() - start
+        self.endpoints.success(endpoint, latency)
+        METRICS.record(label, endpoint.url, latency,
+                       error=isinstance(response, dict) and 'error' in response)
+        return response
+
+    def send(self, payload, methods):
+        '''
+        Send payload (one request dict or a list for batch) with failover and retries.
+        Metrics are recorded under the method name, or "batch" for batch requests.
+        :returns: decoded JSON response
+        '''
+        body = json.dumps(payload).encode()
+        label = methods[0] if isinstance(payload, dict) else 'batch'
+        retryable = self.retry_policy.retryable(methods)
+        rounds = self.retry_policy.retries + 1 if retryable else 1
+        errors = []
+        for attempt in range(rounds):
+            if attempt:
+                time.sleep(self.retry_policy.delay(attempt))
+            for endpoint in self.endpoints.ordered():
+                if errors:
+                    METRICS.record_retry(label, endpoint.url)
+                try:
+                    return self._post(endpoint, body, label)
+                except (RequestException, ValueError) as err:
+                    self.endpoints.failure(endpoint)
+                    errors.append(err)
+                    if not retryable:
+                        raise
+        raise RPCTransportError("Request %s failed for all urls" % ', '.join(methods), errors)
+
+    def has_transaction(self, tx_hash):
+        '''Whether the node has transaction tx_hash (hex string), pending or mined'''
+        response = self.send({"jsonrpc": "2.0", "id": next(self.request_counter),
+                              "method": 'eth_getTransactionByHash', "params": [tx_hash]},
+                             ['eth_getTransactionByHash'])
+        return isinstance(response, dict) and response.get('result') is not None
+
+    def make_request(self, method, params):
+        payload = {"jsonrpc": "2.0", "id": next(self.request_counter),
+                   "method": method, "params": params}
+        response = self.send(payload, [method])
+        if method != 'eth_sendRawTransaction' or not isinstance(response, dict):
+            return response
+        error = response.get('error')
+        if not error:
+            return response
+        tx_hash = eth_utils.to_hex(eth_utils.keccak(eth_utils.to_bytes(hexstr=params[0])))
+        if is_known_transaction(error) or (is_nonce_too_low(error)
+                                           and self.has_transaction(tx_hash)):
+            # Sent by a previous attempt, which failed on the way back
+            LOG.info("Transaction %s was sent already: %s", tx_hash, error)
+            response = {"jsonrpc": "2.0", "id": payload['id'], "result": tx_hash}
+        return response
+
+    def request_batch(self, payload):
+        '''Send list of request dicts as one JSON array request'''
+        return self.send(payload, [request['method'] for request in payload])
+
+
+POOL_SIZE = 10
+_REGISTRY = {'pid': None, 'providers': {}}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def _endpoints_key(urls):
+    if isinstance(urls, str):
+        urls = urls.split(',')
+    return ','.join(url.strip() for url in urls)
+
+
+def make_session(pool_size=POOL_SIZE):
+    '''requests.Session keeping up to pool_size keep-alive connections per host'''
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_provider(urls, retry_policy=None, pool_size=POOL_SIZE):
+    '''
+    Process-wide FailoverProvider of urls, so all W3Helper of a chain share keep-alive
+    connections and endpoint health. A provider with another retry_policy shares the
+    session and endpoints of the registered one.
+    Registry is dropped in forked processes, children never reuse parent sockets.
+    '''
+    key = _endpoints_key(urls)
+    with _REGISTRY_LOCK:
+        if _REGISTRY['pid'] != os.getpid():
+            _REGISTRY['pid'] = os.getpid()
+            _REGISTRY['providers'] = {}
+        provider = _REGISTRY['providers'].get(key)
+        if provider is None:
+            LOG.debug("New provider of %s, pool size %s", key, pool_size)
+            provider = FailoverProvider(key, session=make_session(pool_size))
+            _REGISTRY['providers'][key] = provider
+    if retry_policy is None:
+        return provider
+    return provider.with_retry_policy(retry_policy)
+
+
+def close_providers():
+    '''Close sessions of all registered providers'''
+    with _REGISTRY_LOCK:
+        providers = list(_REGISTRY['providers'].values())
+        _REGISTRY['providers'] = {}
+    for provider in providers:
+        provider.session.close()
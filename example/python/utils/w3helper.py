@@ -1,77 +1,120 @@
 """
 Utility class which help to execute transactions using web3py (https://github.com/ethereum/web3.py)
-NOTE: No support of parallel transactions for now.
+Nonces are allocated locally per account (see NonceManager), so an account can
+send transactions in parallel.
 """
 
 import datetime
-import time
+import functools
 import logging
 
 from binascii import hexlify, unhexlify
 import eth_utils
 import eth_abi
+from eth_abi.exceptions import DecodingError
 from web3 import Web3
-from requests.exceptions import ConnectionError as RConnectionError
+
+from example.python.utils.blocks import BlockHistory, BlockRecorder
+from example.python.utils.cache import ChainCache
+from example.python.utils.gas import GasEstimateCache, GasPriceCache
+from example.python.utils.jsonrpc import BatchRequest
+from example.python.utils.nonce import NonceManager, is_nonce_too_low
+from example.python.utils.receipts import ReceiptTracker
+from example.python.utils.records import DecodedEvent, Log, Receipt
+from example.python.utils.scanner import EventScanner
+from example.python.utils.signing import BulkSender
+from example.python.utils.transport import POOL_SIZE, RetryPolicy, get_provider
 
 LOG = logging.getLogger(__name__)
 
 # pylint: disable=too-many-public-methods
 class W3Helper:
-    """ Wrapper around W3 api """
+    """ Wrapper around W3 api
+    fullnode_endpoint can be a list (or comma separated string) of URLs of the same chain,
+    all RPC calls go through FailoverProvider. FLAG bit 0x1 enables retries.
+    Keep-alive HTTP sessions are shared by all W3Helper of the same endpoints in a process.
+    """
     # At any point in time, the value denotes the nonce that will be used for next transaction.
     DEFAULT_GAS_PRICE = 9 * 10 ** 9  # 9 gwei
     DEFAULT_GAS = 22000
     FLAG = 0x1
 
-    def __init__(self, fullnode_endpoint):
-        self.web3 = Web3(Web3.HTTPProvider(fullnode_endpoint))
+    # pylint: disable=too-many-arguments
+    def __init__(self, fullnode_endpoint, cache_size=4096,
+                 confirmations=ChainCache.CONFIRMATIONS, retry_policy=None, pool_size=POOL_SIZE):
+        if retry_policy is None:
+            retry_policy = RetryPolicy(RetryPolicy.RETRIES if self.FLAG & 0x1 else 0)
+        self.provider = get_provider(fullnode_endpoint, retry_policy, pool_size)
+        self.session = self.provider.session
+        self.web3 = Web3(self.provider)
+        self._once = None
+        self.nonces = NonceManager(self.get_nonce_for_next_transaction_pending)
+        self.receipts = ReceiptTracker(self)
+        self.gas_prices = GasPriceCache(lambda: self.eth.gasPrice)
+        self.gas_estimates = GasEstimateCache(self.eth.estimateGas)
+        self.cache = ChainCache(cache_size, confirmations)
+
+    def cache_stats(self):
+        '''Hit / miss counters of blocks, receipts and transactions cache'''
+        return self.cache.stats()
+
+    def reset_state(self):
+        '''Drop local nonces, caches and gas price, e.g. after the chain is reverted'''
+        self.nonces.reset()
+        self.cache.clear()
+        self.gas_prices.invalidate()
+        self.gas_estimates.invalidate()
+
+    def allocate_nonce(self, acc):
+        '''Get nonce for next transaction of account from local NonceManager'''
+        return self.nonces.allocate(acc)
+
+    def batch(self, max_batch_size=BatchRequest.MAX_BATCH_SIZE):
+        '''Create a JSON-RPC batch request, see BatchRequest'''
+        return BatchRequest(self.provider, max_batch_size)
 
     def call_api(self, method, *args):
         '''Call RPC api'''
-        try:
-            return self.web3.manager.request_blocking(method, list(args))
-        except RConnectionError:
-            if self.FLAG & 0x1:
-                time.sleep(1)
-                return self.web3.manager.request_blocking(method, list(args))
-            else:
-                raise
+        return self.web3.manager.request_blocking(method, list(args))
 
-    def eth_call(self, transaction):
+    def eth_call(self, transaction, block_identifier='latest'):
         '''Call eth_call'''
-        try:
-            return self.eth.call(transaction)
-        except RConnectionError:
-            if self.FLAG & 0x1:
-                time.sleep(1)
-                return self.eth.call(transaction)
-            else:
-                raise
+        return self.eth.call(transaction, block_identifier)
+
+    def get_logs(self, event_filter, retry=True):
+        '''
+        Call eth_getLogs. Without retry the query is sent once to each endpoint, so a
+        query timing out for its block range fails fast with RPCTransportError.
+        '''
+        if retry:
+            return self.eth.getLogs(event_filter)
+        if self._once is None:
+            self._once = Web3(self.provider.with_retry_policy(RetryPolicy(0)))
+        return self._once.eth.getLogs(event_filter)
+
+    def gas_price(self, block_number=None):
+        '''
+        Gas price for new transactions, cached for GasPriceCache.TTL and per block.
+        Without block_number the head polled by the receipt tracker is used, so transactions
+        sent while others are in flight get a new price on each block without an extra
+        request. When nothing is tracked only the TTL applies.
+        '''
+        if block_number is None:
+            block_number = self.receipts.last_block
+        return self.gas_prices.get(block_number)
+
+    def estimate_gas(self, transaction):
+        '''Gas limit for transaction, cached per call shape, see GasEstimateCache'''
+        return self.gas_estimates.estimate(transaction)
 
     def get_balance(self, acc, block_identifier='latest'):
         """ Get current balance for given account """
-        balance = 0
-        try:
-            balance = self.eth.getBalance(acc, block_identifier)
-        except RConnectionError:
-            if self.FLAG & 0x1:
-                time.sleep(1)
-                balance = self.eth.getBalance(acc, block_identifier)
-            else:
-                raise
+        balance = self.eth.getBalance(acc, block_identifier)
         LOG.debug('Balance of %s = %s', acc, balance)
         return balance
 
     def _create_account(self):
-        account = None
-        try:
-            account = self.eth.account.create()
-        except RConnectionError:
-            if self.FLAG & 0x1:
-                time.sleep(1)
-                account = self.eth.account.create()
-            else:
-                raise
+        account = self.eth.account.create()
         LOG.debug('Newly created test account %s, private key %s',
                   account.address, account.privateKey.hex())
         return account
@@ -84,18 +127,20 @@ class W3Helper:
             "to": dest_acc,
             "data": data,
             "from": addr,
-            "gasPrice": self.eth.gasPrice
+            "gasPrice": self.gas_price()
         }
         LOG.debug(tx)
         try:
-            gas = self.eth.estimateGas(tx)
-            tx["gas"] = gas
-            tx['nonce'] = self.get_nonce_for_next_transaction(addr)
+            cached_gas = self.gas_estimates.get(tx)
+            tx["gas"] = cached_gas or self.estimate_gas(tx)
+            tx['nonce'] = self.allocate_nonce(addr)
 
-            return self.execute_and_wait_for_transaction(private_key, tx)
+            receipt = self.execute_and_wait_for_transaction(private_key, tx)
         except Exception:
-            pass
-        return None
+            return None
+        # Raises if the transaction failed with a cached estimate
+        self.gas_estimates.check_receipt(tx, receipt, cached=cached_gas is not None)
+        return receipt
 
     def build_simple_transaction(self, nonce, dest_acc, value, gas_price=0, gas=DEFAULT_GAS):
         """ Builds a simple transaction with specific info """
@@ -114,24 +159,20 @@ class W3Helper:
                                          gas_price=0, gas=DEFAULT_GAS):
         """ Builds a simple transaction which sends 'value' amount to given destination account """
         gas_price = self.DEFAULT_GAS_PRICE if gas_price == 0 else gas_price
-        txn = self.build_simple_transaction(self.get_nonce_for_next_transaction(src_acc),
+        txn = self.build_simple_transaction(self.allocate_nonce(src_acc),
                                             dest_acc, value, gas_price, gas)
         return txn
 
     def build_value_transfer_transactions(self, src_acc, dest_acc, value,
                                           num=2, gas_price=0, gas=DEFAULT_GAS):
         """ Builds a simple transaction which sends 'value' amount to given destination account
-            Since get_nonce_for_next_transaction() uses last *executed* txn nonce to get next nonce,
-            it doesn't work when building multiple transactions, so we assign nonce value manually.
+            Nonces of all transactions are allocated at once from the local NonceManager.
         """
         gas_price = self.DEFAULT_GAS_PRICE if gas_price == 0 else gas_price
         transactions = []
-        nonce = self.get_nonce_for_next_transaction(src_acc)
-        for _ in range(num):
+        for nonce in self.nonces.allocate_many(src_acc, num):
             transactions.append(
-                self.build_value_transfer_transaction(src_acc, dest_acc, value, gas_price, gas))
-            transactions[-1]['nonce'] = nonce
-            nonce += 1
+                self.build_simple_transaction(nonce, dest_acc, value, gas_price, gas))
         LOG.info("Built %s transactions. First txn nonce:%s Last txn nonce:%s", num,
                  transactions[0]['nonce'], transactions[-1]['nonce'])
         return transactions
@@ -150,7 +191,7 @@ class W3Helper:
         # TODO can delete this when THUNDER-539 is done
         contract_tx['gasPrice'] = self.DEFAULT_GAS_PRICE
 
-        contract_tx['nonce'] = self.get_nonce_for_next_transaction(src_acc)
+        contract_tx['nonce'] = self.allocate_nonce(src_acc)
         return contract_tx
 
     def sign_transaction(self, src_private_key, transaction):
@@ -159,14 +200,7 @@ class W3Helper:
         Returns signed transaction.
         :returns: transaction hash
         """
-        try:
-            return self.eth.account.signTransaction(transaction, src_private_key)
-        except RConnectionError:
-            if self.FLAG & 0x1:
-                time.sleep(1)
-                return self.eth.account.signTransaction(transaction, src_private_key)
-            else:
-                raise
+        return self.eth.account.signTransaction(transaction, src_private_key)
 
     def send_raw_transaction(self, raw_transaction):
         """
@@ -174,23 +208,47 @@ class W3Helper:
         Returns transaction hash.
         :returns: transaction hash
         """
-        try:
-            return self.eth.sendRawTransaction(raw_transaction)
-        except RConnectionError:
-            if self.FLAG & 0x1:
-                time.sleep(1)
-                return self.eth.sendRawTransaction(raw_transaction)
-            else:
-                raise
+        return self.eth.sendRawTransaction(raw_transaction)
 
     def execute_transaction(self, src_private_key, transaction):
         """
         Sends the transaction without waiting for it to complete.
+        On "nonce too low" error (the provider already checked that no node has the signed
+        transaction, see FailoverProvider.make_request), nonce is reconciled with the node
+        and the transaction is signed again with a new nonce. If signing fails or the node
+        rejects the transaction, the nonce is released so it does not leave a gap. On
+        transport errors the transaction may have reached the node, so the nonce stays
+        allocated and is reconciled with the node.
         Returns transaction hash.
         :returns: transaction hash
         """
-        signed_txn = self.sign_transaction(src_private_key, transaction)
-        tx_hash = self.send_raw_transaction(signed_txn.rawTransaction)
+        addr = self.eth.account.privateKeyToAccount(src_private_key).address
+        signed_txn = None
+        try:
+            signed_txn = self.sign_transaction(src_private_key, transaction)
+            try:
+                tx_hash = self.send_raw_transaction(signed_txn.rawTransaction)
+            except ValueError as err:
+                if not is_nonce_too_low(err):
+                    raise
+                self.nonces.reconcile(addr)
+                transaction = dict(transaction, nonce=self.allocate_nonce(addr))
+                LOG.info("Nonce too low for %s, resend with nonce %s", addr,
+                         transaction['nonce'])
+                signed_txn = self.sign_transaction(src_private_key, transaction)
+                tx_hash = self.send_raw_transaction(signed_txn.rawTransaction)
+        except Exception as err:
+            if signed_txn is None or isinstance(err, ValueError):
+                # Not signed, or rejected by the node (JSON-RPC error)
+                self.nonces.release(addr, transaction['nonce'])
+            else:
+                LOG.warning("Sending nonce %s of %s failed: %r, keep it allocated",
+                            transaction['nonce'], addr, err)
+                try:
+                    self.nonces.reconcile(addr)
+                except Exception:  # pylint: disable=broad-except
+                    LOG.warning("Failed to reconcile nonce of %s", addr, exc_info=True)
+            raise
         now = datetime.datetime.now()
         LOG.debug("Execute transaction hash = %s on %s", hexlify(tx_hash), str(now))
         return tx_hash, now
@@ -207,6 +265,15 @@ class W3Helper:
             tx_hash_list.append(self.execute_transaction(src_private_key, txn))
         return tx_hash_list
 
+    def bulk_sender(self, processes=None, chunk_size=BulkSender.CHUNK_SIZE):
+        """
+        BulkSender of this chain, which signs with processes workers (one per core by
+        default) and sends with batch requests. For thousands of transactions of one account:
+            with w3h.bulk_sender() as sender:
+                tx_hashes = sender.send_all(private_key, transactions)
+        """
+        return BulkSender(self, processes, chunk_size)
+
     def execute_and_wait_for_transaction(self, src_private_key, transaction, timeout=60):
         """
         Sends the transaction and waits for it to complete.
@@ -226,25 +293,54 @@ class W3Helper:
             LOG.info("Contract address=%s", receipt['contractAddress'])
         return receipt
 
-    def execute_and_wait_for_transactions(self, src_private_key, transactions):
+    def execute_and_wait_for_transactions(self, src_private_key, transactions, timeout=60):
         """ Sends the transactions and waits for them to complete.
+        Receipts are tracked from the first send, so waiting ends about one block after
+        the last transaction is included.
         :returns: List of receipts, one for each transaction in-order.
         """
-        tx_hash_list_pending = self.execute_transactions(src_private_key, transactions)
-        tx_hash_list, _ = zip(*tx_hash_list_pending)
-        receipts = self.wait_for_transactions(tx_hash_list)
-        return receipts
+        tx_hash_list = []
+        for txn in transactions:
+            tx_hash, _ = self.execute_transaction(src_private_key, txn)
+            self.receipts.track(tx_hash)
+            tx_hash_list.append(tx_hash)
+        return self.wait_for_transactions(tx_hash_list, timeout)
 
     def get_transaction(self, tx_hash):
-        '''Get TX'''
-        try:
-            return self.eth.getTransaction(tx_hash)
-        except RConnectionError:
-            if self.FLAG & 0x1:
-                time.sleep(1)
-                return self.eth.getTransaction(tx_hash)
-            else:
-                raise
+        '''Get TX, mined transactions are cached'''
+        transaction = self.cache.get_transaction(tx_hash)
+        if transaction is not None:
+            return transaction
+        transaction = self.eth.getTransaction(tx_hash)
+        self.cache.put_transaction(transaction)
+        return transaction
+
+    def _get_many(self, keys, get_cached, put, add_call):
+        results = [get_cached(key) for key in keys]
+        missing = [idx for idx, result in enumerate(results) if result is None]
+        if missing:
+            batch = self.batch()
+            for idx in missing:
+                add_call(batch, keys[idx])
+            for idx, result in zip(missing, batch.execute()):
+                put(result)
+                results[idx] = result
+        return results
+
+    def get_transactions(self, tx_hashes):
+        '''Get many TXs, cache misses are fetched with batch requests'''
+        return self._get_many(list(tx_hashes), self.cache.get_transaction,
+                              self.cache.put_transaction, BatchRequest.get_transaction)
+
+    def get_receipts(self, tx_hashes):
+        '''Get many receipts, cache misses are fetched with batch requests'''
+        return self._get_many(list(tx_hashes), self.cache.get_receipt, self.cache.put_receipt,
+                              BatchRequest.get_receipt_for_transaction)
+
+    def get_blocks(self, block_ids):
+        '''Get many blocks, cache misses are fetched with batch requests'''
+        return self._get_many(list(block_ids), self.cache.get_block, self.cache.put_block,
+                              BatchRequest.get_block)
 
     def wait_receipt_for_transaction(self, tx_hash, timeout=60):
         """
@@ -253,39 +349,20 @@ class W3Helper:
         Else throws error.
         :returns: transaction receipt
         """
-        receipt = None
-        try:
-            receipt = self.eth.waitForTransactionReceipt(tx_hash, timeout)
-        except RConnectionError:
-            if self.FLAG & 0x1:
-                time.sleep(1)
-                receipt = self.eth.waitForTransactionReceipt(tx_hash, timeout)
-            else:
-                raise
-        if receipt is None:
-            raise TimeoutError("Transaction %s timed out" % hexlify(tx_hash))
+        receipt = self.wait_for_transactions([tx_hash], timeout)[0]
         LOG.debug("Receipt: %s", receipt)
-        #wait for receipt is complete
-        while not receipt['blockNumber'] and timeout > 0:
-            time.sleep(2)
-            timeout -= 1
-            receipt = self.eth.waitForTransactionReceipt(tx_hash, timeout)
         return receipt
 
     def get_receipt_for_transaction(self, tx_hash):
         """
-        Get transaction receipt from hash
+        Get transaction receipt from hash, receipts of mined transactions are cached
         :returns: transaction receipt
         """
-        receipt = None
-        try:
-            receipt = self.eth.getTransactionReceipt(tx_hash)
-        except RConnectionError:
-            if self.FLAG & 0x1:
-                time.sleep(1)
-                receipt = self.eth.getTransactionReceipt(tx_hash)
-            else:
-                raise
+        receipt = self.cache.get_receipt(tx_hash)
+        if receipt is not None:
+            return receipt
+        receipt = self.eth.getTransactionReceipt(tx_hash)
+        self.cache.put_receipt(receipt)
         return receipt
 
     def get_nonce_for_next_transaction(self, acc, block_identifier='latest'):
@@ -294,15 +371,7 @@ class W3Helper:
         so far, the nonce value it should use for its next transaction is 3.
         :returns: integer = nonce value to be used for the next transaction
         """
-        num_sent_txs = 0
-        try:
-            num_sent_txs = self.eth.getTransactionCount(acc, block_identifier)
-        except RConnectionError:
-            if self.FLAG & 0x1:
-                time.sleep(1)
-                num_sent_txs = self.eth.getTransactionCount(acc, block_identifier)
-            else:
-                raise
+        num_sent_txs = self.eth.getTransactionCount(acc, block_identifier)
         LOG.debug("For account: %s, next transaction's nonce should be: %s",
                   acc, num_sent_txs)
         return num_sent_txs
@@ -315,13 +384,14 @@ class W3Helper:
         """
         return self.get_nonce_for_next_transaction(acc, 'pending')
 
-    def wait_for_transactions(self, tx_hash_list):
-        """ Waits for all transactions in tx_hash_list to finish.
+    def wait_for_transactions(self, tx_hash_list, timeout=60):
+        """ Waits for all transactions in tx_hash_list to finish. Receipts of all transactions
+            are polled together by the ReceiptTracker once per block.
             :returns: List of receipts, one for each transaction in-order.
         """
-        receipts = []
-        for tx_hash in tx_hash_list:
-            receipts.append(self.wait_receipt_for_transaction(tx_hash))
+        receipts = self.receipts.wait(tx_hash_list, timeout)
+        for receipt in receipts:
+            self.cache.put_receipt(receipt)
         return receipts
 
     def get_block_for_transaction_receipt(self, receipt):
@@ -329,7 +399,7 @@ class W3Helper:
         :returns: block object
         """
         block_num = receipt['blockNumber']
-        block = self.get_block(block_num)
+        block = self.get_block(receipt['blockHash'], debug=False)
         LOG.info("For transactionHash=%s blockNumber=%s transactionIndex=%s from=%s to=%s:",
                  hexlify(receipt['transactionHash']), block_num, receipt['transactionIndex'],
                  receipt['from'], receipt['to'])
@@ -340,21 +410,24 @@ class W3Helper:
         """ Gets the block information.
         :param block_id Can be block number, block hash or one of predefined params. See web3 doc
                   for this function. If no block id is provided, get the latest block.
+                  Blocks by hash, and by number past the confirmation depth, are cached.
         :returns: block object
         """
-        block = None
-        try:
+        block = self.cache.get_block(block_id)
+        if block is None:
             block = self.eth.getBlock(block_id)
-        except RConnectionError:
-            if self.FLAG & 0x1:
-                time.sleep(1)
-                block = self.eth.getBlock(block_id)
-            else:
-                raise
+            self.cache.put_block(block)
         if debug:
             self.debug_log_block_info(block)
         return block
 
+    def block_recorder(self, capacity=BlockHistory.CAPACITY,
+                       poll_interval=BlockRecorder.POLL_INTERVAL):
+        """ BlockRecorder of this chain, see blocks.py. Use as context manager to record in a
+        background thread.
+        """
+        return BlockRecorder(self, capacity, poll_interval)
+
     def create_block_history(self, block_history, stop_event):
         """ Start logging block information till it is stopped."""
         block_previous = self.get_block()
@@ -366,17 +439,31 @@ class W3Helper:
                 block_previous = block
             stop_event.wait(0.01)
 
+    def record_block_history(self, stop_event, capacity=BlockHistory.CAPACITY,
+                             poll_interval=BlockRecorder.POLL_INTERVAL):
+        """ Record blocks till stop_event is set, see block_recorder() to record in background.
+        :returns: BlockHistory of the recorded blocks
+        """
+        recorder = self.block_recorder(capacity, poll_interval)
+        recorder.run(stop_event)
+        return recorder.history
+
     def verify_stats(self, receipts, src_acc, src_init_balance, dest_acc, dest_init_balance):
         """ Iterate over receipts and verify that final balances for source and destination
         accounts tally up.
-        Populates the block_to_gas_used_map with gas used by these
+        Transactions (unless cached) and final balances are fetched with batch requests.
         """
+        transactions = self.get_transactions(receipt['transactionHash'] for receipt in receipts)
+        batch = self.batch()
+        batch.get_balance(dest_acc)
+        batch.get_balance(src_acc)
+        dest_balance, src_balance = batch.execute()
+
         count = 1
         src_end_balance = src_init_balance
         dest_end_balance = dest_init_balance
-        for receipt in receipts:
+        for receipt, transaction in zip(receipts, transactions):
             tx_hash = receipt['transactionHash']
-            transaction = self.get_transaction(tx_hash)
             block_number = receipt['blockNumber']
 
             # Calculate txn_fee, and final balances for src and dest account.
@@ -389,25 +476,36 @@ class W3Helper:
                       count, hexlify(tx_hash), block_number, src_end_balance, dest_end_balance)
             count += 1
 
-        assert dest_end_balance == self.get_balance(dest_acc)
-        assert src_end_balance == self.get_balance(src_acc)
+        assert dest_end_balance == dest_balance
+        assert src_end_balance == src_balance
 
     def verify_block_gas_used(self, receipts):
-        """ Assert that gas used by txns matches cumulative gas used in the blocks. """
+        """ Assert that gas used by txns matches cumulative gas used in the blocks.
+        Blocks and receipts of all their transactions are read from cache or fetched with batch
+        requests.
+        """
         block_to_gas_used_map = dict()
+        tracked_tx_hashes = set()
         for receipt in receipts:
             block_hash = receipt['blockHash']
             if block_hash not in block_to_gas_used_map:
                 block_to_gas_used_map[block_hash] = 0
             block_to_gas_used_map[block_hash] += receipt['gasUsed']
-        for block_hash, _ in block_to_gas_used_map.items():
+            tracked_tx_hashes.add(bytes(receipt['transactionHash']))
+
+        for receipt in receipts:
+            self.cache.put_receipt(receipt)
+        blocks = self.get_blocks(block_to_gas_used_map)
+        block_receipts = iter(self.get_receipts(
+            tx_hash for block in blocks for tx_hash in block['transactions']))
+
+        for block_hash, block in zip(block_to_gas_used_map, blocks):
             gas_block = 0
             untracked_receipt_gas = 0
-            block = self.get_block(block_hash)
-            for tx_hash in block['transactions']:
-                receipt = self.wait_receipt_for_transaction(tx_hash, 10)
+            for _ in block['transactions']:
+                receipt = next(block_receipts)
                 gas_block += receipt['gasUsed']
-                if receipt not in receipts:
+                if bytes(receipt['transactionHash']) not in tracked_tx_hashes:
                     untracked_receipt_gas += receipt['gasUsed']
             assert block['gasUsed'] == gas_block
             assert block['gasUsed'] == block_to_gas_used_map[block_hash] + untracked_receipt_gas
@@ -462,114 +560,265 @@ class W3Helper:
         return None
 
 
+def split_types(typestr):
+    '''Split comma separated ABI types, commas inside tuple types are kept'''
+    types = []
+    depth = 0
+    start = 0
+    for idx, char in enumerate(typestr):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            types.append(typestr[start:idx].strip())
+            start = idx + 1
+    if typestr[start:].strip():
+        types.append(typestr[start:].strip())
+    return types
+
+
+def _params_end(signature):
+    '''Index of the parenthesis closing param list of signature'''
+    depth = 0
+    for idx in range(signature.find("("), len(signature)):
+        if signature[idx] == '(':
+            depth += 1
+        elif signature[idx] == ')':
+            depth -= 1
+            if depth == 0:
+                return idx
+    raise ValueError("Invalid signature %s" % signature)
+
+
+class FunctionSpec:
+    '''Precompiled contract method: selector, param types and return type'''
+    __slots__ = ('name', 'signature', 'selector', 'param_types', 'ret_type', 'need_data',
+                 'events', 'registry')
+
+    def __init__(self, attr, need_data=False, events=()):
+        attr = attr.replace(' ', '')
+        idx = _params_end(attr)
+        self.signature = attr[:idx+1]
+        self.ret_type = attr[idx+1:] or None
+        self.name = attr[:attr.find("(")]
+        self.selector = '0x%s' % hexlify(eth_utils.keccak(self.signature.encode()))[:8].decode()
+        self.param_types = tuple(split_types(self.signature[len(self.name)+1:-1]))
+        self.need_data = need_data
+        if isinstance(events, str):
+            events = [events]
+        self.events = tuple(compile_event(event) for event in events)
+        self.registry = EventRegistry(self.events)
+
+    def encode(self, args):
+        '''Encode call data'''
+        if not self.param_types:
+            return self.selector
+        return "%s%s" % (self.selector,
+                         hexlify(eth_abi.encode_abi(self.param_types, list(args))).decode())
+
+
+class EventSpec:
+    '''Precompiled contract event: topic hash, param types and indexed-param mask'''
+    __slots__ = ('name', 'signature', 'event_type', 'topic', 'topic_hex', 'param_types',
+                 'indexed', 'data_types')
+
+    def __init__(self, event):
+        lidx = event.find('(')
+        ridx = event.find(')')
+        self.signature = event
+        self.name = event[:lidx]
+        self.event_type = event[:ridx+1].replace("i:", "")
+        self.topic = eth_utils.keccak(self.event_type.encode())
+        self.topic_hex = '0x%s' % hexlify(self.topic).decode()
+        params = event[lidx+1:ridx].split(',') if event[lidx+1:ridx] else []
+        self.indexed = tuple(param.startswith("i:") for param in params)
+        self.param_types = tuple(param[2:] if param.startswith("i:") else param
+                                 for param in params)
+        self.data_types = tuple(typ for typ, indexed in zip(self.param_types, self.indexed)
+                                if not indexed)
+
+    def match(self, log):
+        '''Whether log is emitted by this event'''
+        topics = log['topics']
+        return bool(topics) and bytes(topics[0]) == self.topic
+
+    def decode_values(self, log):
+        '''Decode param values of log, in the order of event params'''
+        topics = iter(log['topics'][1:])
+        data_values = iter(())
+        if self.data_types:
+            data = log['data']
+            if isinstance(data, str):
+                data = unhexlify(data[2:])
+            data_values = iter(eth_abi.decode_abi(self.data_types, bytes(data)))
+        values = []
+        for typ, indexed in zip(self.param_types, self.indexed):
+            if indexed:
+                values.append(eth_abi.decode_single(typ, bytes(next(topics))))
+            else:
+                values.append(next(data_values))
+        return values
+
+    def decode_event(self, log):
+        '''Decode log as DecodedEvent'''
+        return DecodedEvent(self.name, self.event_type, tuple(self.decode_values(log)),
+                            log.get('address'), log.get('blockNumber'),
+                            log.get('transactionHash'), log.get('logIndex'))
+
+    def decode(self, log):
+        '''Decode log as "Name(value, ...)" string, None if log is not emitted by this event'''
+        if not self.match(log):
+            return None
+        return self.format(log)
+
+    def format(self, log):
+        '''Format log of this event as "Name(value, ...)" string'''
+        if not self.param_types:
+            return self.event_type
+        str_values = []
+        for value in self.decode_values(log):
+            if isinstance(value, bytes):
+                str_values.append('0x{}'.format(hexlify(value).decode()))
+            else:
+                str_values.append(str(value))
+        return '{}({})'.format(self.name, ', '.join(str_values))
+
+
+@functools.lru_cache(maxsize=None)
+def compile_function(signature):
+    '''Compile "name(types)ret_type" method signature, cached'''
+    return FunctionSpec(signature)
+
+
+@functools.lru_cache(maxsize=None)
+def compile_event(event):
+    '''Compile "Name(i:type,type)" event signature, cached'''
+    return EventSpec(event)
+
+
+class EventRegistry:
+    '''
+    Event decoders keyed by (topics[0], number of topics), so each log is dispatched
+    straight to the decoder of its event.
+    '''
+
+    def __init__(self, events=()):
+        self.decoders = {}
+        for event in events:
+            self.add(event)
+
+    def __len__(self):
+        return len(self.decoders)
+
+    def add(self, event):
+        '''Register event signature string or EventSpec'''
+        spec = compile_event(event) if isinstance(event, str) else event
+        self.decoders[(spec.topic, 1 + sum(spec.indexed))] = spec
+        return spec
+
+    def lookup(self, log):
+        '''EventSpec of log, None if the event is not registered'''
+        topics = log['topics']
+        if not topics:
+            return None
+        return self.decoders.get((bytes(topics[0]), len(topics)))
+
+    def _decode(self, logs, decode):
+        ret = []
+        for log in logs:
+            spec = self.lookup(log)
+            if spec is None:
+                continue
+            try:
+                ret.append(decode(spec, log))
+            except DecodingError:
+                LOG.warning("Failed to decode log %s as %s", log, spec.signature)
+        return ret
+
+    def decode_logs(self, logs):
+        '''Decode registered events in logs as "Name(value, ...)" strings'''
+        return self._decode(logs, EventSpec.format)
+
+    def decode_many(self, logs):
+        '''Decode registered events in logs as DecodedEvent records'''
+        return self._decode(logs, EventSpec.decode_event)
+
+
+def compile_attr(attr):
+    '''
+    Compile one entry of SmartContract.ATTRS:
+    "event:Name(...)", "name(types)ret_type" or ("name(types)", need_data, [events])
+    '''
+    if isinstance(attr, str) and attr.startswith('event:'):
+        return compile_event(attr[6:])
+    if isinstance(attr, tuple):
+        return FunctionSpec(*attr)
+    return compile_function(attr)
+
+
 class Funcall:
     '''Smart Contract Function Call'''
+    __slots__ = ('contract', 'spec')
 
     @staticmethod
     def encode_funcall(func_type, *args):
         '''Encode for contract method call'''
-        func_type = func_type.replace(' ', '')
-        signature = hexlify(eth_utils.keccak(func_type.encode()))[:8].decode()
-        params = []
-        values = list(args)
-        idx = func_type.find("(")
-        parmstr = func_type[idx+1:-1]
-        data = ''
-        if parmstr:
-            for parm in func_type[idx+1:-1].split(","):
-                params.append(parm.strip())
-            data = hexlify(eth_abi.encode_abi(params, values)).decode()
-        return "0x%s%s" % (signature, data)
+        return compile_function(func_type).encode(args)
+
+    @staticmethod
+    def event_topic(event):
+        '''Topic hash of event, "i:" marks of indexed params are removed'''
+        return compile_event(event).topic_hex
 
     @staticmethod
     def decode_log(event, log):
         '''Decode log'''
-        lidx = event.find('(')
-        ridx = event.find(')')
-        event_name = event[:lidx]
-        event_type = event[:ridx+1].replace("i:", "")
-        event_params = event[lidx+1:ridx]
-        signature = '0x{}'.format(hexlify(eth_utils.keccak(event_type.encode())).decode())
-
-        if log['topics'][0].hex() == signature:
-            if event_params == '':
-                return event_type
-            else:
-                params = event_params.split(',')
-                parms = []
-                values = {}
-                j = 1
-                #pylint: disable=consider-using-enumerate
-                for i in range(len(params)):
-                    if params[i].startswith("i:"):
-                        values[i] = eth_abi.decode_single(params[i][2:], log['topics'][j])
-                        j += 1
-                    else:
-                        parms.append(params[i])
-                if parms:
-                    unindex_values = eth_abi.decode_abi(parms, unhexlify(log['data'][2:]))
-                    j = 0
-                    for i in range(len(params)):
-                        if i not in values:
-                            #pylint: disable=unsubscriptable-object
-                            values[i] = unindex_values[j]
-                            j += 1
-                    str_values = []
-                    for i in range(len(params)):
-                        if isinstance(values[i], bytes):
-                            str_values.append('0x{}'.format(hexlify(values[i]).decode()))
-                        else:
-                            str_values.append(str(values[i]))
-                return '{}({})'.format(event_name, ', '.join(str_values))
-        return None
+        return compile_event(event).decode(log)
 
     @staticmethod
     def decode_logs(events, logs):
         '''Decode logs in receipt'''
-        ret = []
-        for log in logs:
-            for event in events:
-                try:
-                    rret = Funcall.decode_log(event, log)
-                    if rret:
-                        ret.append(rret)
-                        continue
-                except Exception:
-                    pass
-        return ret
+        return EventRegistry(events).decode_logs(logs)
+
+    @staticmethod
+    def decode_many(events, logs):
+        '''Decode logs in receipt as DecodedEvent records'''
+        return EventRegistry(events).decode_many(logs)
 
     def __init__(self, contract, attr):
         self.contract = contract
-        self.is_event = False
-        if isinstance(attr, str) and attr.startswith('event:'):
-            self.is_event = True
-            self.signature = attr[6:]
-            return
-
-        self.ret_type = None
-        self.need_data = False
-        self.events = []
-        if isinstance(attr, tuple):
-            self.signature = attr[0]
-            self.need_data = attr[1]
-            if len(attr) == 3:
-                self.events = attr[2]
-        else:
-            self.signature = attr
-
-        idx = self.signature.find(")")
-        if idx > 0:
-            self.ret_type = self.signature[idx+1:]
-            self.signature = self.signature[:idx+1]
-
-    #pylint: disable=unsubscriptable-object
-    def __call__(self, *args, **kwargs):
-        if self.is_event:
-            def _func(_from, count=1, timeout=120):
-                return self.contract.get_logs(self.signature, _from, count=count, timeout=timeout)
-            _func.__event__ = self.signature
-            return _func
-
+        self.spec = attr if isinstance(attr, (FunctionSpec, EventSpec)) else compile_attr(attr)
+
+    @property
+    def is_event(self):
+        '''Whether this is an event of contract'''
+        return isinstance(self.spec, EventSpec)
+
+    @property
+    def signature(self):
+        '''Method signature without return type, or event signature'''
+        return self.spec.signature
+
+    @property
+    def ret_type(self):
+        '''Return type of readonly method, None for transaction'''
+        return self.spec.ret_type
+
+    @property
+    def need_data(self):
+        '''Whether the last argument is extra data appended to call data'''
+        return self.spec.need_data
+
+    @property
+    def events(self):
+        '''Events decoded from receipt of the transaction'''
+        return self.spec.events
+
+    def prepare(self, *args):
+        '''Split private key from args and encode call data
+        :returns: (private_key, data), private_key is None for readonly method
+        '''
         private_key = None
         extra_data = None
         if not self.ret_type:
@@ -579,49 +828,94 @@ class Funcall:
             extra_data = args[-1]
             args = args[:-1]
 
-        data = ''
-        if args:
-            data = Funcall.encode_funcall(self.signature, *args)
-        else:
-            data = Funcall.encode_funcall(self.signature)
+        data = self.spec.encode(args)
         if extra_data:
             data = "%s%s" % (data, extra_data[2:])
+        return private_key, data
+
+    #pylint: disable=unsubscriptable-object
+    def decode_return(self, ret_data):
+        '''Decode return data of readonly method'''
+        ret = eth_abi.decode_abi([self.ret_type], ret_data)[0]
+        LOG.debug("Call %s, return Data: %s", self.signature, ret)
+        if self.ret_type == "string":
+            return ret.decode()
+        return ret
+
+    def attach_events(self, receipt):
+        '''Receipt record with decoded events of this method'''
+        receipt = Receipt.from_dict(receipt)
+        if self.events:
+            receipt = receipt.with_events(self.spec.registry.decode_logs(receipt.logs))
+        return receipt
+
+    def __call__(self, *args, **kwargs):
+        if self.is_event:
+            def _func(_from, count=1, timeout=120):
+                return self.contract.get_logs(self.signature, _from, count=count, timeout=timeout)
+            _func.__event__ = self.signature
+            return _func
+
+        private_key, data = self.prepare(*args)
         if private_key:
-            receipt = self.contract.call(private_key, data, **kwargs)
-            receipt = dict(receipt)
-            if self.events:
-                receipt['events'] = Funcall.decode_logs(self.events, receipt['logs'])
-            return receipt
+            return self.attach_events(self.contract.call(private_key, data, **kwargs))
         else:
             try:
-                ret_data = self.contract.view(data, **kwargs)
-                ret = eth_abi.decode_abi([self.ret_type], ret_data)[0]
-                LOG.debug("Call %s, return Data: %s", self.signature, ret)
-                if self.ret_type == "string":
-                    return ret.decode()
-                return ret
+                return self.decode_return(self.contract.view(data, **kwargs))
             except Exception:
                 return None
 
 class SmartContract:
-    '''Contract Base'''
+    '''
+    Contract Base
+    Subclasses declare methods and events in ATTRS, which is compiled once per class
+    into a table of FunctionSpec / EventSpec, see descriptors().
+    '''
+    FUNCALL = Funcall
+    ATTRS = {}
+
     def __init__(self, w3h, contract_addr):
         self.w3h = w3h
         self.contract_addr = Web3.toChecksumAddress(contract_addr)
-        self.attrs = {}
-
-    def view(self, data):
-        '''Call readonly method ...'''
+        self._funcalls = {}
+
+    @classmethod
+    def descriptors(cls):
+        '''Table of compiled ATTRS, built once per contract class'''
+        table = cls.__dict__.get('_descriptors')
+        if table is None:
+            table = {name: compile_attr(attr) for name, attr in cls.ATTRS.items()}
+            cls._descriptors = table
+        return table
+
+    @classmethod
+    def event_registry(cls):
+        '''EventRegistry of all events in ATTRS, built once per contract class'''
+        registry = cls.__dict__.get('_event_registry')
+        if registry is None:
+            registry = EventRegistry()
+            for spec in cls.descriptors().values():
+                if isinstance(spec, EventSpec):
+                    registry.add(spec)
+                else:
+                    for event in spec.events:
+                        registry.add(event)
+            cls._event_registry = registry
+        return registry
+
+    @classmethod
+    def decode_many(cls, logs):
+        '''Decode logs of any event in ATTRS as DecodedEvent records'''
+        return cls.event_registry().decode_many(logs)
+
+    def view(self, data, block_identifier='latest'):
+        '''Call readonly method with a bare eth_call at block_identifier'''
         tx = {
-            "value": 0,
             "to": self.contract_addr,
             "data": data,
             "from": self.contract_addr,
-            "gasPrice": self.w3h.web3.eth.gasPrice
         }
-        gas = self.w3h.web3.eth.estimateGas(tx)
-        tx["gas"] = gas
-        return self.w3h.eth_call(tx)
+        return self.w3h.eth_call(tx, block_identifier)
 
     def call(self, private_key, _data, **kwargs):
         '''Execute TX'''
@@ -631,70 +925,43 @@ class SmartContract:
             "to": self.contract_addr,
             "data": _data,
             "from": addr,
-            "gasPrice": self.w3h.web3.eth.gasPrice
+            "gasPrice": self.w3h.gas_price()
         }
         LOG.debug(tx)
-        gas = self.w3h.web3.eth.estimateGas(tx)
-        tx["gas"] = gas
-        tx['nonce'] = self.w3h.get_nonce_for_next_transaction(addr)
+        cached_gas = self.w3h.gas_estimates.get(tx)
+        tx["gas"] = cached_gas or self.w3h.estimate_gas(tx)
+        tx['nonce'] = self.w3h.allocate_nonce(addr)
         timeout = kwargs.get("timeout", 60)
 
-        return self.w3h.execute_and_wait_for_transaction(private_key, tx, timeout=timeout)
+        receipt = self.w3h.execute_and_wait_for_transaction(private_key, tx, timeout=timeout)
+        self.w3h.gas_estimates.check_receipt(tx, receipt, cached=cached_gas is not None)
+        return receipt
 
     def __getattr__(self, name):
-        if name in self.attrs:
-            attr = self.attrs[name]
-            return Funcall(self, attr)
-        return None
+        funcalls = self.__dict__.setdefault('_funcalls', {})
+        funcall = funcalls.get(name)
+        if funcall is None:
+            spec = self.descriptors().get(name)
+            if spec is None:
+                return None
+            funcall = funcalls[name] = self.FUNCALL(self, spec)
+        return funcall
+
+    def scanner(self, events, checkpoint=None, **kwargs):
+        '''EventScanner of events emitted by this contract, see EventScanner for kwargs'''
+        return EventScanner(self.w3h, self.contract_addr, EventRegistry(events), checkpoint,
+                            **kwargs)
 
     def get_logs(self, event, _from, count=1, timeout=120):
         '''Filter log and decode'''
-        event_type = event.replace("i:", "")
-        curr_block = self.w3h.get_block()['number']
-        event_signature = '0x%s' % hexlify(eth_utils.keccak(event_type.encode())).decode()
-        event_filter = {
-            "address": self.contract_addr,
-            "topics": [event_signature],
-            "fromBlock": hex(_from),
-            "toBlock": hex(curr_block)
-        }
-        results = []
-        while len(results) < count and timeout > 0:
-            logs = self.w3h.eth.getLogs(event_filter)
-            for log in logs:
-                results.append((Funcall.decode_log(event, log), log))
-                if len(results) >= count:
-                    return results
-            time.sleep(5)
-            timeout -= 5
-            event_filter['fromBlock'] = hex(curr_block + 1)
-            curr_block = self.w3h.get_block()['number']
-            event_filter['toBlock'] = hex(curr_block)
-        return results
+        return self.watch([event], _from, count=count, timeout=timeout)
 
-    def watch(self, events, _from, timeout=120):
-        '''Filter log and decode'''
-        topics = []
-        for event in events:
-            event_type = event.replace("i:", "")
-            topics.append('0x%s' % hexlify(eth_utils.keccak(event_type.encode())).decode())
-        curr_block = self.w3h.get_block()['number']
-        event_filter = {
-            "address": self.contract_addr,
-            "topics": topics,
-            "fromBlock": hex(_from),
-            "toBlock": hex(curr_block)
-        }
+    def watch(self, events, _from, count=1, timeout=120):
+        '''Filter logs of any of events and decode, returns [(decoded, log), ...]'''
+        scanner = self.scanner(events)
         results = []
-        while not results and timeout > 0:
-            logs = self.w3h.eth.getLogs(event_filter)
-            for log in logs:
-                results.extend(Funcall.decode_logs(events, log), log)
-                if results:
-                    return results
-            time.sleep(5)
-            timeout -= 5
-            event_filter['fromBlock'] = hex(curr_block + 1)
-            curr_block = self.w3h.get_block()['number']
-            event_filter['toBlock'] = hex(curr_block)
-        return results
\ No newline at end of file
+        for log in scanner.follow_logs(_from, timeout):
+            results.append((scanner.registry.lookup(log).format(log), Log.from_dict(log)))
+            if len(results) >= count:
+                break
+        return results